@@ -1,29 +1,35 @@
-from functools import reduce
-from operator import iconcat
-from collections import Counter
-
 from childes_srl import configs
+from childes_srl.io import load_vocab
+from childes_srl.corpus_stats import count_file
 
 MODEL_NAME = 'childes-20191206'
+NUM_WORKERS = 4
+NUM_PREDICATES = 20  # number of most frequent predicates to print
 
-# load model-based annotations
-srl_path = configs.Dirs.data / 'pre_processed' / f'{MODEL_NAME}_no-dev_srl.txt'
-text = srl_path.read_text()
-lines = text.split('\n')[:-1]
-
-# get a list of all tags
-tag_lines = [line.split('|||')[1].split() for line in lines]
-tags = reduce(iconcat, tag_lines, [])  # flatten list of lists
-print(f'num tags={len(tags):>9,}')
 
-# remove "B-" and "I-"
-tags_no_bio = [tag.lstrip('B-').lstrip('I-') for tag in tags]
+if __name__ == '__main__':  # worker processes import this module
 
-# count
-t2f = Counter(tags_no_bio)
-for t, f in sorted(t2f.items(), key=lambda i: i[1]):
-    print(f'{t:<12} occurs {f:>9,} times')
+    # count model-based annotations - in parallel over shards of the file, or loaded from cache
+    srl_path = configs.Dirs.data / 'pre_processed' / f'{MODEL_NAME}_no-dev_srl.txt'
+    stats = count_file(srl_path, kind='srl', num_workers=NUM_WORKERS, cache_dir=configs.Dirs.cache / 'corpus_stats')
+    print(f'num propositions={stats.num_lines:>9,}')
+    print(f'num tags={stats.num_tokens:>9,}')
 
+    # role frequencies, without "B-" and "I-"
+    for t, f in sorted(stats.role2num_tokens.items(), key=lambda i: i[1]):
+        print(f'{t:<12} occurs {f:>9,} times in {stats.role2num_spans[t]:>9,} spans')
 
+    # lengths
+    print('Proposition lengths:')
+    for length, n in sorted(stats.length2num.items()):
+        print(f'{length:>3} {n:>9,}')
 
+    # predicates
+    print('Most frequent predicates:')
+    for predicate, n in stats.predicate2num.most_common(NUM_PREDICATES):
+        print(f'{predicate:<12} {n:>9,}')
 
+    # vocabulary coverage
+    vocab = set(load_vocab(configs.Dirs.data / 'vocabulary' / f'{MODEL_NAME}_vocab.txt'))
+    token_coverage, type_coverage = stats.get_vocab_coverage(vocab)
+    print(f'Vocabulary coverage: tokens={token_coverage:.4f} types={type_coverage:.4f}')
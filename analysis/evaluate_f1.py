@@ -36,113 +36,145 @@ How well does AllenNLP SRL tagger perform on CHILDES 2008 SRL data?
          overall f1= 0.88
 """
 
-from spacy.tokens import Doc
-from typing import Generator, List
+from typing import Generator, List, Tuple, Dict, Any, TYPE_CHECKING
 from pathlib import Path
-
-from allennlp.predictors.predictor import Predictor
-from allennlp.data.instance import Instance
+import time
 
 from childes_srl import configs
+from childes_srl.io import parse_srl_line
+from childes_srl.stubs import StubPredictor
+from childes_srl.tagging import tag_pretokenized, get_verb_indices
+from childes_srl.devices import configure_torch
 from bert_recipes.eval import SrlEvalScorer, convert_bio_tags_to_conll_format
+from bert_recipes.bootstrap import bootstrap_confidence_intervals, print_confidence_intervals
+
+if TYPE_CHECKING:  # AllenNLP is only needed when the stand-in predictor is not used
+    from allennlp.data.instance import Instance
 
 CORPUS_NAME = 'human-based-2008'
-INTERACTIVE = False
+VERBOSE = False  # print predicted and gold tags for each proposition
 BATCH_SIZE = 128
-
-
-def gen_instances_from_gold(verb_index: int,
+TAGGING_BATCH_SIZE = 1000  # number of sentences POS-tagged together by spaCy
+NUM_TAGGING_WORKERS = 1
+USE_STUB_PREDICTOR = False  # use a local stand-in for the AllenNLP model, e.g. to benchmark this script
+STUB_SECONDS_PER_TOKEN = 0.0001  # time the stand-in needs per (padded) token
+NUM_RESAMPLES = 10_000  # for bootstrap confidence intervals
+USE_GPU = None  # None: use GPU if available. set to False to run on CPU
+NUM_INTRA_OP_THREADS = 0  # 0: framework default (all cores)
+NUM_INTER_OP_THREADS = 0
+
+
+def gen_instances_from_gold(spacy_doc,
+                            verb_index: int,
                             words: List[str],
                             gold_tags: List[str],
-                            ) -> Generator[Instance, None, None]:
-    # POS-tagging
-    spacy_doc = Doc(predictor._tokenizer.spacy.vocab, words=words)
-    for pipe in filter(None, predictor._tokenizer.spacy.pipeline):
-        pipe[1](spacy_doc)  # this does POS tagging
-
+                            ) -> Generator[Tuple['Instance', Dict[str, Any]], None, None]:
     # to instances - one for each verb in utterance
     tokens = [token for token in spacy_doc]
-    for i, word in enumerate(tokens):
-        if word.pos_ == "VERB":
+    for i in get_verb_indices(spacy_doc):
 
-            if i != verb_index:  # only evaluate predictions for propositions with same verb index
-                continue
+        if i != verb_index:  # only evaluate predictions for propositions with same verb index
+            continue
 
-            # instance
-            verb_labels = [0 for _ in words]
-            verb_labels[i] = 1
-            instance = predictor._dataset_reader.text_to_instance(tokens, verb_labels)
+        # instance
+        verb_labels = [0 for _ in words]
+        verb_labels[i] = 1
+        instance = predictor._dataset_reader.text_to_instance(tokens, verb_labels)
 
-            # meta data
-            metadata = dict()
-            metadata['in'] = words
-            metadata['verb_index'] = i
-            metadata['gold_tags'] = gold_tags
+        # meta data
+        metadata = dict()
+        metadata['in'] = words
+        metadata['verb_index'] = i
+        metadata['gold_tags'] = gold_tags
 
-            yield instance, metadata
+        yield instance, metadata
 
 
-def gen_instances(file_path: Path) -> Generator[Instance, None, None]:
+def gen_instances(file_path: Path) -> Generator[Tuple['Instance', Dict[str, Any]], None, None]:
     with file_path.open('r') as f:
-        for line in f.readlines():
-            inputs = line.strip().split('|||')
-            left_input = inputs[0].strip().split()
-            right_input = inputs[1].strip().split()
-            verb_index = int(left_input[0])
-            words = left_input[1:]
-            gold_tags = right_input
-
-            instances = gen_instances_from_gold(verb_index, words, gold_tags)
-            # in case no verbs are found
-            if not instances:
-                continue
-            else:
-                yield from instances
-
-
-# srl tagger
-predictor = Predictor.from_path("https://s3-us-west-2.amazonaws.com/allennlp/models/bert-base-srl-2019.06.17.tar.gz",
-                                cuda_device=0)
+        propositions = [parse_srl_line(line) for line in f.readlines()]
 
-# scorer
-srl_eval_path = configs.Dirs.root / 'perl' / 'srl-eval.pl'
-scorer = SrlEvalScorer(srl_eval_path, ignore_classes=['V'])
+    # POS-tagging, in batches
+    docs = tag_pretokenized(predictor._tokenizer.spacy,
+                            [words for words, _, _ in propositions],
+                            batch_size=TAGGING_BATCH_SIZE,
+                            num_workers=NUM_TAGGING_WORKERS)
 
+    for spacy_doc, (words, verb_index, gold_tags) in zip(docs, propositions):
+        # no instance is made in case no verbs are found
+        yield from gen_instances_from_gold(spacy_doc, verb_index, words, gold_tags)
 
-gold_path = configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl.txt'
-for n, (instance, md) in enumerate(gen_instances(gold_path)):
-
-    # get SRL predictions (decoding included)
-    output_dict = predictor._model.forward_on_instance(instance)
 
-    # metadata
-    batch_verb_indices = [md['verb_index']]
-    batch_sentences = [md['in']]
+def gen_batches(instances_and_metadata: List[Tuple['Instance', Dict[str, Any]]],
+                batch_size: int,
+                ) -> Generator[List[Tuple[int, 'Instance', Dict[str, Any]]], None, None]:
+    """
+    sort instances by length, so that instances in a batch need similar amounts of padding.
+    each instance is yielded with its original position, so that the original order can be restored.
+    """
+    ids = sorted(range(len(instances_and_metadata)), key=lambda i: len(instances_and_metadata[i][1]['in']))
+    for start in range(0, len(ids), batch_size):
+        yield [(i, *instances_and_metadata[i]) for i in ids[start: start + batch_size]]
 
-    # convert to conll
-    batch_conll_predicted_tags = [convert_bio_tags_to_conll_format(output_dict['tags'])]
-    batch_conll_gold_tags = [convert_bio_tags_to_conll_format(md['gold_tags'])]
 
-    # console
-    print(batch_sentences)
-    print(batch_conll_predicted_tags)
-    print(batch_conll_gold_tags)
+# srl tagger
+if USE_STUB_PREDICTOR:
+    predictor = StubPredictor(seconds_per_token=STUB_SECONDS_PER_TOKEN)
+else:
+    from allennlp.predictors.predictor import Predictor
+    cuda_device = configure_torch(USE_GPU, NUM_INTRA_OP_THREADS, NUM_INTER_OP_THREADS)
+    predictor = Predictor.from_path("https://s3-us-west-2.amazonaws.com/allennlp/models/bert-base-srl-2019.06.17.tar.gz",
+                                    cuda_device=cuda_device)
 
-    # update signal detection metrics
-    scorer(batch_verb_indices,
-           batch_sentences,
-           batch_conll_predicted_tags,
-           batch_conll_gold_tags)
+gold_path = configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl.txt'
+instances_and_metadata = list(gen_instances(gold_path))
+num_instances = len(instances_and_metadata)
+print(f'Made {num_instances:,} instances')
+
+# get SRL predictions (decoding included), in batches
+start_time = time.time()
+predicted_tags = [None] * num_instances
+for batch in gen_batches(instances_and_metadata, BATCH_SIZE):
+    output_dicts = predictor._model.forward_on_instances([instance for _, instance, _ in batch])
+    for output_dict, (i, _, md) in zip(output_dicts, batch):
+        predicted_tags[i] = output_dict['tags']
+
+        # console
+        if VERBOSE:
+            print(md['in'])
+            print(convert_bio_tags_to_conll_format(output_dict['tags']))
+            print(convert_bio_tags_to_conll_format(md['gold_tags']))
+            print()
+
+elapsed = time.time() - start_time
+print(f'Predicted tags for {num_instances:,} propositions in {elapsed:.2f} seconds '
+      f'({num_instances / elapsed:,.1f} propositions/second)')
+
+# convert to conll, in original order
+verb_indices = [md['verb_index'] for _, md in instances_and_metadata]
+sentences = [md['in'] for _, md in instances_and_metadata]
+conll_predicted_tags = [convert_bio_tags_to_conll_format(tags) for tags in predicted_tags]
+conll_gold_tags = [convert_bio_tags_to_conll_format(md['gold_tags']) for _, md in instances_and_metadata]
+
+# update signal detection metrics - all propositions are scored with a single call to srl-eval.pl
+srl_eval_path = configs.Dirs.root / 'perl' / 'srl-eval.pl'
+scorer = SrlEvalScorer(srl_eval_path, ignore_classes=['V'])
+scorer(verb_indices,
+       sentences,
+       conll_predicted_tags,
+       conll_gold_tags)
 
-    tag2metrics = scorer.get_tag2metrics(reset=False)
-    print(f'proposition={n:>6,} f1={tag2metrics["overall"]["f1"]:.4f}')
-    print()
+# bootstrap confidence intervals, from counts collected for each proposition
+tags, counts = scorer.get_proposition_counts()
+tag2ci = bootstrap_confidence_intervals(tags, counts, num_resamples=NUM_RESAMPLES)
 
 # compute f1 on accumulated signal detection metrics for each tag and reset
 tag2metrics = scorer.get_tag2metrics(reset=True)
 
 # print f1 summary by tag
 scorer.print_summary(tag2metrics)
+print_confidence_intervals(tag2ci)
 
 # save
-scorer.save_tag2metrics(Path(f'model_vs_{CORPUS_NAME}_f1.csv'), tag2metrics)
\ No newline at end of file
+scorer.save_tag2metrics(Path(f'model_vs_{CORPUS_NAME}_f1.csv'), tag2metrics)
+scorer.save_tag2metrics(Path(f'model_vs_{CORPUS_NAME}_f1_ci.csv'), tag2ci)
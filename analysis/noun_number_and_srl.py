@@ -4,7 +4,8 @@ Results are organized by semantic role.
 """
 from pathlib import Path
 
-from childes_srl.io import load_srl_data, load_mlm_data
+from childes_srl.encoding import EncodedCorpus
+from childes_srl import configs
 
 root = Path(__file__).parent.parent
 
@@ -14,33 +15,27 @@ nouns_plural = set((root / 'data' / 'word_lists' / 'nouns_plural.txt').open().re
 # ========================================================== SRL
 
 data_path_train_srl = root / 'data' / 'pre_processed' / f'childes-20191206_no-dev_srl.txt'
-propositions = load_srl_data(data_path_train_srl)
+corpus = EncodedCorpus.from_file(data_path_train_srl, kind='srl', cache_dir=configs.Dirs.cache / 'encoded')
 
-tag2number = {}
-for words, pred_id, tags in propositions:
-    for w, t in zip(words, tags):
-        if w in nouns_singular:
-            tag2number.setdefault(t, {'s': 0, 'p': 0})['s'] += 1
-        elif w in nouns_plural:
-            tag2number.setdefault(t, {'s': 0, 'p': 0})['p'] += 1
+# rows: singular, plural. columns: tags
+table = corpus.count_classes_by_tag([corpus.make_word_mask(nouns_singular),
+                                     corpus.make_word_mask(nouns_plural)])
 
-for tag, number in tag2number.items():
-    total = number['s'] + number['p']
-    print(f'{tag:<16} s={number["s"]/total:.2f} p={number["p"]/total:.2f}')
+for tag_id, tag in enumerate(corpus.tag_vocab):
+    num_s, num_p = table[:, tag_id]
+    total = num_s + num_p
+    if total == 0:
+        continue
+    print(f'{tag:<16} s={num_s/total:.2f} p={num_p/total:.2f}')
 
 # ========================================================== MLM
 
 data_path_mlm = root / 'data' / 'raw' / 'childes' / f'childes-20191206.txt'
-utterances = load_mlm_data(data_path_mlm)
+corpus = EncodedCorpus.from_file(data_path_mlm, kind='mlm', cache_dir=configs.Dirs.cache / 'encoded')
 
-num_s = 0
-num_p = 0
-for u in utterances:
-    for w in u:
-        if w in nouns_singular:
-            num_s += 1
-        elif w in nouns_plural:
-            num_p += 1
+table = corpus.count_classes_by_tag([corpus.make_word_mask(nouns_singular),
+                                     corpus.make_word_mask(nouns_plural)])
+num_s, num_p = table[:, 0]
 
 total = num_p + num_s
-print(f's={num_s/total:.2f} p={num_p/total:.2f}')
\ No newline at end of file
+print(f's={num_s/total:.2f} p={num_p/total:.2f}')
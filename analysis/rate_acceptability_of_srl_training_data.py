@@ -1,8 +1,8 @@
-import random
-import pandas as pd
+import hashlib
 import re
 
 from childes_srl.utils import make_srl_string
+from childes_srl.judgments import JudgmentStore
 from childes_srl import configs
 
 NAME = 'human-based-2018'
@@ -11,19 +11,22 @@ NAME = 'human-based-2018'
 # load annotations
 srl_path = configs.Dirs.data / 'pre_processed' / f'{NAME}_srl.txt'
 text = srl_path.read_text()
-lines = text.split('\n')
+lines = [line for line in text.split('\n') if line]
 
-# load previously checked annotations
-path = configs.Dirs.data_tools / f'{NAME}_srl_data_acceptability.csv'
-df = pd.read_csv(path, index_col=False)
+# load previously checked annotations - on first use, import them from csv
+csv_path = configs.Dirs.data_stats / f'{NAME}_srl_data_acceptability.csv'
+store_path = configs.Dirs.data_stats / f'{NAME}_srl_data_acceptability.sqlite'
+is_new = not store_path.exists()
+store = JudgmentStore(store_path)
+if is_new and csv_path.exists():
+    print(f'Imported {store.import_csv(csv_path):,} judgments from {csv_path}')
 
-print(f'Checked {len(df):,}/{len(lines):,} lines')
+# random order of lines is made once, and only made again when the annotations change
+store.set_sample_order(lines, source_key=hashlib.sha1(text.encode()).hexdigest())
 
-for line in random.sample(lines, k=len(lines)):
+print(f'Checked {len(store):,}/{len(lines):,} lines')
 
-    if df['line'].isin([line]).any():
-        print('Checked this line before. Skipping')
-        continue
+for line in store.gen_unjudged():
 
     search = re.search('(\d) (.+) \|\|\| (.+)', line)
     if not search:
@@ -44,16 +47,13 @@ for line in random.sample(lines, k=len(lines)):
     else:
         is_bad = False
 
-    row = pd.DataFrame(data={'line': [line], 'is_bad': [is_bad]})
-    df = df.append(row, ignore_index=True, sort=False)
+    store.add(line, is_bad)
 
-    df.to_csv(path, index=False)
-    print('Saved df')
+# export judgments, in same format as before
+store.export_csv(csv_path)
+print(f'Saved {len(store):,} judgments to {csv_path}')
 
-num_good = df.is_bad.value_counts()[0]
-try:
-    num_bad = df.is_bad.value_counts()[1]
-except KeyError:  # no bad propositions
-    num_bad = 0.01
-prop = num_good / len(df)
-print(f'Proportion correct={prop:.2f}')
\ No newline at end of file
+num_bad = store.num_bad
+num_good = len(store) - num_bad
+prop = num_good / len(store)
+print(f'Proportion correct={prop:.2f}')
@@ -0,0 +1,55 @@
+"""
+How much smaller are block-compressed files, and how fast are they read, compared to plain text?
+
+A corpus in the pre-processed SRL format is replicated NUM_COPIES times, and written as plain text,
+ and in blocks compressed with gzip, xz and bz2.
+Each file is read line by line, with blocks decompressed in the reading process, or in worker processes.
+All methods must read the same lines.
+"""
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from childes_srl import configs
+from childes_srl.compression import open_text, gen_lines, get_index_path
+
+CORPUS_NAME = 'human-based-2018'
+NUM_COPIES = 20
+BLOCK_SIZE = 1 << 22  # characters
+WORKER_COUNTS = [1, 2, 4]
+
+
+text = (configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl.txt').read_text().rstrip('\n')
+text = '\n'.join([text] * NUM_COPIES)
+num_megabytes = len(text.encode()) / 1e6
+tmp_dir = Path(tempfile.mkdtemp())
+print(f'{num_megabytes:.1f} MB of text, {os.cpu_count()} cores')
+print(f'{"file":<46} {"MB":>6} {"write MB/s":>10} {"read MB/s":>10}')
+
+expected_lines = None
+for suffix in ['', '.gz', '.xz', '.bz2']:
+    path = tmp_dir / f'{CORPUS_NAME}_x{NUM_COPIES}_srl.txt{suffix}'
+    start = time.perf_counter()
+    with open_text(path, 'w', block_size=BLOCK_SIZE) as f:
+        f.write(text)
+    write_throughput = num_megabytes / (time.perf_counter() - start)
+    file_size = path.stat().st_size / 1e6
+
+    for num_workers in WORKER_COUNTS if suffix else [1]:
+        start = time.perf_counter()
+        lines = list(gen_lines(path, num_workers))
+        read_throughput = num_megabytes / (time.perf_counter() - start)
+        if expected_lines is None:
+            expected_lines = lines
+        assert lines == expected_lines, (suffix, num_workers)
+        name = f'{path.name} ({num_workers} workers)' if suffix else path.name
+        print(f'{name:<46} {file_size:>6.1f} {write_throughput:>10.1f} {read_throughput:>10.1f}')
+
+    # reading without the block index, with the standard decompressor
+    if suffix:
+        get_index_path(path).unlink()
+        start = time.perf_counter()
+        assert list(gen_lines(path)) == expected_lines
+        read_throughput = num_megabytes / (time.perf_counter() - start)
+        print(f'{path.name + " (no index)":<46} {file_size:>6.1f} {"":>10} {read_throughput:>10.1f}')
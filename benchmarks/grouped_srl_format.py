@@ -0,0 +1,78 @@
+"""
+How much disk space and pre-processing time is saved by storing each sentence once, with all its propositions
+ (the grouped format), instead of once per proposition?
+
+Pre-processing is measured by making the SRL eval set, where word-pieces are computed once per proposition
+ (as before), or once per sentence. Both must result in the same batches.
+Without BERT's tokenizer installed, a local stand-in with the same vocabulary is used.
+"""
+import gzip
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+
+from childes_srl import configs
+from childes_srl.io import load_srl_data, load_grouped_srl_data, convert_srl_to_grouped, convert_grouped_to_srl
+from childes_srl.io import parse_srl_line, ungroup_propositions
+from childes_srl.stubs import StubWordpieceTokenizer
+from bert_recipes.eval_set import SrlEvalSet
+from bert_recipes.word_pieces import convert_words_to_wordpieces
+
+CORPUS_NAME = 'human-based-2018'
+BATCH_SIZE = 128
+NUM_REPEATS = 5  # the fastest of repeated runs is reported
+
+
+def time_fastest(fn):
+    durations = []
+    for _ in range(NUM_REPEATS):
+        start = time.perf_counter()
+        res = fn()
+        durations.append(time.perf_counter() - start)
+    return res, min(durations)
+
+
+srl_path = configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl.txt'
+tmp_dir = Path(tempfile.mkdtemp())
+grouped_path = tmp_dir / f'{CORPUS_NAME}_srl_grouped.txt'
+num_propositions, num_sentences = convert_srl_to_grouped(srl_path, grouped_path)
+print(f'{num_propositions:,} propositions of {num_sentences:,} sentences')
+
+# round trip
+round_trip_path = tmp_dir / f'{CORPUS_NAME}_srl.txt'
+convert_grouped_to_srl(grouped_path, round_trip_path)
+original_lines = sorted([line for line in srl_path.read_text().split('\n') if line])
+assert sorted(round_trip_path.read_text().split('\n')) == original_lines
+
+# disk
+print(f'{"":<10} {"plain MB":>9} {"gzip MB":>9}')
+for name, path in [('flat', srl_path), ('grouped', grouped_path)]:
+    data = path.read_bytes()
+    print(f'{name:<10} {len(data) / 1e6:>9.2f} {len(gzip.compress(data)) / 1e6:>9.2f}')
+
+# loading
+propositions, flat_duration = time_fastest(lambda: load_srl_data(srl_path))
+sentences, grouped_duration = time_fastest(lambda: load_grouped_srl_data(grouped_path))
+print(f'Loaded flat format in {flat_duration:.3f} seconds, grouped format in {grouped_duration:.3f} seconds')
+assert sorted(ungroup_propositions(sentences)) == sorted(propositions)
+
+# pre-processing
+tokenizer = StubWordpieceTokenizer(configs.Dirs.data / 'vocabulary' / 'bert-base-uncased-vocab.txt')
+roles = {tag[2:] for _, _, tags in propositions for tag in tags if tag != 'O'}
+srl_tag2id = {tag: n for n, tag in enumerate(['O'] + [f'{bio}-{role}' for role in sorted(roles) for bio in 'BI'])}
+name2eval_set = {}
+for name, groups in [('per proposition', [(words, [(p, tags)]) for words, p, tags in ungroup_propositions(sentences)]),
+                     ('per sentence', sentences)]:
+    _, conversion_duration = time_fastest(lambda: [convert_words_to_wordpieces(words, tokenizer)
+                                                   for words, _ in groups])
+    name2eval_set[name], duration = time_fastest(
+        lambda: SrlEvalSet.from_grouped_sentences(groups, tokenizer, srl_tag2id, BATCH_SIZE))
+    print(f'Word-pieces computed {len(groups):>7,} times ({name:<15}) in {conversion_duration:.3f} seconds. '
+          f'Eval set made in {duration:.3f} seconds')
+
+for (batch1, meta_data1), (batch2, meta_data2) in zip(*name2eval_set.values()):
+    assert all([torch.equal(batch1[k], batch2[k]) for k in batch1 if k != 'task'])
+    assert meta_data1 == meta_data2
+print('Eval sets are identical')
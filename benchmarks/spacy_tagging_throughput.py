@@ -0,0 +1,56 @@
+"""
+How many sentences per second can be POS-tagged, when spaCy's pipeline components are called on one Doc at a time
+(as was done when making instances for the SRL tagger), compared to when Docs are streamed through them in batches?
+
+All sentences of the pre-processed SRL corpus are tagged, and verb positions must be the same for all methods.
+The stand-in tagger (USE_STUB_SPACY = True) needs no spaCy model, but only emulates a fixed cost per call,
+ so its timings show how much of that cost batching removes, and say nothing about the speed of the real model.
+"""
+import time
+
+import spacy
+from spacy.tokens import Doc
+
+from childes_srl import configs
+from childes_srl.io import load_srl_data
+from childes_srl.stubs import make_stub_spacy
+from childes_srl.tagging import tag_pretokenized, get_verb_indices
+
+CORPUS_NAME = 'human-based-2018'
+USE_STUB_SPACY = False  # if False, the same spaCy model as used by the AllenNLP SRL tagger is loaded
+STUB_SECONDS_PER_CALL = 0.0002
+
+
+def tag_one_at_a_time(sentences):
+    for words in sentences:
+        spacy_doc = Doc(nlp.vocab, words=words)
+        for pipe in filter(None, nlp.pipeline):
+            pipe[1](spacy_doc)
+        yield spacy_doc
+
+
+if USE_STUB_SPACY:
+    nlp = make_stub_spacy(STUB_SECONDS_PER_CALL)
+else:
+    nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
+
+# sentences - one per unique proposition
+propositions = load_srl_data(configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl.txt')
+sentences = list({tuple(words): list(words) for words, _, _ in propositions}.values())
+print(f'Tagging {len(sentences):,} sentences')
+
+name2verb_indices = {}
+for name, tag in [('one at a time', tag_one_at_a_time),
+                  ('batches of 100', lambda s: tag_pretokenized(nlp, s, batch_size=100)),
+                  ('batches of 1000', lambda s: tag_pretokenized(nlp, s, batch_size=1000)),
+                  ('batches of 1000, 2 workers', lambda s: tag_pretokenized(nlp, s, batch_size=1000, num_workers=2)),
+                  ]:
+    start = time.time()
+    verb_indices = [get_verb_indices(doc) for doc in tag(sentences)]
+    elapsed = time.time() - start
+    name2verb_indices[name] = verb_indices
+    print(f'{name:<28} {len(sentences) / elapsed:>9,.0f} sentences/second ({elapsed:.2f} seconds)')
+
+for name, verb_indices in name2verb_indices.items():
+    assert verb_indices == name2verb_indices['one at a time'], name
+print(f'All methods found the same {sum(map(len, name2verb_indices["one at a time"])):,} verbs')
@@ -0,0 +1,68 @@
+"""
+How many utterances per second can be annotated, when segmentation, tagging and SRL inference run sequentially,
+compared to when they run concurrently, in a staged pipeline?
+
+Also measures the effect of a persistent cache of annotations of unique utterances,
+ when it is empty (cold), and when it contains annotations of all utterances from a previous run (warm).
+
+Uses local stand-ins for DeepSegment and the AllenNLP SRL tagger, which emulate the time needed by each model.
+"""
+import tempfile
+import time
+from pathlib import Path
+
+from childes_srl import configs
+from childes_srl.io import load_srl_data
+from childes_srl.stubs import StubPredictor, StubSegmenter
+from childes_srl.annotation import SrlAnnotator
+from childes_srl.utterance_cache import UtteranceCache
+
+CORPUS_NAME = 'human-based-2018'
+NUM_UTTERANCES = 20_000
+BATCH_SIZE = 128
+CHUNK_SIZE = 512
+SEGMENTATION_SECONDS_PER_TOKEN = 0.000002
+SRL_SECONDS_PER_TOKEN = 0.00002
+
+# utterances - whole words of the pre-processed SRL data, because raw CHILDES data is not part of the repository
+propositions = load_srl_data(configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl.txt')
+utterances = [words for words, _, _ in propositions]
+utterances = (utterances * (NUM_UTTERANCES // len(utterances) + 1))[:NUM_UTTERANCES]
+
+predictor = StubPredictor(seconds_per_token=SRL_SECONDS_PER_TOKEN)
+segmenter = StubSegmenter(seconds_per_token=SEGMENTATION_SECONDS_PER_TOKEN)
+
+cache = UtteranceCache(Path(tempfile.mkdtemp()) / 'srl_annotations.sqlite', namespace='stubs')
+
+name2lines = {}
+for name, sequential, num_workers, use_cache, look_ahead in [
+    ('sequential, no length sorting', True, 1, False, 1),
+    ('sequential', True, 1, False, 8),
+    ('pipeline', False, 1, False, 8),
+    ('pipeline, 2 workers per stage', False, 2, False, 8),
+    ('pipeline, cold cache', False, 1, True, 8),
+    ('pipeline, warm cache', False, 1, True, 8),
+]:
+    annotator = SrlAnnotator(predictor,
+                             segmenter,
+                             batch_size=BATCH_SIZE,
+                             look_ahead=look_ahead,
+                             chunk_size=CHUNK_SIZE,
+                             num_segmentation_workers=num_workers,
+                             num_tagging_workers=num_workers,
+                             num_srl_workers=num_workers,
+                             cache=cache if use_cache else None)
+    start = time.time()
+    lines = [line
+             for chunk in annotator.annotate(utterances, sequential=sequential)
+             for utterance_lines in chunk['lines']
+             for line in utterance_lines]
+    elapsed = time.time() - start
+    name2lines[name] = lines
+    print(f'{name:<32} {len(utterances) / elapsed:>9,.0f} utterances/second ({elapsed:.2f} seconds) '
+          f'hit rate={annotator.hit_rate:.3f} segmentation bypass rate={annotator.segmentation_bypass_rate:.3f}')
+
+# output must be the same, and in the same order, regardless of concurrency
+for name, lines in name2lines.items():
+    assert lines == name2lines['sequential'], name
+print(f'All runs produced the same {len(name2lines["sequential"]):,} lines in the same order')
@@ -0,0 +1,87 @@
+"""
+How long does it take to build the inverted index over a file of propositions,
+and how fast are queries answered with the index, compared to re-reading and scanning the file?
+
+Both methods must return the same propositions and spans.
+To benchmark on more data than is in the repository, the corpus can be replicated NUM_COPIES times.
+"""
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from childes_srl import configs
+from childes_srl.corpus_stats import strip_bio
+from childes_srl.io import parse_srl_line
+from childes_srl.srl_index import SrlIndex
+
+CORPUS_NAME = 'human-based-2018'  # use the model-annotated corpus, e.g. 'childes-20191206_no-dev', if available
+NUM_COPIES = 20
+NUM_REPEATS = 5
+
+QUERIES = [
+    ('ARG0', 'want', None),  # all ARG0 fillers of "want"
+    ('ARG1', None, 'ball'),  # all ARG1 spans containing "ball"
+    ('ARG1', 'put', None),
+    ('ARGM-LOC', None, 'there'),
+]
+
+
+def find_spans_by_scanning(srl_path: Path, role, predicate, containing):
+    res = []
+    with srl_path.open('r') as f:
+        for prop_id, line in enumerate(filter(str.strip, f)):
+            words, predicate_index, tags = parse_srl_line(line)
+            if predicate is not None and words[predicate_index] != predicate:
+                continue
+            if containing is not None and containing not in words:
+                continue
+            previous_role = None
+            for i, tag in enumerate(tags + ['O']):
+                is_continuation = tag.startswith('I-') and strip_bio(tag) == previous_role
+                if previous_role == role and not is_continuation:
+                    if containing is None or containing in words[start: i]:
+                        res.append((prop_id, start, i))
+                if tag != 'O' and not is_continuation:
+                    start = i
+                previous_role = strip_bio(tag) if tag != 'O' else None
+    return res
+
+
+def time_query(fn) -> float:
+    latencies = []
+    for _ in range(NUM_REPEATS):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+
+# corpus
+text = (configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl.txt').read_text().rstrip('\n')
+srl_path = Path(tempfile.mkdtemp()) / f'{CORPUS_NAME}_x{NUM_COPIES}_srl.txt'
+srl_path.write_text('\n'.join([text] * NUM_COPIES))
+
+# build
+start = time.perf_counter()
+index = SrlIndex.from_file(srl_path)
+print(f'Built index over {index.corpus.num_sentences:,} propositions in {time.perf_counter() - start:.2f} seconds')
+index_path = srl_path.with_suffix('.npz')
+index.save(index_path)
+start = time.perf_counter()
+index = SrlIndex.load(index_path)
+print(f'Loaded index from disk in {time.perf_counter() - start:.2f} seconds')
+
+# queries
+print(f'{"query":<40} {"num spans":>9} {"scan":>10} {"index":>10}')
+for role, predicate, containing in QUERIES:
+    spans = index.find_spans(role, predicate=predicate, containing=containing)
+    assert sorted(spans) == sorted(find_spans_by_scanning(srl_path, role, predicate, containing))
+    scan_latency = time_query(lambda: find_spans_by_scanning(srl_path, role, predicate, containing))
+    index_latency = time_query(lambda: index.find_spans(role, predicate=predicate, containing=containing))
+    name = f'{role} predicate={predicate} containing={containing}'
+    print(f'{name:<40} {len(spans):>9,} {scan_latency * 1000:>8.1f}ms {index_latency * 1000:>8.2f}ms')
+
+# example output
+for span in index.find_spans('ARG0', predicate='want')[:5]:
+    print(f'{index.render_span(span):<20} {index.render_proposition(span[0])}')
@@ -0,0 +1,74 @@
+"""
+How much memory do SRL training instances need, and how long does it take to iterate over them for several epochs,
+ when all instances are kept in a list, compared to when they are rebuilt from a compact encoding in each epoch?
+
+Both methods must yield the same instances in each epoch.
+Instead of BERT's tokenizer, a local stand-in with the same vocabulary is used, and instances are made of
+ stand-ins for AllenNLP's fields, which hold the same data, so that AllenNLP need not be installed.
+Memory is that of these stand-ins, which is less than that of AllenNLP's fields.
+"""
+import time
+import tracemalloc
+
+from childes_srl import configs
+from childes_srl.io import load_srl_data, group_propositions
+from childes_srl.stubs import StubWordpieceTokenizer, STUB_ALLENNLP_DATA_CLASSES
+from bert_recipes.pre_processing import SrlInstanceSource, make_instance, make_verb_indices
+from bert_recipes.word_pieces import convert_words_to_wordpieces
+
+CORPUS_NAME = 'human-based-2018'
+NUM_COPIES = 5  # copies of the corpus, to have more instances
+NUM_EPOCHS = 3
+
+
+def make_instance_list(propositions):
+    res = []
+    for words, rows in group_propositions(propositions):
+        srl_in_wp, offsets, start_offsets = convert_words_to_wordpieces(words, tokenizer)
+        wordpiece_ids = [tokenizer.vocab[wp] for wp in srl_in_wp]
+        for predicate_index, tags in rows:
+            res.append(make_instance(words, make_verb_indices((words, predicate_index, tags)), tags,
+                                     srl_in_wp, wordpiece_ids, offsets, start_offsets, token_indexers,
+                                     STUB_ALLENNLP_DATA_CLASSES))
+    return res
+
+
+def make_instance_source(propositions):
+    res = SrlInstanceSource.from_propositions(propositions, tokenizer, token_indexers)
+    res.data_classes = STUB_ALLENNLP_DATA_CLASSES
+    return res
+
+
+def describe(instance):
+    return ([t.text for t in instance['tokens'].tokens], instance['indicator'].labels, instance['tags'].labels,
+            instance['metadata'].metadata)
+
+
+tokenizer = StubWordpieceTokenizer(configs.Dirs.data / 'vocabulary' / 'bert-base-uncased-vocab.txt')
+token_indexers = {}  # instances are made, but not indexed, in this benchmark
+propositions = load_srl_data(configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl.txt')
+propositions = [(list(words), p, list(tags)) for _ in range(NUM_COPIES) for words, p, tags in propositions]
+print(f'{len(propositions):,} propositions')
+
+name2descriptions = {}
+for name, make in [('list of instances', make_instance_list),
+                   ('instance source', make_instance_source)]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    instances = make(propositions)
+    build_duration = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for epoch in range(NUM_EPOCHS):
+        num_tokens = sum([len(instance['tokens'].tokens) for instance in instances])
+    epochs_duration = time.perf_counter() - start
+
+    print(f'{name:<20} memory={memory / 1e6:>7.1f}MB build={build_duration:>6.2f}s '
+          f'{NUM_EPOCHS} epochs={epochs_duration:>6.2f}s ({num_tokens:,} word-pieces per epoch)')
+    name2descriptions[name] = [describe(instance) for instance in instances]
+    del instances
+
+assert name2descriptions['list of instances'] == name2descriptions['instance source']
+print('Both methods yield the same instances')
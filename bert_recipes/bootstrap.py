@@ -0,0 +1,138 @@
+"""
+Bootstrap confidence intervals for f1, computed from per-proposition counts collected by SrlEvalScorer.
+
+Propositions are resampled with replacement. Instead of looping over resamples, each resample is represented
+by a vector holding the number of times each proposition is drawn, so that the counts of many resamples
+are computed by a single matrix multiplication.
+"""
+from typing import Dict, List
+
+import numpy as np
+
+
+def compute_f1(counts: np.ndarray,
+               ) -> np.ndarray:
+    """
+    compute f1 from an array whose last dimension holds true positives, false positives, and false negatives.
+    uses the same smoothing as SrlEvalScorer._compute_metrics().
+    """
+    tp = counts[..., 0]
+    fp = counts[..., 1]
+    fn = counts[..., 2]
+    precision = tp / (tp + fp + 1e-13)
+    recall = tp / (tp + fn + 1e-13)
+    return 2. * ((precision * recall) / (precision + recall + 1e-13))
+
+
+def gen_resampled_counts(counts_list: List[np.ndarray],
+                         num_resamples: int,
+                         chunk_size: int = 1000,
+                         seed: int = 0,
+                         ):
+    """
+    yield, for each chunk of resamples, the summed counts of each array in counts_list,
+     with shape [chunk size, num tags, 3].
+    the same resamples are used for each array in counts_list, which must be aligned by proposition.
+    """
+    num_propositions, num_tags, _ = counts_list[0].shape
+    for counts in counts_list:
+        assert counts.shape == counts_list[0].shape
+
+    rng = np.random.RandomState(seed)
+    counts_list_2d = [counts.reshape(num_propositions, -1).astype(np.float32)  # float32 is exact for counts < 2^24
+                      for counts in counts_list]
+    for start in range(0, num_resamples, chunk_size):
+        size = min(chunk_size, num_resamples - start)
+
+        # number of times each proposition is drawn in each resample, shape [size, num propositions]
+        ids = rng.randint(0, num_propositions, size=(size, num_propositions))
+        ids += np.arange(size)[:, np.newaxis] * num_propositions
+        weights = np.bincount(ids.ravel(), minlength=size * num_propositions)
+        weights = weights.reshape(size, num_propositions).astype(np.float32)
+
+        yield [(weights @ counts_2d).reshape(size, num_tags, 3) for counts_2d in counts_list_2d]
+
+
+def bootstrap_f1(tags: List[str],
+                 counts: np.ndarray,  # shape [num propositions, num tags, 3]
+                 num_resamples: int = 10_000,
+                 chunk_size: int = 1000,
+                 seed: int = 0,
+                 ) -> Dict[str, np.ndarray]:
+    """
+    return resampled f1 values (shape [num resamples]) for each tag, and for "overall".
+    """
+    res = []
+    for resampled_counts, in gen_resampled_counts([counts], num_resamples, chunk_size, seed):
+        res.append(_compute_f1_by_tag(resampled_counts))
+    f1s = np.concatenate(res)
+    return {tag: f1s[:, n] for n, tag in enumerate(tags + ['overall'])}
+
+
+def bootstrap_confidence_intervals(tags: List[str],
+                                   counts: np.ndarray,
+                                   confidence: float = 0.95,
+                                   num_resamples: int = 10_000,
+                                   seed: int = 0,
+                                   ) -> Dict[str, Dict[str, float]]:
+    """
+    return f1 and the lower and upper bound of its percentile bootstrap confidence interval, for each tag.
+    the format is compatible with SrlEvalScorer.print_summary() and SrlEvalScorer.save_tag2metrics().
+    """
+    observed = _compute_f1_by_tag(counts.sum(axis=0, keepdims=True))[0]
+    tag2f1s = bootstrap_f1(tags, counts, num_resamples, seed=seed)
+    support = (counts[..., 0] + counts[..., 2]).sum(axis=0)  # number of gold spans per tag
+    support = np.append(support, support.sum())
+    alpha = (1 - confidence) / 2
+    res = {}
+    for n, (tag, f1s) in enumerate(tag2f1s.items()):
+        lower, upper = np.quantile(f1s, [alpha, 1 - alpha])
+        res[tag] = {'f1': float(observed[n]),
+                    'f1_lower': float(lower),
+                    'f1_upper': float(upper),
+                    'support': int(support[n]),
+                    }
+    return res
+
+
+def paired_bootstrap(tags: List[str],
+                     counts_a: np.ndarray,
+                     counts_b: np.ndarray,
+                     num_resamples: int = 10_000,
+                     seed: int = 0,
+                     ) -> Dict[str, Dict[str, float]]:
+    """
+    compare two systems evaluated on the same propositions (counts_a and counts_b must be aligned by proposition).
+
+    for each tag, returns the observed difference in f1 (a - b), and the proportion of resamples
+     in which the difference does not have the same sign as the observed difference (a one-sided p-value).
+    """
+    observed_a = _compute_f1_by_tag(counts_a.sum(axis=0, keepdims=True))[0]
+    observed_b = _compute_f1_by_tag(counts_b.sum(axis=0, keepdims=True))[0]
+    observed_deltas = observed_a - observed_b
+
+    num_not_same_sign = np.zeros(len(tags) + 1)
+    for resampled_a, resampled_b in gen_resampled_counts([counts_a, counts_b], num_resamples, seed=seed):
+        deltas = _compute_f1_by_tag(resampled_a) - _compute_f1_by_tag(resampled_b)
+        num_not_same_sign += (deltas * np.sign(observed_deltas) <= 0).sum(axis=0)
+
+    res = {}
+    for n, tag in enumerate(tags + ['overall']):
+        res[tag] = {'delta_f1': float(observed_deltas[n]),
+                    'p': float(num_not_same_sign[n] / num_resamples)}
+    return res
+
+
+def _compute_f1_by_tag(resampled_counts: np.ndarray,
+                       ) -> np.ndarray:
+    """
+    return f1 with shape [num resamples, num tags + 1], where the last column is "overall" f1.
+    """
+    overall = resampled_counts.sum(axis=1, keepdims=True)
+    return compute_f1(np.concatenate([resampled_counts, overall], axis=1))
+
+
+def print_confidence_intervals(tag2ci: Dict[str, Dict[str, float]],
+                               ) -> None:
+    for tag, ci in sorted(tag2ci.items()):
+        print(f'{tag:>16} f1= {ci["f1"]:.2f} [{ci["f1_lower"]:.2f}, {ci["f1_upper"]:.2f}] n={ci["support"]:,}')
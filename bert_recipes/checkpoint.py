@@ -0,0 +1,187 @@
+"""
+Checkpointing for the joint training recipe.
+
+A checkpoint holds everything needed to continue training exactly where it stopped:
+model and optimizer weights, step counters, RNG states, and the positions of the batch streams.
+"""
+import copy
+import os
+import queue
+import random
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import torch
+
+
+def snapshot_state(state: Any) -> Any:
+    """
+    copy a (possibly nested) state dict, moving all tensors to CPU.
+    the copy is independent of the original, so training may continue while the copy is written to disk.
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to('cpu', copy=True)
+    elif isinstance(state, dict):
+        return {k: snapshot_state(v) for k, v in state.items()}
+    elif isinstance(state, (list, tuple)):
+        return type(state)(snapshot_state(v) for v in state)
+    else:
+        return copy.deepcopy(state)
+
+
+def get_rng_states() -> Dict[str, Any]:
+    np_state = np.random.get_state()
+    res = {'python': random.getstate(),
+           'numpy': (np_state[0], np_state[1].tolist()) + tuple(np_state[2:]),  # no arrays, so torch.load is safe
+           'torch': torch.get_rng_state(),
+           }
+    if torch.cuda.is_available():
+        res['cuda'] = torch.cuda.get_rng_state_all()
+    return res
+
+
+def set_rng_states(rng_states: Dict[str, Any],
+                   ) -> None:
+    random.setstate(rng_states['python'])
+    np_state = rng_states['numpy']
+    np.random.set_state((np_state[0], np.array(np_state[1], dtype=np.uint32)) + tuple(np_state[2:]))
+    torch.set_rng_state(rng_states['torch'])
+    if 'cuda' in rng_states and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng_states['cuda'])
+
+
+class ResumableBatches:
+    """
+    iterate over a fixed list of batches, keeping track of the position in the list.
+    unlike itertools.cycle(), the position can be saved and restored, so that a resumed run sees the same batches.
+
+    the (optional) transform is applied to each batch when it is requested,
+     so that tensors are not kept in memory for the whole data set.
+    """
+
+    def __init__(self,
+                 batches: List[Any],
+                 transform: Optional[Callable[[Any], Any]] = None,
+                 infinite: bool = False,
+                 ):
+        self.batches = batches
+        self.transform = transform
+        self.infinite = infinite
+
+        self.position = 0  # index of next batch
+        self.num_cycles = 0  # number of times all batches have been visited
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.position == len(self.batches):
+            if not self.infinite or not self.batches:
+                raise StopIteration
+            self.position = 0
+            self.num_cycles += 1
+
+        batch = self.batches[self.position]
+        self.position += 1
+
+        if self.transform is not None:
+            return self.transform(batch)
+        else:
+            return batch
+
+    def state_dict(self) -> Dict[str, int]:
+        return {'position': self.position,
+                'num_cycles': self.num_cycles}
+
+    def load_state_dict(self,
+                        state_dict: Dict[str, int],
+                        ) -> None:
+        if state_dict['position'] > len(self.batches):
+            raise ValueError('Saved position is larger than number of batches. Was the data changed?')
+        self.position = state_dict['position']
+        self.num_cycles = state_dict['num_cycles']
+
+
+class AsyncCheckpointer:
+    """
+    writes checkpoints to disk in a background thread, so that the training loop is not blocked by disk I/O.
+
+    the state passed to save() must not be modified afterwards - use snapshot_state() to make a copy.
+    at most one checkpoint waits in the queue; if saving is requested while the previous checkpoint is still
+     waiting to be written, save() blocks until it is picked up.
+    each checkpoint is written to a temporary file which is renamed only once writing is complete,
+     so that a run which is killed while writing never leaves behind a corrupt checkpoint.
+    """
+
+    file_name_prefix = 'checkpoint_'
+
+    def __init__(self,
+                 checkpoint_dir: Path,
+                 max_to_keep: int = 2,
+                 ):
+        self.checkpoint_dir = checkpoint_dir
+        self.max_to_keep = max_to_keep
+
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=1)
+        self._exception = None
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def save(self,
+             step: int,
+             state: Dict[str, Any],
+             ) -> None:
+        self._raise_if_failed()
+        self._queue.put((step, state))
+
+    def close(self) -> None:
+        """block until all pending checkpoints are written"""
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_if_failed()
+
+    def get_paths(self) -> List[Path]:
+        """paths to complete checkpoints, ordered by step"""
+        return sorted(self.checkpoint_dir.glob(f'{self.file_name_prefix}*.pt'))
+
+    def load_latest(self) -> Optional[Dict[str, Any]]:
+        paths = self.get_paths()
+        if not paths:
+            return None
+        print(f'Loading checkpoint from {paths[-1]}')
+        return torch.load(str(paths[-1]), map_location='cpu')
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            step, state = item
+            try:
+                self._write(step, state)
+            except Exception as e:  # re-raised in the training thread
+                self._exception = e
+
+    def _write(self,
+               step: int,
+               state: Dict[str, Any],
+               ) -> None:
+        path = self.checkpoint_dir / f'{self.file_name_prefix}{step:0>12}.pt'
+        tmp_path = path.with_suffix('.tmp')
+        torch.save(state, str(tmp_path))
+        os.replace(str(tmp_path), str(path))
+
+        # remove old checkpoints
+        for old_path in self.get_paths()[:-self.max_to_keep]:
+            old_path.unlink()
+
+    def _raise_if_failed(self) -> None:
+        if self._exception is not None:
+            raise RuntimeError('Writing checkpoint failed') from self._exception
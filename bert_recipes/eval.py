@@ -3,28 +3,38 @@ Code obtained from Allen AI NLP toolkit in September 2019
 Modified by PH March 2020
 """
 
+import copy
 import os
+import queue
 import shutil
 import subprocess
 import tempfile
+import threading
 from collections import defaultdict
 
+import numpy as np
 import pandas as pd
 import torch
-from typing import Generator, Optional, List, Dict, TextIO
+from typing import Optional, List, Dict, TextIO, Tuple, Any, Iterable
 from pathlib import Path
 
 from childes_srl import configs
 from bert_recipes.model import BertForMLMAndSRL
 from bert_recipes.decode import decode_srl_batch_output
+from bert_recipes.checkpoint import snapshot_state
 
 
 def evaluate_model_on_f1(model: BertForMLMAndSRL,
                          srl_eval_path: Path,
-                         batches_srl: Generator,
+                         batches_srl: Iterable[Tuple[Dict[str, torch.Tensor], Dict[str, Any]]],
+                         id2srl_tag: Dict[int, str],
                          save_path: Optional[Path] = None,
                          print_tag_metrics: bool = False,
                          ) -> float:
+    """
+    compute f1 over all batches in batches_srl.
+    batches_srl must be finite (e.g. a SrlEvalSet) - otherwise evaluation never terminates.
+    """
 
     scorer = SrlEvalScorer(srl_eval_path,
                            ignore_classes=['V'])
@@ -37,17 +47,22 @@ def evaluate_model_on_f1(model: BertForMLMAndSRL,
             output_srl = model(**batch)
 
         # metadata
-        metadata = batch['metadata']
-        batch_verb_indices = [example_metadata['verb_index'] for example_metadata in metadata]
-        batch_sentences = [example_metadata['in'] for example_metadata in metadata]
+        batch_verb_indices = meta_data['verb_index']
+        batch_sentences = meta_data['in']
 
         # Get the BIO tags from decode()
-        batch_bio_predicted_tags = decode_srl_batch_output(output_srl)
+        batch_bio_predicted_tags = decode_srl_batch_output(output_srl['logits'],
+                                                           meta_data['start_offsets'],
+                                                           batch['attention_mask'],
+                                                           id2srl_tag)
         batch_conll_predicted_tags = [convert_bio_tags_to_conll_format(tags) for
                                       tags in batch_bio_predicted_tags]
-        batch_bio_gold_tags = [example_metadata['gold_tags'] for example_metadata in metadata]
-        batch_conll_gold_tags = [convert_bio_tags_to_conll_format(tags) for
-                                 tags in batch_bio_gold_tags]
+        if 'gold_tags_conll' in meta_data:  # pre-computed by SrlEvalSet
+            batch_conll_gold_tags = meta_data['gold_tags_conll']
+        else:
+            batch_bio_gold_tags = meta_data['gold_tags']
+            batch_conll_gold_tags = [convert_bio_tags_to_conll_format(tags) for
+                                     tags in batch_bio_gold_tags]
 
         # update signal detection metrics
         scorer(batch_verb_indices,
@@ -70,6 +85,116 @@ def evaluate_model_on_f1(model: BertForMLMAndSRL,
     return tag2metrics['overall']['f1']
 
 
+class AsyncSrlEvaluator:
+    """
+    evaluates snapshots of a model's weights in a background thread, so that training need not wait for evaluation.
+
+    submit() copies the current weights (in the training thread), and a worker evaluates the copy on a fixed,
+     finite set of batches. results are returned as (step, f1) tuples, where step is the step at which
+     the weights were copied.
+    the worker uses its own copy of the model, so that evaluation does not change the mode (train vs. eval)
+     of the model being trained.
+    snapshots whose results were not yet returned are part of state_dict(), so that a resumed run can re-submit them.
+    """
+
+    def __init__(self,
+                 model: BertForMLMAndSRL,
+                 srl_eval_path: Path,
+                 batches_srl: Iterable[Tuple[Dict[str, torch.Tensor], Dict[str, Any]]],
+                 id2srl_tag: Dict[int, str],
+                 save_path: Optional[Path] = None,
+                 device: Optional[str] = None,  # defaults to device of model
+                 ):
+        self.srl_eval_path = srl_eval_path
+        self.batches_srl = batches_srl
+        self.id2srl_tag = id2srl_tag
+        self.save_path = save_path
+
+        self.model = copy.deepcopy(model)
+        if device is not None:
+            self.model.to(device)
+
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._pending: Dict[int, Dict[str, Any]] = {}  # step -> snapshot, until its result is returned
+        self._exception = None
+        self._thread = threading.Thread(target=self._eval_loop, daemon=True)
+        self._thread.start()
+
+    def submit(self,
+               step: int,
+               model: BertForMLMAndSRL,
+               ) -> None:
+        self._submit_snapshot(step, snapshot_state(model.state_dict()))
+
+    def _submit_snapshot(self,
+                         step: int,
+                         state_dict: Dict[str, Any],
+                         ) -> None:
+        self._raise_if_failed()
+        self._pending[step] = state_dict
+        self._requests.put((step, state_dict))
+
+    @property
+    def pending_steps(self) -> List[int]:
+        """steps which were submitted, but whose results were not yet returned"""
+        return list(self._pending)
+
+    def get_results(self) -> List[Tuple[int, float]]:
+        """return all results that are available, without blocking"""
+        self._raise_if_failed()
+        res = []
+        while True:
+            try:
+                step, f1 = self._results.get_nowait()
+            except queue.Empty:
+                return res
+            self._pending.pop(step, None)
+            res.append((step, f1))
+
+    def state_dict(self) -> Dict[str, Any]:
+        """snapshots of evaluations which were submitted, but whose results were not yet returned"""
+        return {'pending': list(self._pending.items())}
+
+    def load_state_dict(self,
+                        state_dict: Dict[str, Any],
+                        ) -> None:
+        """re-submit evaluations which were pending when state_dict was made"""
+        for step, snapshot in state_dict['pending']:
+            if step not in self._pending:
+                self._submit_snapshot(step, snapshot)
+
+    def close(self) -> List[Tuple[int, float]]:
+        """wait for all pending evaluations, and return their results"""
+        self._requests.put(None)
+        self._thread.join()
+        return self.get_results()
+
+    def _eval_loop(self) -> None:
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            step, state_dict = item
+            try:
+                self.model.load_state_dict(state_dict)
+                if self.save_path is not None:
+                    save_path = self.save_path / f'{step:0>12}'
+                    save_path.mkdir(parents=True, exist_ok=True)
+                else:
+                    save_path = None
+                f1 = evaluate_model_on_f1(self.model, self.srl_eval_path, self.batches_srl, self.id2srl_tag,
+                                          save_path=save_path)
+            except Exception as e:  # re-raised in the training thread
+                self._exception = e
+                break
+            self._results.put((step, f1))
+
+    def _raise_if_failed(self) -> None:
+        if self._exception is not None:
+            raise RuntimeError('Evaluation failed') from self._exception
+
+
 class SrlEvalScorer:
     """
     This class uses the external srl-eval.pl script for computing the CoNLL SRL metrics.
@@ -96,6 +221,9 @@ class SrlEvalScorer:
         self._false_positives = defaultdict(int)
         self._false_negatives = defaultdict(int)
 
+        # per label span counts for each proposition, for bootstrapping
+        self._proposition_counts = []
+
     def __call__(self,  # type: ignore
                  batch_verb_indices: List[Optional[int]],
                  batch_sentences: List[List[str]],
@@ -167,6 +295,63 @@ class SrlEvalScorer:
                 self._false_negatives[tag] += num_missed
         shutil.rmtree(tempdir)
 
+        # collect counts per proposition
+        for verb_index, predicted_tag_sequence, gold_tag_sequence in zip(batch_verb_indices,
+                                                                         batch_conll_formatted_predicted_tags,
+                                                                         batch_conll_formatted_gold_tags):
+            self._proposition_counts.append(self._count_spans(verb_index, predicted_tag_sequence, gold_tag_sequence))
+
+    def _count_spans(self,
+                     verb_index: Optional[int],
+                     conll_formatted_predicted_tags: List[str],
+                     conll_formatted_gold_tags: List[str],
+                     ) -> Dict[str, Tuple[int, int, int]]:
+        """
+        count true positives, false positives and false negatives per label, for a single proposition.
+        a predicted span is correct if a gold span has the same label, start, and end, as in srl-eval.pl.
+        the sums over all propositions are equal to the counts reported by srl-eval.pl.
+        """
+        # write_conll_formatted_tags_to_file() writes no verb if verb_index is falsy (including 0),
+        # and srl-eval.pl does not score propositions without verb
+        if not verb_index:
+            return {}
+
+        predicted_spans = {s for s in get_spans_from_conll_tags(conll_formatted_predicted_tags)
+                           if s[0] not in self._ignore_classes}
+        gold_spans = {s for s in get_spans_from_conll_tags(conll_formatted_gold_tags)
+                      if s[0] not in self._ignore_classes}
+
+        res = {}
+        for tag in {s[0] for s in predicted_spans | gold_spans}:
+            predicted = {s for s in predicted_spans if s[0] == tag}
+            gold = {s for s in gold_spans if s[0] == tag}
+            res[tag] = (len(predicted & gold), len(predicted - gold), len(gold - predicted))
+        return res
+
+    def get_proposition_counts(self,
+                               tags: Optional[List[str]] = None,
+                               ) -> Tuple[List[str], np.ndarray]:
+        """
+        return counts of true positives, false positives and false negatives per proposition and tag.
+
+        Returns
+        -------
+        tags : List[str]
+            The tags (sorted) corresponding to the second dimension of the counts.
+        counts : np.ndarray
+            Integer array with shape [num propositions, num tags, 3],
+            where the last dimension holds true positives, false positives, and false negatives.
+        """
+        if tags is None:
+            tags = sorted({tag for counts in self._proposition_counts for tag in counts})
+        tag2id = {tag: n for n, tag in enumerate(tags)}
+        res = np.zeros((len(self._proposition_counts), len(tags), 3), dtype=np.int64)
+        for n, counts in enumerate(self._proposition_counts):
+            for tag, tag_counts in counts.items():
+                if tag in tag2id:
+                    res[n, tag2id[tag]] = tag_counts
+        return tags, res
+
     def get_tag2metrics(self,
                         reset: bool = False,
                         ) -> Dict[str, Dict[str, float]]:
@@ -185,7 +370,7 @@ class SrlEvalScorer:
         all_tags.update(self._false_positives.keys())
         all_tags.update(self._false_negatives.keys())
         res = {}
-        for tag in all_tags:
+        for tag in sorted(all_tags):  # sorted, so that output does not depend on order in which counts were collected
             if tag == "overall":
                 raise ValueError("'overall' is disallowed as a tag type, "
                                  "rename the tag type to something else if necessary.")
@@ -242,6 +427,39 @@ class SrlEvalScorer:
         self._true_positives = defaultdict(int)
         self._false_positives = defaultdict(int)
         self._false_negatives = defaultdict(int)
+        self._proposition_counts = []
+
+    def state_dict(self) -> Dict[str, Dict[str, int]]:
+        """
+        counts per tag, as plain dicts that can be pickled (e.g. returned from worker processes) or saved as json
+        """
+        return {'true_positives': dict(self._true_positives),
+                'false_positives': dict(self._false_positives),
+                'false_negatives': dict(self._false_negatives),
+                'proposition_counts': list(self._proposition_counts)}
+
+    def load_state_dict(self,
+                        state_dict: Dict[str, Dict[str, int]],
+                        ) -> None:
+        """replace the counts of this scorer with counts returned by state_dict()"""
+        self.reset()
+        self.merge(state_dict)
+
+    def merge(self,
+              state_dict: Dict[str, Dict[str, int]],
+              ) -> None:
+        """
+        add counts collected by another scorer (e.g. on another shard of the data) to the counts of this scorer.
+        because counts are summed, the result is the same as scoring all data with a single scorer.
+        per-proposition counts are appended, so shards should be merged in order
+        """
+        for tag, num in state_dict['true_positives'].items():
+            self._true_positives[tag] += num
+        for tag, num in state_dict['false_positives'].items():
+            self._false_positives[tag] += num
+        for tag, num in state_dict['false_negatives'].items():
+            self._false_negatives[tag] += num
+        self._proposition_counts.extend(state_dict.get('proposition_counts', []))
 
 
 def convert_bio_tags_to_conll_format(labels: List[str],
@@ -283,6 +501,25 @@ def convert_bio_tags_to_conll_format(labels: List[str],
     return conll_labels
 
 
+def get_spans_from_conll_tags(conll_labels: List[str],
+                              ) -> List[Tuple[str, int, int]]:
+    """
+    Converts CoNLL formatted SRL tags (e.g. ["(ARG0*", "*)", "(V*)", "*"]) to a list of spans.
+    Each span is a tuple like (label, start index, end index), where the end index is inclusive.
+    """
+    res = []
+    label = None
+    start = None
+    for i, conll_label in enumerate(conll_labels):
+        if conll_label.startswith('('):
+            label = conll_label[1:conll_label.index('*')]
+            start = i
+        if conll_label.endswith(')') and label is not None:
+            res.append((label, start, i))
+            label = None
+    return res
+
+
 def write_conll_formatted_tags_to_file(prediction_file: TextIO,
                                        gold_file: TextIO,
                                        verb_index: int,
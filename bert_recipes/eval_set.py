@@ -0,0 +1,169 @@
+"""
+A fixed SRL evaluation set, converted to tensors once and re-used for every evaluation.
+"""
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import torch
+
+from childes_srl.io import load_srl_data, load_grouped_srl_data, group_propositions
+from bert_recipes.eval import convert_bio_tags_to_conll_format
+from bert_recipes.word_pieces import convert_words_to_wordpieces
+from bert_recipes.word_pieces import convert_bio_tags_to_wordpieces
+from bert_recipes.word_pieces import convert_verb_indices_to_wordpiece_indices
+
+
+class SrlEvalSet:
+    """
+    holds padded input tensors, start offsets, and gold tags (both BIO and CoNLL format) for each batch,
+     so that nothing needs to be re-computed when the same data is evaluated again.
+
+    propositions are sorted by number of word-pieces before batching, to minimize padding.
+    this does not change f1, which is computed over all propositions.
+
+    iterating yields tuples like (dict with tensors, dict with metadata), as expected by evaluate_model_on_f1().
+    """
+
+    version = 1  # increment when the format changes, to invalidate cached eval sets
+
+    def __init__(self,
+                 batches: List[Tuple[Dict[str, Any], Dict[str, List[Any]]]],
+                 ):
+        self.batches = batches
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __iter__(self) -> Iterator[Tuple[Dict[str, Any], Dict[str, List[Any]]]]:
+        return iter(self.batches)
+
+    @property
+    def num_propositions(self) -> int:
+        return sum([len(meta_data['in']) for _, meta_data in self.batches])
+
+    @classmethod
+    def from_propositions(cls,
+                          propositions: List[Tuple[List[str], int, List[str]]],
+                          wordpiece_tokenizer,
+                          srl_tag2id: Dict[str, int],
+                          batch_size: int,
+                          ) -> 'SrlEvalSet':
+        return cls.from_grouped_sentences(group_propositions(propositions), wordpiece_tokenizer, srl_tag2id, batch_size)
+
+    @classmethod
+    def from_grouped_sentences(cls,
+                               sentences: List[Tuple[List[str], List[Tuple[int, List[str]]]]],
+                               wordpiece_tokenizer,
+                               srl_tag2id: Dict[str, int],
+                               batch_size: int,
+                               ) -> 'SrlEvalSet':
+
+        # convert to word-piece ids once per sentence, and share them between its propositions
+        rows = []
+        for words, sentence_rows in sentences:
+            wordpieces, offsets, start_offsets = convert_words_to_wordpieces(words, wordpiece_tokenizer)
+            input_ids = [wordpiece_tokenizer.vocab[wp] for wp in wordpieces]
+            for predicate_index, tags in sentence_rows:
+                verb_indices = [int(i == predicate_index) for i in range(len(words))]
+                wordpiece_tags = convert_bio_tags_to_wordpieces(tags, offsets)
+                for tag in wordpiece_tags:
+                    if tag not in srl_tag2id:
+                        raise ValueError(f'Word-piece tag "{tag}" in "{" ".join(words)}" is not in srl_tag2id. '
+                                         f'Words split into multiple word-pieces need I- tags of every role')
+                rows.append({
+                    'input_ids': input_ids,
+                    'token_type_ids': convert_verb_indices_to_wordpiece_indices(verb_indices, offsets),
+                    'tags': [srl_tag2id[tag] for tag in wordpiece_tags],
+                    'start_offsets': start_offsets,
+                    'in': words,
+                    'verb_index': predicate_index,
+                    'gold_tags': tags,
+                    'gold_tags_conll': convert_bio_tags_to_conll_format(tags),
+                })
+
+        # batch propositions of similar length together, and pad
+        rows.sort(key=lambda row: len(row['input_ids']))
+        batches = []
+        for start in range(0, len(rows), batch_size):
+            batch_rows = rows[start: start + batch_size]
+            max_length = max([len(row['input_ids']) for row in batch_rows])
+            batch = {'task': 'srl'}
+            for k in ['input_ids', 'token_type_ids', 'tags']:
+                batch[k] = torch.zeros(len(batch_rows), max_length, dtype=torch.long)
+            batch['attention_mask'] = torch.zeros(len(batch_rows), max_length, dtype=torch.long)
+            for n, row in enumerate(batch_rows):
+                length = len(row['input_ids'])
+                for k in ['input_ids', 'token_type_ids', 'tags']:
+                    batch[k][n, :length] = torch.tensor(row[k], dtype=torch.long)
+                batch['attention_mask'][n, :length] = 1
+
+            meta_data = {k: [row[k] for row in batch_rows]
+                         for k in ['start_offsets', 'in', 'verb_index', 'gold_tags', 'gold_tags_conll']}
+            batches.append((batch, meta_data))
+
+        return cls(batches)
+
+    @classmethod
+    def from_file(cls,
+                  srl_path: Path,
+                  wordpiece_tokenizer,
+                  srl_tag2id: Dict[str, int],
+                  batch_size: int,
+                  cache_dir: Optional[Path] = None,
+                  grouped: bool = False,  # if True, srl_path is in the grouped format (one line per sentence)
+                  ) -> 'SrlEvalSet':
+        """
+        load eval set from cache_dir if it was previously made from the same data, tokenizer, and tags.
+        otherwise, make it and save it to cache_dir.
+        """
+
+        def make():
+            if grouped:
+                return cls.from_grouped_sentences(load_grouped_srl_data(srl_path),
+                                                  wordpiece_tokenizer, srl_tag2id, batch_size)
+            return cls.from_propositions(load_srl_data(srl_path), wordpiece_tokenizer, srl_tag2id, batch_size)
+
+        if cache_dir is None:
+            return make()
+
+        key = cls.make_cache_key(srl_path, wordpiece_tokenizer, srl_tag2id, batch_size)
+        cache_path = cache_dir / f'{srl_path.stem}_{key}.pt'
+        if cache_path.exists():
+            print(f'Loading eval set from {cache_path}')
+            return cls.load(cache_path)
+
+        res = make()
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        res.save(cache_path)
+        return res
+
+    @classmethod
+    def make_cache_key(cls,
+                       srl_path: Path,
+                       wordpiece_tokenizer,
+                       srl_tag2id: Dict[str, int],
+                       batch_size: int,
+                       ) -> str:
+        h = hashlib.sha1()
+        h.update(srl_path.read_bytes())
+        h.update(repr(sorted(wordpiece_tokenizer.vocab.items(), key=lambda i: i[1])).encode())
+        h.update(repr(sorted(srl_tag2id.items())).encode())
+        h.update(f'{batch_size} {cls.version}'.encode())
+        return h.hexdigest()[:16]
+
+    def save(self,
+             path: Path,
+             ) -> None:
+        tmp_path = path.with_suffix('.tmp')
+        torch.save({'version': self.version, 'batches': self.batches}, str(tmp_path))
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls,
+             path: Path,
+             ) -> 'SrlEvalSet':
+        d = torch.load(str(path))
+        if d['version'] != cls.version:
+            raise ValueError(f'Eval set at {path} has version {d["version"]} but expected {cls.version}')
+        return cls(d['batches'])
@@ -3,20 +3,22 @@ WARNING: Not intended to be used as-is.
 This file is a suggested recipe for training BERT jointly on MLM and SRL.
 
 """
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import time
 import numpy as np
 import torch
 import random
 import attr
-from itertools import cycle
 
 from childes_srl import configs
 from childes_srl.io import load_mlm_data
 from childes_srl.io import load_srl_data
 from bert_recipes.model import BertForMLMAndSRL
-from bert_recipes.eval import evaluate_model_on_f1
+from bert_recipes.eval import AsyncSrlEvaluator
+from bert_recipes.eval_set import SrlEvalSet
 from bert_recipes.decode import decode_mlm_batch_output
+from bert_recipes.checkpoint import AsyncCheckpointer, ResumableBatches
+from bert_recipes.checkpoint import snapshot_state, get_rng_states, set_rng_states
 
 
 @attr.s
@@ -25,10 +27,12 @@ class Params(object):
     num_mlm_epochs: number of times to re-visit MLM examples during training
     srl_probability: probability of training on SRL batch after training on MLM batch
     srl_interleaved: True if training jointly on SRL and MLM
+    resume: True if training should continue from the latest checkpoint, if one exists
     """
     num_mlm_epochs = attr.ib(validator=attr.validators.instance_of(int))
     srl_probability = attr.ib(validator=attr.validators.instance_of(float))
     srl_interleaved = attr.ib(validator=attr.validators.instance_of(bool))
+    resume = attr.ib(default=False, validator=attr.validators.instance_of(bool))
 
     @classmethod
     def from_dict(cls,
@@ -44,13 +48,20 @@ class Params(object):
         return cls(**kwargs)
 
 
-def main(params: Params):
+def main(params: Params,
+         wordpiece_tokenizer,  # e.g. huggingface transformers.BertTokenizer, with attribute vocab and method tokenize()
+         ):
 
     # load data
     path_to_mlm_data = configs.Dirs.data / 'pre_processed' / f'childes-20191206_mlm.txt'
     path_to_srl_data = configs.Dirs.data / 'pre_processed' / f'childes-20191206_no-dev_srl.txt'
+    path_to_dev_srl_data = configs.Dirs.data / 'pre_processed' / f'human-based-2018_srl.txt'
     data_mlm = load_mlm_data(path_to_mlm_data)
     data_srl = load_srl_data(path_to_srl_data)
+    data_dev_srl = load_srl_data(path_to_dev_srl_data)
+    # tags are of word-pieces: a role which only ever covers one word (e.g. V) has I- tags for words split into pieces
+    roles = sorted({tag[2:] for _, _, tags in data_srl + data_dev_srl for tag in tags if tag != 'O'})
+    id2srl_tag = dict(enumerate(['O'] + [f'{bio}-{role}' for role in roles for bio in 'BI']))
 
     def to_batches(data: List[Any]) -> List[Any]:
         raise NotImplementedError
@@ -69,15 +80,25 @@ def main(params: Params):
             "attention_mask": attention_mask,  # for decoding BIO SRL tags
             'start_offsets': [],  # for decoding BIO SRL tags
             'in': [],  # for decoding MLM tags
+            'verb_index': [],  # for computing f1 score
             'gold_tags': [],  # for computing f1 score
         }
         raise NotImplementedError
 
-    # make generators yielding tuples like (dict with tensors for training, dict with metadata for decoding)
-    batches_mlm = ((to_tensors(batch), to_meta_data(batch)) for batch in to_batches(data_mlm))
-    batches_srl = ((to_tensors(batch), to_meta_data(batch)) for batch in to_batches(data_srl))
+    def to_tensors_and_meta_data(batch: List[Any]) -> Tuple[Dict[str, torch.Tensor], Dict[str, Any]]:
+        return to_tensors(batch), to_meta_data(batch)
 
-    batches_srl = cycle(batches_srl)  # should be infinite generator
+    # make iterators yielding tuples like (dict with tensors for training, dict with metadata for decoding).
+    # their position is saved in checkpoints, so that a resumed run continues with the same batches
+    batches_mlm = ResumableBatches(to_batches(data_mlm), transform=to_tensors_and_meta_data)
+    batches_srl = ResumableBatches(to_batches(data_srl), transform=to_tensors_and_meta_data,
+                                   infinite=True)  # should be infinite
+
+    # dev batches are converted to tensors once, and cached on disk for re-use by later runs
+    srl_tag2id = {tag: i for i, tag in id2srl_tag.items()}
+    batches_dev_srl = SrlEvalSet.from_file(path_to_dev_srl_data, wordpiece_tokenizer, srl_tag2id,
+                                           batch_size=configs.Example.eval_batch_size,
+                                           cache_dir=configs.Dirs.cache / 'eval_sets')
 
     bert_encoder = NotImplementedError  # TODO implement, e.g. hugginface transformers.BertModel
     model = BertForMLMAndSRL(bert_encoder,
@@ -85,11 +106,16 @@ def main(params: Params):
                              num_tags_srl,
                              ignore_token_id,
                              )
+    optimizer = torch.optim.Adam(model.parameters(), lr=configs.Example.learning_rate)
+
+    # evaluation happens in the background, on a copy of the weights at the step at which evaluation was requested
+    srl_eval_path = configs.Dirs.perl / 'srl-eval.pl'  # path to official perl script for scoring SRL
+    evaluator = AsyncSrlEvaluator(model, srl_eval_path, batches_dev_srl, id2srl_tag)
 
     # max step does not take into consideration number of unique SRL batches because it does not vary with num_masked.
     # the SRL batcher is infinite, and yields a batch with probability = srl_probability when interleaved = True,
     # or stop when max_step is reached when interleaved = False
-    num_train_mlm_batches = len(list(batches_mlm))
+    num_train_mlm_batches = len(batches_mlm)
     max_step = num_train_mlm_batches + (params.srl_probability * num_train_mlm_batches)
     print(f'Will stop training at global step={max_step:,}')
     print(flush=True)
@@ -98,7 +124,7 @@ def main(params: Params):
     evaluated_steps_srl = []
     evaluated_steps_mlm = []
     train_start = time.time()
-    train_f1 = None
+    dev_f1 = None
     loss_mlm = None
     no_mlm_batches = False
     step_mlm = 0
@@ -107,92 +133,169 @@ def main(params: Params):
     is_evaluated_at_current_step = False
     is_first_time_in_loop = True
 
-    while step_global < max_step:
-
-        # ####################################################################### TRAINING
-
-        if not is_first_time_in_loop:  # do not influence first evaluation by training on first batch
-            model.train()
-
-            # masked language modeling objective
-            try:
-                batch_mlm, _ = next(batches_mlm)
-            except StopIteration:
-                if params.srl_interleaved:
-                    break
-                else:
-                    no_mlm_batches = True
-            else:
-                # forward
-                output_mlm = model(**batch_mlm)
-                loss_mlm = output_mlm['loss']
-
-                # backward + scale gradient + optimizer step
-                loss_mlm.backward()
-                pass  # TODO implement
-
-                step_mlm += 1
-
-            # semantic role labeling objective
-            if (params.srl_interleaved and random.random() < params.srl_probability) or no_mlm_batches:
-                batch_srl, _ = next(batches_srl)
-                output_srl = model(**batch_srl)
-                loss_srl = output_srl['loss']
-
-                # backward + scale gradient + optimizer step
-                loss_srl.backward()
-                pass  # TODO implement
-
-                step_srl += 1
-
-        is_first_time_in_loop = False
+    # checkpointing
+    checkpointer = AsyncCheckpointer(configs.Dirs.checkpoints,
+                                     max_to_keep=configs.Example.max_checkpoints_to_keep)
+    checkpointed_step = None
+
+    def make_checkpoint() -> Dict[str, Any]:
+        return snapshot_state({
+            'model': model.state_dict(),
+            'optimizer': optimizer.state_dict(),
+            'batches_mlm': batches_mlm.state_dict(),
+            'batches_srl': batches_srl.state_dict(),
+            'rng_states': get_rng_states(),
+            'evaluator': evaluator.state_dict(),  # evaluations which were submitted but did not finish
+            'evaluated_steps_srl': evaluated_steps_srl,
+            'evaluated_steps_mlm': evaluated_steps_mlm,
+            'dev_f1': dev_f1,
+            'loss_mlm': loss_mlm,
+            'no_mlm_batches': no_mlm_batches,
+            'step_mlm': step_mlm,
+            'step_srl': step_srl,
+            'is_first_time_in_loop': is_first_time_in_loop,
+        })
+
+    # resume from checkpoint
+    checkpoint = checkpointer.load_latest() if params.resume else None
+    if checkpoint is not None:
+        model.load_state_dict(checkpoint['model'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        batches_mlm.load_state_dict(checkpoint['batches_mlm'])
+        batches_srl.load_state_dict(checkpoint['batches_srl'])
+        set_rng_states(checkpoint['rng_states'])
+        evaluator.load_state_dict(checkpoint['evaluator'])
+        evaluated_steps_srl = checkpoint['evaluated_steps_srl']
+        evaluated_steps_mlm = checkpoint['evaluated_steps_mlm']
+        dev_f1 = checkpoint['dev_f1']
+        loss_mlm = checkpoint['loss_mlm']
+        no_mlm_batches = checkpoint['no_mlm_batches']
+        step_mlm = checkpoint['step_mlm']
+        step_srl = checkpoint['step_srl']
+        is_first_time_in_loop = checkpoint['is_first_time_in_loop']
         step_global = step_mlm + step_srl
-
-        # ####################################################################### EVALUATION
-
-        # eval MLM
-        if step_mlm % configs.Example.eval_interval == 0 and step_mlm not in evaluated_steps_mlm:
-            evaluated_steps_mlm.append(step_mlm)
-            is_evaluated_at_current_step = True
-            model.eval()
-
-            # print out some MLM examples
-            filled_in_utterances = decode_mlm_batch_output(token_ids,
-                                                           logits,
-                                                           utterances,
-                                                           mask_token_id)
-            for u in filled_in_utterances:
-                print(u)
-
-        # eval SRL
-        if step_srl % configs.Example.eval_interval == 0 and step_srl not in evaluated_steps_srl:
-            evaluated_steps_srl.append(step_srl)
-            is_evaluated_at_current_step = True
-            model.eval()
-
-            # evaluate f1 on train data
-            srl_eval_path = configs.Dirs.perl / 'srl-eval.pl'  # path to official perl script for scoring SRL
-            train_f1 = evaluate_model_on_f1(model, srl_eval_path, batches_srl)
-            print(f'train-f1={train_f1}', flush=True)
-
-        # console
-        if is_evaluated_at_current_step or step_global % configs.Example.feedback_interval == 0:
-            min_elapsed = (time.time() - train_start) // 60
-            pp = torch.exp(loss_mlm) if loss_mlm is not None else np.nan
-            print(f'step MLM={step_mlm:>9,} | step SRL={step_srl:>9,} | step global={step_global:>9,}\n'
-                  f'pp={pp :2.4f} \n'
-                  f'total minutes elapsed={min_elapsed:<3}\n', flush=True)
-            is_evaluated_at_current_step = False
-
-    return train_f1
-
-
-if __name__ == '__main':
+        checkpointed_step = step_global
+        print(f'Resuming training at global step={step_global:,}')
+        del checkpoint
+
+    try:
+        while step_global < max_step:
+
+            # ####################################################################### TRAINING
+
+            if not is_first_time_in_loop:  # do not influence first evaluation by training on first batch
+                model.train()
+
+                # masked language modeling objective
+                try:
+                    batch_mlm, _ = next(batches_mlm)
+                except StopIteration:
+                    if params.srl_interleaved:
+                        break
+                    else:
+                        no_mlm_batches = True
+                else:
+                    # forward
+                    output_mlm = model(**batch_mlm)
+                    loss_mlm = output_mlm['loss']
+
+                    # backward + scale gradient + optimizer step
+                    loss_mlm.backward()
+                    torch.nn.utils.clip_grad_norm_(model.parameters(), configs.Example.max_grad_norm)
+                    optimizer.step()
+                    optimizer.zero_grad()
+
+                    step_mlm += 1
+
+                # semantic role labeling objective
+                if (params.srl_interleaved and random.random() < params.srl_probability) or no_mlm_batches:
+                    batch_srl, _ = next(batches_srl)
+                    output_srl = model(**batch_srl)
+                    loss_srl = output_srl['loss']
+
+                    # backward + scale gradient + optimizer step
+                    loss_srl.backward()
+                    torch.nn.utils.clip_grad_norm_(model.parameters(), configs.Example.max_grad_norm)
+                    optimizer.step()
+                    optimizer.zero_grad()
+
+                    step_srl += 1
+
+            is_first_time_in_loop = False
+            step_global = step_mlm + step_srl
+
+            # ####################################################################### EVALUATION
+
+            # eval MLM
+            if step_mlm % configs.Example.eval_interval == 0 and step_mlm not in evaluated_steps_mlm:
+                evaluated_steps_mlm.append(step_mlm)
+                is_evaluated_at_current_step = True
+                model.eval()
+
+                # print out some MLM examples
+                filled_in_utterances = decode_mlm_batch_output(token_ids,
+                                                               logits,
+                                                               utterances,
+                                                               mask_token_id)
+                for u in filled_in_utterances:
+                    print(u)
+
+            # eval SRL
+            # a step counts as evaluated only when its result is returned, so that a checkpoint made before then
+            # stores the evaluation as pending, and a resumed run re-submits it
+            if (step_srl % configs.Example.eval_interval == 0 and step_srl not in evaluated_steps_srl
+                    and step_srl not in evaluator.pending_steps):
+                is_evaluated_at_current_step = True
+
+                # evaluate f1 on dev data - training continues while a snapshot of the weights is evaluated
+                evaluator.submit(step_srl, model)
+
+            # collect results of evaluations that have finished since the last step
+            for step_evaluated, dev_f1 in evaluator.get_results():
+                evaluated_steps_srl.append(step_evaluated)
+                print(f'step SRL={step_evaluated:>9,} | dev-f1={dev_f1}', flush=True)
+
+            # console
+            if is_evaluated_at_current_step or step_global % configs.Example.feedback_interval == 0:
+                min_elapsed = (time.time() - train_start) // 60
+                pp = torch.exp(loss_mlm) if loss_mlm is not None else np.nan
+                print(f'step MLM={step_mlm:>9,} | step SRL={step_srl:>9,} | step global={step_global:>9,}\n'
+                      f'pp={pp :2.4f} \n'
+                      f'total minutes elapsed={min_elapsed:<3}\n', flush=True)
+                is_evaluated_at_current_step = False
+
+            # ####################################################################### CHECKPOINTING
+
+            # saved at the end of an iteration, so that a resumed run continues with the next iteration.
+            # only the snapshot (copying to CPU) happens here - writing to disk happens in the background
+            if step_global % configs.Example.checkpoint_interval == 0 and step_global != checkpointed_step:
+                checkpointed_step = step_global
+                checkpointer.save(step_global, make_checkpoint())
+
+    finally:
+        # background threads are stopped even if training fails, after finishing pending checkpoints and evaluations
+        try:
+            checkpointer.close()
+        finally:
+            remaining_results = evaluator.close()
+
+    for step_evaluated, dev_f1 in remaining_results:
+        evaluated_steps_srl.append(step_evaluated)
+        print(f'step SRL={step_evaluated:>9,} | dev-f1={dev_f1}', flush=True)
+
+    return dev_f1
+
+
+if __name__ == '__main__':
 
     param2val = {'num_mlm_epochs': 1,
                  'srl_probability': 1.0,
                  'srl_interleaved': True,
+                 'resume': False,
                  }
 
-    train_f1 = main(Params.from_dict(param2val))
-    print(f'Finished training. End-of-training f1 on train data = {train_f1}')
\ No newline at end of file
+    from transformers import BertTokenizer
+    wordpiece_tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')  # must match vocabulary of bert_encoder
+
+    dev_f1 = main(Params.from_dict(param2val), wordpiece_tokenizer)
+    print(f'Finished training. End-of-training f1 on dev data = {dev_f1}')
\ No newline at end of file
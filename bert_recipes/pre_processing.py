@@ -1,10 +1,41 @@
-from typing import List, Tuple
+"""
+Make AllenNLP instances for SRL, with BERT word-pieces as input.
 
-from training.word_pieces import(
+Functions which take self are meant to be methods of a dataset reader
+ with attributes wordpiece_tokenizer and token_indexers.
+Instances are not kept in memory: SrlInstanceSource holds word-piece ids, offsets and tag ids of the corpus
+ in flat arrays, and rebuilds the instances each time it is iterated over (e.g. once per epoch).
+AllenNLP is imported only when instances are made, so that stand-ins for its classes (childes_srl.stubs) can be used
+ without it.
+"""
+import hashlib
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from bert_recipes.word_pieces import (
     convert_words_to_wordpieces,
     convert_bio_tags_to_wordpieces,
     convert_verb_indices_to_wordpiece_indices
 )
+from childes_srl.io import group_propositions, load_srl_data, load_grouped_srl_data
+
+if TYPE_CHECKING:
+    from allennlp.data.instance import Instance
+
+
+def load_allennlp_data_classes() -> SimpleNamespace:
+    """the AllenNLP classes which instances are made of"""
+    from allennlp.data.fields import MetadataField, SequenceLabelField, TextField
+    from allennlp.data.instance import Instance
+    from allennlp.data.tokenizers import Token
+    return SimpleNamespace(Instance=Instance,
+                           TextField=TextField,
+                           SequenceLabelField=SequenceLabelField,
+                           MetadataField=MetadataField,
+                           Token=Token)
 
 
 def make_verb_indices(proposition):
@@ -22,20 +53,26 @@ def make_verb_indices(proposition):
     return res
 
 
-def _text_to_instance(self,
-                      srl_in: List[str],
-                      srl_verb_indices: List[int],
-                      srl_tags: List[str],
-                      ) -> Instance:
+def make_instance(srl_in: List[str],
+                  srl_verb_indices: List[int],
+                  srl_tags: List[str],
+                  srl_in_wp: List[str],
+                  wordpiece_ids: List[int],
+                  offsets: List[int],
+                  start_offsets: List[int],
+                  token_indexers,
+                  data_classes: Optional[SimpleNamespace] = None,  # defaults to load_allennlp_data_classes()
+                  ) -> 'Instance':
+    """make instance from a proposition, and the word-pieces of its sentence"""
+    if data_classes is None:
+        data_classes = load_allennlp_data_classes()
 
-    # to word-pieces
-    srl_in_wp, offsets, start_offsets = convert_words_to_wordpieces(srl_in, self.wordpiece_tokenizer)
     srl_tags_wp = convert_bio_tags_to_wordpieces(srl_tags, offsets)
     verb_indices_wp = convert_verb_indices_to_wordpiece_indices(srl_verb_indices, offsets)
 
     # compute verb
     verb_index = srl_verb_indices.index(1)
-    verb = srl_in_wp[verb_index]
+    verb = srl_in[verb_index]
 
     # metadata only has whole words
     metadata_dict = dict()
@@ -47,37 +84,217 @@ def _text_to_instance(self,
     metadata_dict['gold_tags_wp'] = srl_tags_wp
 
     # fields
-    tokens = [Token(t, text_id=self.wordpiece_tokenizer.vocab[t]) for t in srl_in_wp]
-    text_field = TextField(tokens, self.token_indexers)
+    tokens = [data_classes.Token(t, text_id=i) for t, i in zip(srl_in_wp, wordpiece_ids)]
+    text_field = data_classes.TextField(tokens, token_indexers)
 
     fields = {'tokens': text_field,
-              'indicator': SequenceLabelField(verb_indices_wp, text_field),
-              'tags': SequenceLabelField(srl_tags_wp, text_field),
-              'metadata': MetadataField(metadata_dict)}
+              'indicator': data_classes.SequenceLabelField(verb_indices_wp, text_field),
+              'tags': data_classes.SequenceLabelField(srl_tags_wp, text_field),
+              'metadata': data_classes.MetadataField(metadata_dict)}
+
+    return data_classes.Instance(fields)
+
+
+def _text_to_instance(self,
+                      srl_in: List[str],
+                      srl_verb_indices: List[int],
+                      srl_tags: List[str],
+                      wordpiece_conversion: Optional[Tuple[List[str], List[int], List[int]]] = None,
+                      ) -> 'Instance':
+    """
+    wordpiece_conversion: output of convert_words_to_wordpieces(srl_in), if it was computed for the same sentence before
+    """
+
+    # to word-pieces
+    if wordpiece_conversion is None:
+        wordpiece_conversion = convert_words_to_wordpieces(srl_in, self.wordpiece_tokenizer)
+    srl_in_wp, offsets, start_offsets = wordpiece_conversion
+    wordpiece_ids = [self.wordpiece_tokenizer.vocab[t] for t in srl_in_wp]
+
+    return make_instance(srl_in, srl_verb_indices, srl_tags,
+                         srl_in_wp, wordpiece_ids, offsets, start_offsets,
+                         self.token_indexers)
+
+
+class SrlInstanceSource:
+    """
+    re-iterable source of SRL instances, which are rebuilt from a compact encoding each time it is iterated over.
+
+    sentences (words, word-piece ids, and word-piece offsets of each word) are stored once,
+     and propositions (sentence, predicate index, and tag ids) refer to them.
+    all are stored in flat integer arrays, so memory is proportional to the size of the corpus,
+     not to the number of Python objects needed to represent its instances.
+    data_classes are the classes instances are made of (default: AllenNLP's), and may be replaced by stand-ins.
+    """
+
+    version = 2
+
+    def __init__(self,
+                 arrays: Dict[str, np.ndarray],
+                 vocab: List[str],
+                 tag_vocab: List[str],
+                 id2wordpiece: List[str],
+                 token_indexers,
+                 data_classes: Optional[SimpleNamespace] = None,
+                 ):
+        self.arrays = arrays
+        self.vocab = vocab
+        self.tag_vocab = tag_vocab
+        self.id2wordpiece = id2wordpiece
+        self.token_indexers = token_indexers
+        self.data_classes = data_classes
+
+    def __len__(self) -> int:
+        return len(self.arrays['prop_sentence_ids'])
+
+    @property
+    def num_sentences(self) -> int:
+        return len(self.arrays['word_offsets']) - 1
+
+    def __iter__(self) -> Iterator['Instance']:
+        a = self.arrays
+        data_classes = self.data_classes if self.data_classes is not None else load_allennlp_data_classes()
+        tag_offsets = a['prop_tag_offsets'].tolist()
+        for sentence_id, predicate_index, tag_start, tag_end in zip(a['prop_sentence_ids'].tolist(),
+                                                                    a['prop_predicate_indices'].tolist(),
+                                                                    tag_offsets[:-1],
+                                                                    tag_offsets[1:]):
+            word_start, word_end = a['word_offsets'][sentence_id: sentence_id + 2].tolist()
+            wp_start, wp_end = a['wordpiece_offsets'][sentence_id: sentence_id + 2].tolist()
+            num_words = word_end - word_start
+
+            srl_in = [self.vocab[i] for i in a['word_ids'][word_start: word_end].tolist()]
+            srl_tags = [self.tag_vocab[i] for i in a['tag_ids'][tag_start: tag_end].tolist()]
+            wordpiece_ids = a['wordpiece_ids'][wp_start: wp_end].tolist()
+            srl_in_wp = [self.id2wordpiece[i] for i in wordpiece_ids]
+            srl_verb_indices = [int(i == predicate_index) for i in range(num_words)]
+
+            yield make_instance(srl_in, srl_verb_indices, srl_tags,
+                                srl_in_wp, wordpiece_ids,
+                                a['end_offsets'][word_start: word_end].tolist(),
+                                a['start_offsets'][word_start: word_end].tolist(),
+                                self.token_indexers,
+                                data_classes)
+
+    @classmethod
+    def from_grouped_sentences(cls,
+                               sentences: List[Tuple[List[str], List[Tuple[int, List[str]]]]],
+                               wordpiece_tokenizer,
+                               token_indexers,
+                               ) -> 'SrlInstanceSource':
+        word2id = {}
+        tag2id = {}
+        lists = {name: [] for name in ['word_ids', 'end_offsets', 'start_offsets', 'wordpiece_ids',
+                                       'prop_sentence_ids', 'prop_predicate_indices', 'tag_ids']}
+        word_offsets = [0]
+        wordpiece_offsets = [0]
+        prop_tag_offsets = [0]
+        for sentence_id, (words, rows) in enumerate(sentences):
+
+            # word-pieces are computed once per sentence, and shared by all its propositions
+            srl_in_wp, offsets, start_offsets = convert_words_to_wordpieces(words, wordpiece_tokenizer)
+            lists['word_ids'] += [word2id.setdefault(w, len(word2id)) for w in words]
+            lists['end_offsets'] += offsets
+            lists['start_offsets'] += start_offsets
+            lists['wordpiece_ids'] += [wordpiece_tokenizer.vocab[wp] for wp in srl_in_wp]
+            word_offsets.append(len(lists['word_ids']))
+            wordpiece_offsets.append(len(lists['wordpiece_ids']))
 
-    return Instance(fields)
+            for predicate_index, tags in rows:
+                assert len(tags) == len(words)
+                make_verb_indices((words, predicate_index, tags))  # raises if predicate index is out of bounds
+                lists['prop_sentence_ids'].append(sentence_id)
+                lists['prop_predicate_indices'].append(predicate_index)
+                lists['tag_ids'] += [tag2id.setdefault(t, len(tag2id)) for t in tags]
+                prop_tag_offsets.append(len(lists['tag_ids']))
+
+        arrays = {name: np.array(values, dtype=np.int32) for name, values in lists.items()}
+        arrays['word_offsets'] = np.array(word_offsets, dtype=np.int64)
+        arrays['wordpiece_offsets'] = np.array(wordpiece_offsets, dtype=np.int64)
+        arrays['prop_tag_offsets'] = np.array(prop_tag_offsets, dtype=np.int64)
+
+        id2wordpiece = [wp for wp, _ in sorted(wordpiece_tokenizer.vocab.items(), key=lambda i: i[1])]
+        return cls(arrays, list(word2id), list(tag2id), id2wordpiece, token_indexers)
+
+    @classmethod
+    def from_propositions(cls,
+                          propositions: List[Tuple[List[str], int, List[str]]],
+                          wordpiece_tokenizer,
+                          token_indexers,
+                          ) -> 'SrlInstanceSource':
+        return cls.from_grouped_sentences(group_propositions(propositions), wordpiece_tokenizer, token_indexers)
+
+    @classmethod
+    def from_file(cls,
+                  srl_path: Path,
+                  wordpiece_tokenizer,
+                  token_indexers,
+                  cache_dir: Optional[Path] = None,
+                  grouped: bool = False,  # if True, srl_path is in the grouped format (one line per sentence)
+                  ) -> 'SrlInstanceSource':
+        """
+        load the encoding from cache_dir if it was previously made from the same data and tokenizer.
+        otherwise, make it and save it to cache_dir.
+        """
+
+        def make():
+            if grouped:
+                return cls.from_grouped_sentences(load_grouped_srl_data(srl_path), wordpiece_tokenizer, token_indexers)
+            return cls.from_propositions(load_srl_data(srl_path), wordpiece_tokenizer, token_indexers)
+
+        if cache_dir is None:
+            return make()
+
+        h = hashlib.sha1()
+        with srl_path.open('rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        h.update(repr(sorted(wordpiece_tokenizer.vocab.items(), key=lambda i: i[1])).encode())
+        h.update(f'{grouped} {cls.version}'.encode())
+        cache_path = cache_dir / f'{srl_path.stem}_instances_{h.hexdigest()[:16]}.npz'
+        if cache_path.exists():
+            print(f'Loading encoded instances from {cache_path}')
+            return cls.load(cache_path, token_indexers)
+
+        res = make()
+        res.save(cache_path)
+        return res
+
+    def save(self,
+             path: Path,
+             ) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp.npz')
+        np.savez(str(tmp_path),
+                 version=np.array(self.version),
+                 vocab=np.array(self.vocab, dtype=np.str_),
+                 tag_vocab=np.array(self.tag_vocab, dtype=np.str_),
+                 id2wordpiece=np.array(self.id2wordpiece, dtype=np.str_),
+                 **self.arrays)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls,
+             path: Path,
+             token_indexers,
+             ) -> 'SrlInstanceSource':
+        d = np.load(str(path))
+        if int(d['version']) != cls.version:
+            raise ValueError(f'Encoded instances at {path} have version {int(d["version"])} but expected {cls.version}')
+        arrays = {name: d[name] for name in d.files if name not in {'version', 'vocab', 'tag_vocab', 'id2wordpiece'}}
+        return cls(arrays, d['vocab'].tolist(), d['tag_vocab'].tolist(), d['id2wordpiece'].tolist(), token_indexers)
 
 
 def make_instances(self, propositions: List[Tuple[List[str], int, List[str]]],
-                   ) -> List[Instance]:
+                   ) -> SrlInstanceSource:
     """
     roughly equivalent to Allen NLP toolkit dataset.read().
-    return a list rather than a generator,
+    return a re-iterable source rather than a generator,
      because DataIterator requires being able to iterate multiple times to implement multiple epochs.
-
+    instances are rebuilt from a compact encoding in each iteration, rather than kept in memory.
     """
-    res = []
-    for proposition in propositions:
-        srl_in = proposition[0]
-        srl_verb_indices = self.make_verb_indices(proposition)
-        srl_tags = proposition[2]
-
-        # to instance
-        instance = self._text_to_instance(srl_in,
-                                          srl_verb_indices,
-                                          srl_tags)
-        res.append(instance)
+    res = SrlInstanceSource.from_propositions(propositions, self.wordpiece_tokenizer, self.token_indexers)
 
     print(f'Made {len(res):>9,} SRL instances')
 
-    return res
\ No newline at end of file
+    return res
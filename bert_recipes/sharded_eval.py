@@ -0,0 +1,79 @@
+"""
+Score predicted SRL tags against gold SRL tags in parallel.
+
+Both files must have the same format as the pre-processed SRL data, with one line per proposition,
+and must list the same propositions in the same order.
+The propositions are split into shards, each shard is scored by srl-eval.pl in a separate process,
+and the counts are summed, which gives the same result as scoring all propositions at once.
+"""
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, List
+
+from childes_srl.io import parse_srl_line
+from bert_recipes.eval import SrlEvalScorer, convert_bio_tags_to_conll_format
+
+
+def score_shard(srl_eval_path: Path,
+                gold_lines: List[str],
+                predicted_lines: List[str],
+                ) -> Dict[str, Dict[str, int]]:
+    """
+    return scorer state (counts of true positives, false positives, and false negatives per tag) for one shard.
+    """
+
+    batch_verb_indices = []
+    batch_sentences = []
+    batch_conll_predicted_tags = []
+    batch_conll_gold_tags = []
+    for gold_line, predicted_line in zip(gold_lines, predicted_lines):
+        words, verb_index, gold_tags = parse_srl_line(gold_line)
+        predicted_words, _, predicted_tags = parse_srl_line(predicted_line)
+        if predicted_words != words:
+            raise ValueError(f'Gold and predicted propositions are not aligned:\n{gold_line}\n{predicted_line}')
+
+        batch_verb_indices.append(verb_index)
+        batch_sentences.append(words)
+        batch_conll_predicted_tags.append(convert_bio_tags_to_conll_format(predicted_tags))
+        batch_conll_gold_tags.append(convert_bio_tags_to_conll_format(gold_tags))
+
+    scorer = SrlEvalScorer(srl_eval_path, ignore_classes=['V'])
+    scorer(batch_verb_indices,
+           batch_sentences,
+           batch_conll_predicted_tags,
+           batch_conll_gold_tags)
+
+    return scorer.state_dict()
+
+
+def evaluate_srl_files(srl_eval_path: Path,
+                       gold_path: Path,
+                       predicted_path: Path,
+                       num_workers: int = 4,
+                       shard_size: int = 1000,  # number of propositions per shard
+                       ) -> Dict[str, Dict[str, float]]:
+    """
+    return f1, precision, and recall for each tag, computed over all propositions in gold_path and predicted_path.
+    """
+
+    gold_lines = [line for line in gold_path.read_text().split('\n') if line]
+    predicted_lines = [line for line in predicted_path.read_text().split('\n') if line]
+    if len(gold_lines) != len(predicted_lines):
+        raise ValueError(f'Found {len(gold_lines)} gold propositions but {len(predicted_lines)} predicted')
+
+    shards = [(srl_eval_path, gold_lines[start: start + shard_size], predicted_lines[start: start + shard_size])
+              for start in range(0, len(gold_lines), shard_size)]
+    print(f'Scoring {len(gold_lines):,} propositions in {len(shards)} shards with {num_workers} workers')
+
+    if num_workers == 1:
+        shard_states = [score_shard(*shard) for shard in shards]
+    else:
+        with Pool(num_workers) as pool:
+            shard_states = pool.starmap(score_shard, shards)
+
+    # reduce
+    scorer = SrlEvalScorer(srl_eval_path, ignore_classes=['V'])
+    for state in shard_states:
+        scorer.merge(state)
+
+    return scorer.get_tag2metrics()
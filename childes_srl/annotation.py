@@ -0,0 +1,312 @@
+"""
+Annotate CHILDES utterances with semantic role labels, using the AllenNLP SRL tagger.
+
+Utterances are processed in chunks, and each chunk passes through these stages:
+1) look-up of utterances that were annotated before (in the chunk, or in a persistent cache)
+2) segmentation of utterances into well-formed sentences (DeepSegment), in batches.
+   the model is skipped for utterances which are trivially a single sentence, or were segmented before
+3) POS-tagging, and making one instance for each verb (spaCy)
+4) SRL inference in batches of instances with similar length (AllenNLP)
+5) storing new annotations in the cache, and assembling annotations of all utterances in the chunk
+Each stage runs in its own pool of workers, so that all stages are busy at the same time.
+Only unique utterances that are not in the cache pass through stages 2-4.
+"""
+import threading
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+
+from childes_srl.pipeline import Stage, run_pipeline, run_sequentially
+from childes_srl.utterance_cache import UtteranceCache
+from childes_srl.tagging import tag_pretokenized, get_verb_indices
+
+SENTENCE_FINAL_PUNCTUATION = {'.', '?', '!'}
+
+
+def is_single_sentence(words: List[str],
+                       max_length: int,
+                       ) -> bool:
+    """
+    True if utterance is so short, and has no punctuation except at its end, that it need not be segmented
+    """
+    if len(words) <= 1:
+        return True  # DeepSegment never splits before the first word
+    if len(words) > max_length:
+        return False
+    return not SENTENCE_FINAL_PUNCTUATION.intersection(words[:-1]) and words[-1] in SENTENCE_FINAL_PUNCTUATION
+
+
+def sanitize_outputs(output_dicts: List[Dict[str, Any]],
+                     ) -> List[Dict[str, Any]]:
+    """
+    convert tensors and arrays in model outputs to Python types.
+    AllenNLP is imported only here, because outputs of the stand-in model (childes_srl.stubs) are Python types already,
+     and it need not be installed to use the stand-in.
+    """
+    try:
+        from allennlp.common.util import sanitize
+    except ImportError:
+        return output_dicts
+    return sanitize(output_dicts)
+
+
+def make_srl_line(output_dict: Dict[str, Any],
+                  ) -> Tuple[Optional[str], Optional[str]]:
+    """
+    return a line in the format of the pre-processed SRL data,
+     or None and the reason why the prediction is skipped.
+    """
+    tags = output_dict['tags']
+    words = output_dict['words']
+
+    # sometimes there is no B-V
+    if 'B-V' not in tags:
+        return None, 'no_verb'
+
+    # sometimes there is only a verb but no arguments (e.g. auxiliary word) - skip
+    if not [tag for tag in tags if 'ARG' in tag]:
+        return None, 'only_verb'
+
+    # make line
+    verb_index = tags.index('B-V')
+    x_string = " ".join(words)
+    y_string = " ".join(tags)
+    line = f'{verb_index} {x_string} ||| {y_string}'
+
+    return line, None
+
+
+class SrlAnnotator:
+    """
+    annotate() yields one dict per chunk of utterances, in the order of the utterances, with keys:
+    'start': index of first utterance in chunk
+    'end': index of first utterance after chunk
+    'utterances': utterances in chunk
+    'lines': for each utterance, a list of lines (one per verb for which a valid prediction was made)
+    'num_no_verb', 'num_only_verb': number of skipped predictions
+    """
+
+    def __init__(self,
+                 predictor,
+                 segmenter,
+                 batch_size: int = 128,
+                 look_ahead: int = 8,  # number of batches whose instances are sorted by length together
+                 tagging_batch_size: int = 1000,
+                 segmentation_batch_size: int = 256,
+                 max_trivial_length: int = 4,  # utterances up to this length may skip segmentation. 0: never skip
+                 segmentation_memo_size: int = 1_000_000,  # max number of segmentations kept in memory
+                 chunk_size: int = 1024,  # number of utterances per chunk
+                 num_segmentation_workers: int = 1,
+                 num_tagging_workers: int = 1,
+                 num_srl_workers: int = 1,
+                 queue_size: int = 4,
+                 cache: Optional[UtteranceCache] = None,
+                 ):
+        self.predictor = predictor
+        self.segmenter = segmenter
+        self.batch_size = batch_size
+        self.look_ahead = look_ahead
+        self.tagging_batch_size = tagging_batch_size
+        self.segmentation_batch_size = segmentation_batch_size
+        self.max_trivial_length = max_trivial_length
+        self.segmentation_memo_size = segmentation_memo_size
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.cache = cache
+
+        # look-up and storing must each run in a single worker, because they update the counts below
+        self.stages = [
+            Stage('look-up', self.look_up, 1),
+            Stage('segmentation', self.segment, num_segmentation_workers),
+            Stage('tagging', self.make_instances, num_tagging_workers),
+            Stage('srl', self.predict, num_srl_workers),
+            Stage('storing', self.store, 1),
+        ]
+
+        self.num_utterances = 0
+        self.num_cache_hits = 0  # utterances annotated in a previous run
+        self.num_duplicates = 0  # utterances annotated earlier in the same chunk
+        self.num_annotated = 0  # utterances passed through the models
+
+        # segmentation of unique utterances which are not in the cache - updated by possibly multiple workers
+        self.text2segments = {}
+        self.num_segmentation_bypassed = 0  # trivially a single sentence
+        self.num_segmentation_memo_hits = 0  # segmented earlier in the same run
+        self.num_segmented = 0  # passed through the segmentation model
+        self._segmentation_lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        """fraction of utterances that did not need to be passed through the models"""
+        return 1 - self.num_annotated / self.num_utterances if self.num_utterances else 0.0
+
+    @property
+    def segmentation_bypass_rate(self) -> float:
+        """fraction of utterances that needed segmentation, but did not need to be passed through the model"""
+        num_bypassed = self.num_segmentation_bypassed + self.num_segmentation_memo_hits
+        num_total = num_bypassed + self.num_segmented
+        return num_bypassed / num_total if num_total else 0.0
+
+    def gen_chunks(self,
+                   utterances: List[List[str]],
+                   is_completed: Optional[Callable[[int, int], bool]] = None,
+                   ) -> Generator[Dict[str, Any], None, None]:
+        for start in range(0, len(utterances), self.chunk_size):
+            end = min(start + self.chunk_size, len(utterances))
+            if is_completed is not None and is_completed(start, end):
+                continue
+            yield {'start': start,
+                   'end': end,
+                   'utterances': utterances[start: end]}
+
+    def annotate(self,
+                 utterances: List[List[str]],
+                 sequential: bool = False,
+                 is_completed: Optional[Callable[[int, int], bool]] = None,  # to skip chunks done in a previous run
+                 ) -> Generator[Dict[str, Any], None, None]:
+        chunks = self.gen_chunks(utterances, is_completed)
+        if sequential:
+            yield from run_sequentially(chunks, self.stages)
+        else:
+            yield from run_pipeline(chunks, self.stages,
+                                    queue_size=self.queue_size,
+                                    max_in_flight=self.queue_size * (len(self.stages) + 1))
+
+    # ############################################################## stages
+
+    def look_up(self,
+                chunk: Dict[str, Any],
+                ) -> Dict[str, Any]:
+        """find unique utterances which are not in the cache. only those are passed through the models"""
+        texts = [' '.join(u) for u in chunk['utterances']]
+        unique = list(dict.fromkeys(texts))
+        cached = self.cache.get_many(unique) if self.cache is not None else {}
+        chunk['texts'] = texts
+        chunk['cached'] = cached
+        chunk['todo'] = [text for text in unique if text not in cached]
+
+        num_hits = len([text for text in texts if text in cached])
+        self.num_utterances += len(texts)
+        self.num_cache_hits += num_hits
+        self.num_duplicates += len(texts) - num_hits - len(chunk['todo'])
+        self.num_annotated += len(chunk['todo'])
+        return chunk
+
+    def segment(self,
+                chunk: Dict[str, Any],
+                ) -> Dict[str, Any]:
+        """possibly segment each utterance into multiple well-formed sentences"""
+        text2segments = {}
+        num_bypassed = 0
+        num_memo_hits = 0
+        for text in chunk['todo']:
+            if text in self.text2segments:
+                text2segments[text] = self.text2segments[text]
+                num_memo_hits += 1
+            elif is_single_sentence(text.split(), self.max_trivial_length):
+                text2segments[text] = [text]
+                num_bypassed += 1
+
+        # segment remaining utterances in batches of utterances with similar length, to reduce padding
+        texts = sorted([text for text in chunk['todo'] if text not in text2segments], key=lambda t: len(t.split()))
+        for start in range(0, len(texts), self.segmentation_batch_size):
+            batch = texts[start: start + self.segmentation_batch_size]
+            # batch_size is a keyword of DeepSegment.segment() since deepsegment 2.3.1 (default: 32)
+            for text, segments in zip(batch, self.segmenter.segment(batch, batch_size=len(batch))):
+                text2segments[text] = segments
+
+        with self._segmentation_lock:
+            for text in texts:
+                if len(self.text2segments) >= self.segmentation_memo_size:
+                    break
+                self.text2segments[text] = text2segments[text]
+            self.num_segmentation_bypassed += num_bypassed
+            self.num_segmentation_memo_hits += num_memo_hits
+            self.num_segmented += len(texts)
+
+        chunk['segments'] = [text2segments[text] for text in chunk['todo']]
+        return chunk
+
+    def make_instances(self,
+                       chunk: Dict[str, Any],
+                       ) -> Dict[str, Any]:
+        """
+        make one instance for each verb in each segment.
+        each instance is paired with its utterance's index, and with its number of tokens
+        """
+        utterance_ids = []
+        sentences = []
+        for utterance_id, segments in enumerate(chunk['segments']):
+            for segment in segments:
+                utterance_ids.append(utterance_id)
+                sentences.append(segment.split())
+
+        # POS-tagging of all segments in the chunk, in batches
+        docs = tag_pretokenized(self.predictor._tokenizer.spacy, sentences, batch_size=self.tagging_batch_size)
+
+        instances = []
+        for utterance_id, spacy_doc in zip(utterance_ids, docs):
+            for instance in self.gen_instances_from_doc(spacy_doc):
+                instances.append((utterance_id, len(spacy_doc), instance))
+        chunk['instances'] = instances
+        return chunk
+
+    def predict(self,
+                chunk: Dict[str, Any],
+                ) -> Dict[str, Any]:
+        """
+        get SRL predictions for each instance, in batches.
+
+        instances in a look-ahead window of several batches are sorted by length,
+         so that instances in the same batch need similar amounts of padding.
+        """
+        instances = chunk.pop('instances')
+        output_dicts = [None] * len(instances)
+        window_size = self.batch_size * self.look_ahead
+        for window_start in range(0, len(instances), window_size):
+            ids = sorted(range(window_start, min(window_start + window_size, len(instances))),
+                         key=lambda i: instances[i][1])
+            for start in range(0, len(ids), self.batch_size):
+                batch_ids = ids[start: start + self.batch_size]
+                res = self.predictor._model.forward_on_instances([instances[i][2] for i in batch_ids])
+                for i, d in zip(batch_ids, sanitize_outputs(res)):
+                    output_dicts[i] = d
+
+        # make a line for each instance, in the original order
+        annotations = [{'lines': [], 'num_no_verb': 0, 'num_only_verb': 0} for _ in chunk['todo']]
+        for (utterance_id, _, _), d in zip(instances, output_dicts):
+            line, reason = make_srl_line(d)
+            if line is None:
+                annotations[utterance_id][f'num_{reason}'] += 1
+            else:
+                annotations[utterance_id]['lines'].append(line)
+
+        chunk['annotations'] = annotations
+        return chunk
+
+    def store(self,
+              chunk: Dict[str, Any],
+              ) -> Dict[str, Any]:
+        """cache new annotations, and assign an annotation to every utterance, including duplicates"""
+        text2annotation = dict(zip(chunk.pop('todo'), chunk.pop('annotations')))
+        if self.cache is not None and text2annotation:
+            self.cache.put_many(text2annotation)
+        text2annotation.update(chunk.pop('cached'))
+
+        annotations = [text2annotation[text] for text in chunk.pop('texts')]
+        chunk['lines'] = [a['lines'] for a in annotations]
+        chunk['num_no_verb'] = sum([a['num_no_verb'] for a in annotations])
+        chunk['num_only_verb'] = sum([a['num_only_verb'] for a in annotations])
+        return chunk
+
+    # ############################################################## helpers
+
+    def gen_instances_from_doc(self,
+                               spacy_doc,
+                               ):
+        # to instances - one for each verb in utterance
+        tokens = [token for token in spacy_doc]
+        for i in get_verb_indices(spacy_doc):
+            verb_labels = [0 for _ in tokens]
+            verb_labels[i] = 1
+            instance = self.predictor._dataset_reader.text_to_instance(tokens, verb_labels)
+
+            yield instance
@@ -0,0 +1,188 @@
+"""
+Read and write text files compressed with gzip, xz or bz2, detected by extension (e.g. childes-20191206_srl.txt.gz).
+
+Compressed files are written in blocks of lines, each compressed as a separate member (gzip) or stream (xz, bz2).
+The standard decompressors read such files as a single file,
+ but because the offset of each block is saved in an index next to the file (e.g. childes-20191206_srl.txt.gz.idx),
+ blocks can also be decompressed independently, in parallel worker processes.
+"""
+import bz2
+import gzip
+import json
+import lzma
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Generator, List, Optional, TextIO, Tuple
+
+SUFFIX2MODULE = {'.gz': gzip, '.xz': lzma, '.bz2': bz2}
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix in SUFFIX2MODULE
+
+
+def get_index_path(path: Path) -> Path:
+    return path.with_name(path.name + '.idx')
+
+
+def make_tmp_path(path: Path) -> Path:
+    """path to write to before replacing path, with the same compression"""
+    if is_compressed(path):
+        return path.with_name(f'{path.stem}.tmp{path.suffix}')
+    return path.with_suffix('.tmp')
+
+
+def replace(tmp_path: Path,
+            path: Path,
+            ) -> None:
+    """move a file written to tmp_path, and its index, to path"""
+    tmp_path.replace(path)
+    if get_index_path(tmp_path).exists():
+        get_index_path(tmp_path).replace(get_index_path(path))
+    elif get_index_path(path).exists():  # the index of a previous version of the file
+        get_index_path(path).unlink()
+
+
+class BlockCompressedWriter:
+    """
+    text file, opened for writing, which compresses each block of about block_size characters (ending at a line end)
+     as a separate member, and saves the offsets of all members in an index when closed
+    """
+
+    version = 1
+
+    def __init__(self,
+                 path: Path,
+                 block_size: int = 1 << 22,
+                 ):
+        self.path = path
+        self.block_size = block_size
+        self.module = SUFFIX2MODULE[path.suffix]
+        self._file = path.open('wb')
+        self._buffer: List[str] = []
+        self._buffer_size = 0
+        self._blocks: List[Tuple[int, int]] = []  # offset and size of each member
+
+    def write(self, text: str) -> int:
+        self._buffer.append(text)
+        self._buffer_size += len(text)
+        if self._buffer_size >= self.block_size:
+            # a large write is split into multiple blocks. lines are not split across blocks
+            buffered = ''.join(self._buffer)
+            start = 0
+            while len(buffered) - start >= self.block_size:
+                end = buffered.rfind('\n', start, start + self.block_size) + 1
+                if end <= start:  # a line longer than block_size is a block of its own
+                    end = buffered.find('\n', start + self.block_size) + 1
+                    if end == 0:  # the line is not complete yet
+                        break
+                self._write_block(buffered[start: end])
+                start = end
+            self._buffer = [buffered[start:]]
+            self._buffer_size = len(self._buffer[0])
+        return len(text)
+
+    def _write_block(self, text: str) -> None:
+        data = self.module.compress(text.encode())
+        self._blocks.append((self._file.tell(), len(data)))
+        self._file.write(data)
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        text = ''.join(self._buffer)
+        if text or not self._blocks:  # an empty file is a single empty member, so that it can be decompressed
+            self._write_block(text)
+        file_size = self._file.tell()
+        self._file.close()
+        self._file = None
+        index = {'version': self.version, 'file_size': file_size, 'blocks': self._blocks}
+        get_index_path(self.path).write_text(json.dumps(index))
+
+    def __enter__(self) -> 'BlockCompressedWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def open_text(path: Path,
+              mode: str = 'r',  # 'r' or 'w'
+              block_size: int = 1 << 22,  # characters per compressed block, when writing
+              ) -> TextIO:
+    """open a text file, which is compressed if the extension of path is .gz, .xz or .bz2"""
+    if mode not in {'r', 'w'}:
+        raise ValueError(f'Unsupported mode: {mode}')
+    if not is_compressed(path):
+        return path.open(mode)
+    if mode == 'w':
+        return BlockCompressedWriter(path, block_size)
+    return SUFFIX2MODULE[path.suffix].open(path, 'rt')
+
+
+def load_block_index(path: Path) -> Optional[Dict]:
+    """index of a block-compressed file, or None if the file has no index, or the index is of a different file"""
+    index_path = get_index_path(path)
+    if not is_compressed(path) or not index_path.exists():
+        return None
+    index = json.loads(index_path.read_text())
+    if index['version'] != BlockCompressedWriter.version or index['file_size'] != path.stat().st_size:
+        return None
+    return index
+
+
+def read_text_range(path: Path,
+                    start: int,
+                    end: int,
+                    ) -> str:
+    """read bytes start to end of a file. for a compressed file, they must be whole blocks, which are decompressed"""
+    with path.open('rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if is_compressed(path):
+        data = SUFFIX2MODULE[path.suffix].decompress(data)
+    return data.decode()
+
+
+def gen_text_blocks(path: Path,
+                    num_workers: int = 1,
+                    max_pending: int = 8,  # per worker, to limit memory when blocks are consumed slowly
+                    chunk_size: int = 1 << 22,  # characters, for files without index
+                    ) -> Generator[str, None, None]:
+    """yield text of a file in order, in blocks which are decompressed in parallel if the file has an index"""
+    index = load_block_index(path)
+    if index is None:
+        with open_text(path) as f:
+            for text in iter(lambda: f.read(chunk_size), ''):
+                yield text
+        return
+
+    ranges = [(offset, offset + size) for offset, size in index['blocks']]
+    if num_workers == 1:
+        for start, end in ranges:
+            yield read_text_range(path, start, end)
+        return
+
+    with ProcessPoolExecutor(num_workers) as executor:
+        futures = deque()
+        for start, end in ranges:
+            futures.append(executor.submit(read_text_range, path, start, end))
+            if len(futures) >= num_workers * max_pending:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+def gen_lines(path: Path,
+              num_workers: int = 1,
+              ) -> Generator[str, None, None]:
+    """yield lines of a (compressed) text file, with line ends, like iterating over the file would"""
+    rest = ''
+    for text in gen_text_blocks(path, num_workers):
+        lines = (rest + text).split('\n')
+        rest = lines.pop()  # not ended by '\n' (yet)
+        for line in lines:
+            yield line + '\n'
+    if rest:
+        yield rest
@@ -5,7 +5,10 @@ class Dirs:
     root = Path(__file__).parent.parent
     data = root / 'data'
     data_tools = root / 'data_tools'
+    data_stats = root / 'data_stats'
     perl = root / 'perl'
+    checkpoints = root / 'checkpoints'
+    cache = root / 'cache'
 
 
 class Data:
@@ -17,4 +20,12 @@ class Data:
 class Example:
     eval_interval = 10_000  # number of steps after which to evaluate performance
     feedback_interval = 1000  # number of steps after which to print feedback to console
+    checkpoint_interval = 10_000  # number of steps after which to save a checkpoint
+    max_checkpoints_to_keep = 2
+    eval_batch_size = 128
+    learning_rate = 1e-5
+    max_grad_norm = 1.0  # gradients are scaled down to this norm, if their norm is larger
 
+
+class Eval:
+    print_perl_script_output = False  # print output of srl-eval.pl each time the scorer is called
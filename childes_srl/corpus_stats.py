@@ -0,0 +1,209 @@
+"""
+Statistics of SRL data (in the pre-processed format) and MLM data (one transcript per line), computed in one pass.
+
+A file is split into shards at line boundaries, and shards are counted in parallel, in a pool of processes.
+Memory depends on the size of a shard and the number of distinct words and tags, not on the size of the file.
+Results are cached, keyed by a hash of the file content.
+"""
+import hashlib
+import json
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from childes_srl.compression import is_compressed, load_block_index, read_text_range
+from childes_srl.io import parse_srl_line
+
+
+def strip_bio(tag: str) -> str:
+    """remove "B-" or "I-" prefix"""
+    if tag.startswith('B-') or tag.startswith('I-'):
+        return tag[2:]
+    return tag
+
+
+class CorpusStats:
+    """
+    counts that can be accumulated over shards of a corpus, and merged.
+
+    for SRL data, roles are counted in two ways:
+    role2num_tokens: number of tokens labeled with a role (B- or I- tag)
+    role2num_spans: number of argument spans with a role (B- tag, or I- tag which does not continue a span)
+    """
+
+    version = 1
+
+    def __init__(self):
+        self.num_lines = 0
+        self.num_tokens = 0
+        self.length2num = Counter()  # histogram of sentence lengths
+        self.word2num = Counter()
+        self.role2num_tokens = Counter()
+        self.role2num_spans = Counter()
+        self.predicate2num = Counter()
+
+    def add_srl_line(self,
+                     line: str,
+                     ) -> None:
+        words, predicate_index, tags = parse_srl_line(line)
+        self._add_words(words)
+        self.predicate2num[words[predicate_index].lower()] += 1
+
+        previous_role = None
+        for tag in tags:
+            if tag == 'O':
+                previous_role = None
+                continue
+            role = strip_bio(tag)
+            self.role2num_tokens[role] += 1
+            if tag.startswith('B-') or role != previous_role:
+                self.role2num_spans[role] += 1
+            previous_role = role
+
+    def add_mlm_line(self,
+                     line: str,
+                     ) -> None:
+        self._add_words(line.split())
+
+    def _add_words(self,
+                   words: List[str],
+                   ) -> None:
+        self.num_lines += 1
+        self.num_tokens += len(words)
+        self.length2num[len(words)] += 1
+        self.word2num.update(words)
+
+    def merge(self,
+              other: 'CorpusStats',
+              ) -> None:
+        self.num_lines += other.num_lines
+        self.num_tokens += other.num_tokens
+        for name in ['length2num', 'word2num', 'role2num_tokens', 'role2num_spans', 'predicate2num']:
+            getattr(self, name).update(getattr(other, name))
+
+    def get_vocab_coverage(self,
+                           vocab: Set[str],
+                           ) -> Tuple[float, float]:
+        """fraction of tokens, and fraction of word types, which are in vocab"""
+        num_tokens_covered = sum([n for w, n in self.word2num.items() if w in vocab])
+        num_types_covered = len([w for w in self.word2num if w in vocab])
+        return num_tokens_covered / max(1, self.num_tokens), num_types_covered / max(1, len(self.word2num))
+
+    def state_dict(self) -> Dict:
+        return {'version': self.version,
+                'num_lines': self.num_lines,
+                'num_tokens': self.num_tokens,
+                'length2num': list(self.length2num.items()),  # keys are ints, which json would turn into strings
+                'word2num': self.word2num,
+                'role2num_tokens': self.role2num_tokens,
+                'role2num_spans': self.role2num_spans,
+                'predicate2num': self.predicate2num}
+
+    @classmethod
+    def from_state_dict(cls,
+                        d: Dict,
+                        ) -> 'CorpusStats':
+        if d['version'] != cls.version:
+            raise ValueError(f'Corpus stats have version {d["version"]} but expected {cls.version}')
+        res = cls()
+        res.num_lines = d['num_lines']
+        res.num_tokens = d['num_tokens']
+        res.length2num = Counter(dict(d['length2num']))
+        for name in ['word2num', 'role2num_tokens', 'role2num_spans', 'predicate2num']:
+            setattr(res, name, Counter(d[name]))
+        return res
+
+
+def get_shard_ranges(file_path: Path,
+                     shard_size: int,
+                     ) -> List[Tuple[int, int]]:
+    """
+    split file into byte ranges of about shard_size bytes, each ending at the end of a line.
+    a compressed file is split into ranges of whole blocks, if it has a block index, otherwise it is a single range.
+    """
+    file_size = file_path.stat().st_size
+    ranges = []
+    start = 0
+    if is_compressed(file_path):
+        index = load_block_index(file_path)
+        if index is None:
+            return [(0, file_size)]
+        for offset, size in index['blocks']:
+            if offset + size - start >= shard_size:
+                ranges.append((start, offset + size))
+                start = offset + size
+        if start < file_size:
+            ranges.append((start, file_size))
+        return ranges
+
+    with file_path.open('rb') as f:
+        while start < file_size:
+            f.seek(min(start + shard_size, file_size))
+            f.readline()  # move to end of line
+            end = min(f.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def count_shard(file_path: Path,
+                start: int,
+                end: int,
+                kind: str,
+                ) -> CorpusStats:
+    text = read_text_range(file_path, start, end)
+    res = CorpusStats()
+    add_line = {'srl': res.add_srl_line, 'mlm': res.add_mlm_line}[kind]
+    for line in text.split('\n'):
+        if line.strip():
+            add_line(line)
+    return res
+
+
+def make_cache_key(file_path: Path,
+                   kind: str,
+                   ) -> str:
+    h = hashlib.sha1()
+    with file_path.open('rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    h.update(f'{kind} {CorpusStats.version}'.encode())
+    return h.hexdigest()[:16]
+
+
+def count_file(file_path: Path,
+               kind: str = 'srl',  # 'srl' or 'mlm'
+               num_workers: int = 1,
+               shard_size: int = 1 << 26,  # bytes
+               cache_dir: Optional[Path] = None,
+               ) -> CorpusStats:
+    """compute stats of a file, or load them from cache_dir if they were computed for the same content before"""
+
+    if kind not in {'srl', 'mlm'}:
+        raise ValueError(f'Unknown kind of data: {kind}')
+
+    if cache_dir is not None:
+        cache_path = cache_dir / f'{file_path.stem}_{kind}_{make_cache_key(file_path, kind)}.json'
+        if cache_path.exists():
+            print(f'Loading stats from {cache_path}')
+            return CorpusStats.from_state_dict(json.loads(cache_path.read_text()))
+
+    ranges = get_shard_ranges(file_path, shard_size)
+    res = CorpusStats()
+    if num_workers == 1:
+        for start, end in ranges:
+            res.merge(count_shard(file_path, start, end, kind))
+    else:
+        with ProcessPoolExecutor(num_workers) as executor:
+            futures = [executor.submit(count_shard, file_path, start, end, kind) for start, end in ranges]
+            for future in futures:
+                res.merge(future.result())
+
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(res.state_dict()))
+        tmp_path.replace(cache_path)
+
+    return res
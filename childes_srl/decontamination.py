@@ -0,0 +1,294 @@
+"""
+Remove propositions which are held out for evaluation (e.g. human-annotated data) from a training corpus.
+
+An index of held-out propositions is built once and saved to disk.
+It contains a 64-bit hash of each proposition (verb index and words), so that exact duplicates can be found,
+ and optionally, a MinHash signature of the word n-grams of each sentence,
+ so that near-duplicates (e.g. the same sentence with one word changed) can be found, too.
+Near-duplicate candidates are found with locality-sensitive hashing (signatures are split into bands,
+ and sentences which agree on all values of at least one band are candidates),
+ and a candidate is a near-duplicate if the estimated Jaccard similarity is at least a threshold.
+The training corpus is streamed line by line, so memory does not depend on its size.
+"""
+import hashlib
+import json
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Generator, List, Optional, Tuple
+
+import numpy as np
+
+from childes_srl.compression import open_text, make_tmp_path, replace
+
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+def get_proposition(line: str) -> str:
+    """verb index and words of a line in the pre-processed SRL format"""
+    return line.split('|||')[0].strip()
+
+
+def hash_proposition(proposition: str) -> int:
+    return int.from_bytes(hashlib.blake2b(proposition.encode(), digest_size=8).digest(), 'little')
+
+
+def gen_lines(path: Path) -> Generator[str, None, None]:
+    with open_text(path) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line:
+                yield line
+
+
+class MinHasher:
+
+    def __init__(self,
+                 num_perm: int = 64,
+                 ngram_size: int = 2,
+                 seed: int = 0,
+                 ):
+        self.num_perm = num_perm
+        self.ngram_size = ngram_size
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=(num_perm, 1), dtype=np.int64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=(num_perm, 1), dtype=np.int64)
+
+    def get_signature(self,
+                      words: List[str],
+                      ) -> np.ndarray:
+        """minimum of each of num_perm hash functions over the sentence's word n-grams"""
+        n = min(self.ngram_size, len(words))
+        ngrams = {' '.join(words[i: i + n]) for i in range(len(words) - n + 1)} or {''}
+        shingles = np.array([zlib.crc32(s.encode()) for s in ngrams], dtype=np.int64) % MERSENNE_PRIME
+        return ((self.a * shingles[np.newaxis, :] + self.b) % MERSENNE_PRIME).min(axis=1).astype(np.int32)
+
+
+class DecontaminationIndex:
+
+    version = 1
+
+    def __init__(self,
+                 source_names: List[str],
+                 source_ids: np.ndarray,  # for each held-out proposition, index into source_names
+                 hashes: np.ndarray,  # for each held-out proposition, 64-bit hash of verb index and words
+                 signatures: Optional[np.ndarray] = None,  # for each held-out proposition, MinHash signature
+                 num_bands: int = 16,
+                 ngram_size: int = 2,
+                 source_keys: Optional[Dict[str, str]] = None,  # content hash of each source file
+                 ):
+        self.source_names = source_names
+        self.source_ids = source_ids
+        self.hashes = hashes
+        self.signatures = signatures
+        self.num_bands = num_bands
+        self.ngram_size = ngram_size
+        self.source_keys = source_keys or {}
+
+        self.hash2ids = defaultdict(list)
+        for i, h in enumerate(self.hashes.tolist()):
+            self.hash2ids[h].append(i)
+
+        # for near-duplicate detection
+        if self.signatures is not None:
+            num_perm = self.signatures.shape[1]
+            if num_perm % num_bands:
+                raise ValueError(f'Number of permutations ({num_perm}) must be divisible by num_bands')
+            self.rows_per_band = num_perm // num_bands
+            self.min_hasher = MinHasher(num_perm, ngram_size)
+            self.band2buckets = [defaultdict(list) for _ in range(num_bands)]
+            for i, signature in enumerate(self.signatures):
+                for band, key in enumerate(self._get_band_keys(signature)):
+                    self.band2buckets[band][key].append(i)
+
+    @property
+    def has_signatures(self) -> bool:
+        return self.signatures is not None
+
+    @property
+    def num_perm(self) -> Optional[int]:
+        return self.signatures.shape[1] if self.signatures is not None else None
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    @classmethod
+    def from_files(cls,
+                   source2path: Dict[str, Path],
+                   near_duplicates: bool = False,
+                   num_perm: int = 64,
+                   num_bands: int = 16,
+                   ngram_size: int = 2,
+                   ) -> 'DecontaminationIndex':
+        min_hasher = MinHasher(num_perm, ngram_size) if near_duplicates else None
+        source_names = list(source2path)
+        source_ids = []
+        hashes = []
+        signatures = []
+        for source_id, path in enumerate(source2path.values()):
+            for line in gen_lines(path):
+                proposition = get_proposition(line)
+                source_ids.append(source_id)
+                hashes.append(hash_proposition(proposition))
+                if min_hasher is not None:
+                    signatures.append(min_hasher.get_signature(proposition.split()[1:]))
+
+        return cls(source_names,
+                   np.array(source_ids, dtype=np.int16),
+                   np.array(hashes, dtype=np.uint64),
+                   np.stack(signatures) if signatures else None,
+                   num_bands,
+                   ngram_size,
+                   {name: cls.make_source_key(path) for name, path in source2path.items()})
+
+    @classmethod
+    def from_files_cached(cls,
+                          source2path: Dict[str, Path],
+                          index_path: Path,
+                          near_duplicates: bool = False,
+                          num_perm: int = 64,
+                          num_bands: int = 16,
+                          ngram_size: int = 2,
+                          ) -> 'DecontaminationIndex':
+        """
+        load index from index_path if it was built from the same files, otherwise build and save it.
+        if near_duplicates is True, the index must also have been built with the same MinHash parameters.
+        """
+        if index_path.exists():
+            index = cls.load(index_path)
+            source_keys = {name: cls.make_source_key(path) for name, path in source2path.items()}
+            is_same_params = (index.num_perm, index.num_bands, index.ngram_size) == (num_perm, num_bands, ngram_size)
+            if index.source_keys == source_keys and (not near_duplicates or is_same_params):
+                print(f'Loaded index of {len(index):,} held-out propositions from {index_path}')
+                return index
+
+        print('Building index of held-out propositions...')
+        index = cls.from_files(source2path, near_duplicates, num_perm, num_bands, ngram_size)
+        index.save(index_path)
+        return index
+
+    @staticmethod
+    def make_source_key(path: Path) -> str:
+        return hashlib.sha1(path.read_bytes()).hexdigest()[:16]
+
+    def save(self,
+             path: Path,
+             ) -> None:
+        meta = {'version': self.version,
+                'source_names': self.source_names,
+                'source_keys': self.source_keys,
+                'num_bands': self.num_bands,
+                'ngram_size': self.ngram_size}
+        arrays = {'source_ids': self.source_ids, 'hashes': self.hashes}
+        if self.signatures is not None:
+            arrays['signatures'] = self.signatures
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp.npz')
+        np.savez(str(tmp_path), meta=np.array(json.dumps(meta)), **arrays)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls,
+             path: Path,
+             ) -> 'DecontaminationIndex':
+        d = np.load(str(path))
+        meta = json.loads(str(d['meta']))
+        if meta['version'] != cls.version:
+            raise ValueError(f'Index at {path} has version {meta["version"]} but expected {cls.version}')
+        return cls(meta['source_names'],
+                   d['source_ids'],
+                   d['hashes'],
+                   d['signatures'] if 'signatures' in d else None,
+                   meta['num_bands'],
+                   meta['ngram_size'],
+                   meta['source_keys'])
+
+    def find(self,
+             proposition: str,
+             threshold: Optional[float] = None,  # min estimated Jaccard similarity of near-duplicates
+             ) -> Tuple[List[int], List[int]]:
+        """
+        return ids of held-out propositions which are exact duplicates, and which are near-duplicates.
+        near-duplicates are only searched if there are no exact duplicates.
+        """
+        exact_ids = self.hash2ids.get(hash_proposition(proposition), [])
+        if exact_ids or threshold is None:
+            return exact_ids, []
+        if not self.has_signatures:
+            raise RuntimeError('Index was built without MinHash signatures')
+
+        signature = self.min_hasher.get_signature(proposition.split()[1:])
+        candidates = set()
+        for band, key in enumerate(self._get_band_keys(signature)):
+            candidates.update(self.band2buckets[band].get(key, []))
+        if not candidates:
+            return [], []
+        candidates = np.array(sorted(candidates))
+        similarities = (self.signatures[candidates] == signature).mean(axis=1)
+        return [], candidates[similarities >= threshold].tolist()
+
+    def _get_band_keys(self,
+                       signature: np.ndarray,
+                       ) -> List[bytes]:
+        r = self.rows_per_band
+        return [signature[band * r: (band + 1) * r].tobytes() for band in range(self.num_bands)]
+
+
+def decontaminate(index: DecontaminationIndex,
+                  in_path: Path,
+                  out_path: Path,
+                  threshold: Optional[float] = None,  # if given, near-duplicates are removed, too
+                  ) -> Dict[str, Dict[str, int]]:
+    """
+    write lines in in_path which are neither exact nor near duplicates of held-out propositions to out_path,
+     and return overlap statistics for each source of held-out propositions.
+
+    as in all pre-processed data, there is no '\\n' at the end of the output file.
+    """
+    num_sources = len(index.source_names)
+    num_exact = np.zeros(num_sources, dtype=np.int64)  # lines removed because of held-out propositions in source
+    num_near = np.zeros(num_sources, dtype=np.int64)
+    is_found = np.zeros(len(index), dtype=bool)  # held-out propositions which occur in in_path
+
+    num_kept = 0
+    num_total = 0
+    tmp_path = make_tmp_path(out_path)
+    with open_text(tmp_path, 'w') as f:
+        for line in gen_lines(in_path):
+            num_total += 1
+            exact_ids, near_ids = index.find(get_proposition(line), threshold)
+            if exact_ids:
+                is_found[exact_ids] = True
+                num_exact[np.unique(index.source_ids[exact_ids])] += 1
+            elif near_ids:
+                is_found[near_ids] = True
+                num_near[np.unique(index.source_ids[near_ids])] += 1
+            else:
+                if num_kept > 0:  # do not write '\n' at end of file
+                    f.write('\n')
+                f.write(line)
+                num_kept += 1
+    replace(tmp_path, out_path)
+
+    source2stats = {}
+    for source_id, name in enumerate(index.source_names):
+        is_source = index.source_ids == source_id
+        source2stats[name] = {'num_held_out': int(is_source.sum()),
+                              'num_held_out_found': int((is_found & is_source).sum()),
+                              'num_removed_exact': int(num_exact[source_id]),
+                              'num_removed_near': int(num_near[source_id])}
+    source2stats['total'] = {'num_lines': num_total, 'num_kept': num_kept}
+    return source2stats
+
+
+def print_overlap_stats(source2stats: Dict[str, Dict[str, int]]) -> None:
+    total = source2stats['total']
+    print(f'Kept {total["num_kept"]:>9,}/{total["num_lines"]:>9,} lines')
+    for name, stats in source2stats.items():
+        if name == 'total':
+            continue
+        print(f'{name}:')
+        print(f'    held-out propositions found in corpus={stats["num_held_out_found"]:>9,}/'
+              f'{stats["num_held_out"]:>9,}')
+        print(f'    lines removed (exact duplicates)     ={stats["num_removed_exact"]:>9,}')
+        print(f'    lines removed (near-duplicates)      ={stats["num_removed_near"]:>9,}')
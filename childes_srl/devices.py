@@ -0,0 +1,57 @@
+"""
+Device selection for the models used to annotate CHILDES: DeepSegment (TensorFlow) and the AllenNLP SRL tagger (torch).
+
+On machines without GPU, both frameworks run on CPU, and the size of their thread pools can be limited,
+ so that several annotation processes can share a machine without competing for the same cores.
+Must be called before any model is loaded, because thread pools cannot be resized once they are in use.
+"""
+from typing import Optional
+
+
+def configure_torch(use_gpu: Optional[bool] = None,  # None: use GPU if one is available
+                    num_intra_op_threads: int = 0,  # 0: use framework default
+                    num_inter_op_threads: int = 0,
+                    ) -> int:
+    """
+    return device id which can be passed as cuda_device to AllenNLP (-1 is CPU).
+    """
+    import torch
+
+    if use_gpu is None:
+        use_gpu = torch.cuda.is_available()
+    elif use_gpu and not torch.cuda.is_available():
+        raise RuntimeError('GPU requested but torch cannot find one')
+
+    if num_intra_op_threads:
+        torch.set_num_threads(num_intra_op_threads)
+    if num_inter_op_threads:
+        torch.set_num_interop_threads(num_inter_op_threads)
+
+    cuda_device = 0 if use_gpu else -1
+    print(f'torch: device={"cuda:0" if use_gpu else "cpu"} intra-op threads={torch.get_num_threads()}')
+    return cuda_device
+
+
+def configure_tensorflow(use_gpu: Optional[bool] = None,  # None: use GPU if one is available
+                         num_intra_op_threads: int = 0,  # 0: use framework default
+                         num_inter_op_threads: int = 0,
+                         ) -> None:
+    import tensorflow as tf
+
+    gpu_devices = tf.config.experimental.list_physical_devices('GPU')
+    if use_gpu is None:
+        use_gpu = bool(gpu_devices)
+    elif use_gpu and not gpu_devices:
+        raise RuntimeError('GPU requested but TensorFlow cannot find one')
+
+    if use_gpu:
+        tf.config.experimental.set_memory_growth(gpu_devices[0], True)  # do not take all GPU memory - torch needs some too
+    else:
+        tf.config.experimental.set_visible_devices([], 'GPU')
+
+    if num_intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(num_intra_op_threads)
+    if num_inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(num_inter_op_threads)
+
+    print(f'TensorFlow: device={"gpu:0" if use_gpu else "cpu"}')
@@ -0,0 +1,200 @@
+"""
+Integer-encoded corpora, for analyses which count words by semantic role in a single vectorized pass.
+
+All sentences of a corpus are concatenated into flat arrays of word ids and tag ids,
+ and offsets mark where each sentence starts.
+Word lists (e.g. singular nouns) become boolean masks over the vocabulary, so that looking up the class of every
+ token in the corpus is a single indexing operation, and counting is done with np.bincount.
+"""
+import hashlib
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from childes_srl.io import load_srl_data, load_mlm_data
+
+
+class EncodedCorpus:
+
+    version = 2
+
+    def __init__(self,
+                 vocab: List[str],
+                 tag_vocab: List[str],  # empty for MLM data
+                 word_ids: np.ndarray,
+                 tag_ids: Optional[np.ndarray],  # None for MLM data
+                 offsets: np.ndarray,  # sentence n spans word_ids[offsets[n]: offsets[n + 1]]
+                 predicate_indices: Optional[np.ndarray] = None,  # index of predicate in each sentence
+                 ):
+        self.vocab = vocab
+        self.tag_vocab = tag_vocab
+        self.word_ids = word_ids
+        self.tag_ids = tag_ids
+        self.offsets = offsets
+        self.predicate_indices = predicate_indices
+
+        self.word2id = {w: i for i, w in enumerate(self.vocab)}
+        self.tag2id = {t: i for i, t in enumerate(self.tag_vocab)}
+
+    @property
+    def num_sentences(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_sentences(cls,
+                       sentences: Iterable[Sequence[str]],
+                       tag_sequences: Optional[Iterable[Sequence[str]]] = None,
+                       predicate_indices: Optional[Iterable[int]] = None,
+                       ) -> 'EncodedCorpus':
+        word2id = {}
+        tag2id = {}
+        word_ids = []
+        tag_ids = []
+        lengths = []
+        for sentence in sentences:
+            word_ids += [word2id.setdefault(w, len(word2id)) for w in sentence]
+            lengths.append(len(sentence))
+        if tag_sequences is not None:
+            for tags in tag_sequences:
+                tag_ids += [tag2id.setdefault(t, len(tag2id)) for t in tags]
+            if len(tag_ids) != len(word_ids):
+                raise ValueError('Number of tags does not match number of words')
+
+        return cls(list(word2id),
+                   list(tag2id),
+                   np.array(word_ids, dtype=np.int32),
+                   np.array(tag_ids, dtype=np.int32) if tag_sequences is not None else None,
+                   np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+                   np.array(list(predicate_indices), dtype=np.int32) if predicate_indices is not None else None)
+
+    @classmethod
+    def from_srl_propositions(cls,
+                              propositions: List[Tuple[List[str], int, List[str]]],
+                              ) -> 'EncodedCorpus':
+        """encode output of load_srl_data()"""
+        return cls.from_sentences([words for words, _, _ in propositions],
+                                  [tags for _, _, tags in propositions],
+                                  [predicate_index for _, predicate_index, _ in propositions])
+
+    @classmethod
+    def from_mlm_utterances(cls,
+                            utterances: List[List[str]],
+                            ) -> 'EncodedCorpus':
+        """encode output of load_mlm_data()"""
+        return cls.from_sentences(utterances)
+
+    # ############################################################## persistence
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        res = {'version': np.array(self.version),
+               'vocab': np.array(self.vocab, dtype=np.str_),
+               'tag_vocab': np.array(self.tag_vocab, dtype=np.str_),
+               'word_ids': self.word_ids,
+               'offsets': self.offsets}
+        if self.tag_ids is not None:
+            res['tag_ids'] = self.tag_ids
+        if self.predicate_indices is not None:
+            res['predicate_indices'] = self.predicate_indices
+        return res
+
+    @classmethod
+    def from_arrays(cls,
+                    d,
+                    ) -> 'EncodedCorpus':
+        if int(d['version']) != cls.version:
+            raise ValueError(f'Encoded corpus has version {int(d["version"])} but expected {cls.version}')
+        return cls(d['vocab'].tolist(),
+                   d['tag_vocab'].tolist(),
+                   d['word_ids'],
+                   d['tag_ids'] if 'tag_ids' in d else None,
+                   d['offsets'],
+                   d['predicate_indices'] if 'predicate_indices' in d else None)
+
+    def save(self,
+             path: Path,
+             ) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp.npz')
+        np.savez(str(tmp_path), **self.to_arrays())
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls,
+             path: Path,
+             ) -> 'EncodedCorpus':
+        return cls.from_arrays(np.load(str(path)))
+
+    @classmethod
+    def from_file(cls,
+                  file_path: Path,
+                  kind: str = 'srl',  # 'srl' or 'mlm'
+                  cache_dir: Optional[Path] = None,
+                  ) -> 'EncodedCorpus':
+        """
+        encode data loaded with load_srl_data() or load_mlm_data() (with default arguments).
+        if cache_dir is given, the encoding is saved, and re-used for a file with the same content.
+        """
+        kind2encode: Dict[str, Callable[[Path], EncodedCorpus]] = {
+            'srl': lambda p: cls.from_srl_propositions(load_srl_data(p)),
+            'mlm': lambda p: cls.from_mlm_utterances(load_mlm_data(p)),
+        }
+        if kind not in kind2encode:
+            raise ValueError(f'Unknown kind of data: {kind}')
+
+        if cache_dir is None:
+            return kind2encode[kind](file_path)
+
+        h = hashlib.sha1()
+        with file_path.open('rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        h.update(f'{kind} {cls.version}'.encode())
+        cache_path = cache_dir / f'{file_path.stem}_{kind}_{h.hexdigest()[:16]}.npz'
+        if cache_path.exists():
+            print(f'Loading encoded corpus from {cache_path}')
+            return cls.load(cache_path)
+
+        res = kind2encode[kind](file_path)
+        res.save(cache_path)
+        return res
+
+    # ############################################################## analysis
+
+    def make_word_mask(self,
+                       words: Iterable[str],
+                       ) -> np.ndarray:
+        """boolean mask over vocabulary, True for words in the list (words not in the vocabulary are ignored)"""
+        res = np.zeros(len(self.vocab), dtype=bool)
+        ids = [self.word2id[w] for w in words if w in self.word2id]
+        res[ids] = True
+        return res
+
+    def get_word_classes(self,
+                         masks: List[np.ndarray],
+                         ) -> np.ndarray:
+        """
+        for each word in the vocabulary, index of the first mask which contains it, or -1 if no mask contains it
+        """
+        res = np.full(len(self.vocab), -1, dtype=np.int64)
+        for class_id, mask in reversed(list(enumerate(masks))):  # earlier masks take precedence
+            res[mask] = class_id
+        return res
+
+    def count_classes_by_tag(self,
+                             masks: List[np.ndarray],
+                             ) -> np.ndarray:
+        """
+        contingency table with shape [num classes, num tags], counting tokens of each word class with each tag.
+        for MLM data (without tags), the table has a single column.
+        """
+        num_classes = len(masks)
+        token_classes = self.get_word_classes(masks)[self.word_ids]
+        is_in_class = token_classes >= 0
+        if self.tag_ids is None:
+            num_tags = 1
+            cells = token_classes[is_in_class]
+        else:
+            num_tags = len(self.tag_vocab)
+            cells = token_classes[is_in_class] * num_tags + self.tag_ids[is_in_class]
+        return np.bincount(cells, minlength=num_classes * num_tags).reshape(num_classes, num_tags)
@@ -0,0 +1,307 @@
+"""
+Convert human-annotated CHILDES (TalkBank XML with <proposition> elements) to the pre-processed SRL format.
+
+Each XML file is parsed incrementally, one utterance at a time, and elements are cleared once converted,
+ so that memory does not grow with file size.
+Files are converted in a pool of processes, and lines are returned in the order of the (sorted) files.
+The conversion of each file can be cached, so that a rebuild only converts files that changed.
+"""
+import hashlib
+import io
+import json
+import re
+import xml.etree.ElementTree as ET
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from childes_srl.utils import make_srl_string
+
+CONVERTER_VERSION = 2  # must be incremented whenever a change to the conversion changes its output
+TALKBANK_NAMESPACE = '{http://www.talkbank.org/ns/talkbank}'
+OUTSIDE_LABEL = 'O'
+
+# names of warning counters, in the order in which they are printed
+COUNT_NAMES = ['num_good',
+               'num_no_arguments',
+               'num_no_predicate',
+               'num_bad_head_loc',
+               'num_bad_arg_loc',
+               'num_prepositions',
+               'num_no_props',
+               'num_child',
+               ]
+
+
+def has_props(e):
+    try:
+        next(e.iterfind(f'{TALKBANK_NAMESPACE}props'))
+    except StopIteration:
+        return False
+    else:
+        return True
+
+
+def is_child(e):
+    """is utterance spoken by child?"""
+    if e.attrib['who'] == 'CHI':
+        return True
+    else:
+        return False
+
+
+def read_parse_string(parse_string: str,
+                      ) -> Tuple[List[str], List[List[Tuple[int, int]]]]:
+    """
+    read a bracketed parse tree (same format as accepted by nltk.Tree.fromstring) in a single pass.
+
+    return the leaves, and for each leaf, the spans (start, end) of the leaves covered by each of its ancestors,
+     from its parent (index 0) to the root (last index).
+    """
+    words = []
+    leaf_ancestors = []  # for each leaf, indices into node_spans
+    node_spans = []
+    stack = []  # indices into node_spans of open nodes
+
+    tokens = re.findall(r'\(|\)|[^\s()]+', parse_string)
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == '(':
+            stack.append(len(node_spans))
+            node_spans.append([len(words), None])
+            if i + 1 < len(tokens) and tokens[i + 1] not in '()':
+                i += 1  # skip node label
+        elif token == ')':
+            if not stack:
+                raise ValueError(f'Unbalanced parentheses in {parse_string}')
+            node_spans[stack.pop()][1] = len(words)
+        else:
+            if not stack:
+                raise ValueError(f'Leaf outside of tree in {parse_string}')
+            leaf_ancestors.append(stack[::-1])
+            words.append(token)
+        i += 1
+    if stack:
+        raise ValueError(f'Unbalanced parentheses in {parse_string}')
+
+    spans = [(start, end) for start, end in node_spans]
+    return words, [[spans[n] for n in ancestors] for ancestors in leaf_ancestors]
+
+
+def convert_utterance(utterance: ET.Element,
+                      counts: Counter,
+                      verbose: bool = False,
+                      ) -> List[str]:
+    """return one line for each well-formed proposition in the utterance"""
+    lines = []
+
+    # words - get them from parse tree because parsing xml is difficult
+    parse_string = utterance.find(f'{TALKBANK_NAMESPACE}parse').text
+    words, leaf_ancestors = read_parse_string(parse_string)
+
+    if verbose:
+        print()
+        print('=============================================')
+        print(f'{utterance.attrib["uID"]}')
+        print(' '.join(words))
+        print('=============================================')
+        print()
+
+    # collect label sequence for each <proposition> in the utterance
+    for proposition in utterance.iter(f'{TALKBANK_NAMESPACE}proposition'):
+
+        # propositions of prepositions (lemma ending in -p) are skipped, and counted as num_prepositions:
+        # only verb predicates are in the pre-processed data
+        if proposition.attrib['lemma'].endswith('-p'):
+            counts['num_prepositions'] += 1
+            continue
+
+        if verbose:
+            print(proposition.attrib)
+
+        # initialize label-sequence
+        label_text_list = list(proposition.itertext())
+        labels = [OUTSIDE_LABEL for _ in range(len(words))]
+        is_bad = False
+
+        # loop over arguments in the proposition - reconstructing label-sequence along the way
+        for label_text in label_text_list:
+
+            # parse label_text
+            res = re.findall(r'(\d+):(\d)-(.*)', label_text)[0]
+            head_loc = int(res[0])  # location in sentence of head (not first word) of argument
+            num_up = int(res[1])  # levels up in hierarchy at which all sister-trees are part of argument span
+            tag = str(res[2])
+
+            if verbose:
+                print(f'{head_loc:>2} {num_up:>2} {tag:>12}')
+
+            try:
+                words[head_loc]
+            except IndexError:
+                counts['num_bad_head_loc'] += 1
+                is_bad = True
+                break
+
+            if 'rel' in tag:
+                labels[head_loc] = 'B-V'
+            else:
+                # go up in tree from head of current argument. if num_up exceeds the depth, the root is used
+                ancestors = leaf_ancestors[head_loc]
+                start_loc, end_loc = ancestors[min(num_up, len(ancestors) - 1)]
+                argument_length = end_loc - start_loc
+                argument_labels = [f'B-{tag}'] + [f'I-{tag}'] * (argument_length - 1)
+
+                if not labels[start_loc: start_loc + argument_length] == [OUTSIDE_LABEL] * argument_length:
+                    counts['num_bad_arg_loc'] += 1
+                    is_bad = True
+                    break
+                labels[start_loc: start_loc + argument_length] = argument_labels
+
+        if is_bad:
+            continue
+
+        # pre-check console
+        if verbose:
+            for w, l in zip(words, labels):
+                print(f'{w:<12} {l:<12}')
+
+        # checks
+        if labels.count('B-V') != 1:
+            counts['num_no_predicate'] += 1
+            continue
+
+        if sum([1 if l.startswith('B-ARG') else 0 for l in labels]) == 0:
+            counts['num_no_arguments'] += 1
+            continue
+
+        assert len(labels) == len(words)
+
+        # console
+        if verbose:
+            print(make_srl_string(words, labels))
+
+        # make line
+        verb_index = labels.index('B-V')
+        x_string = " ".join(words)
+        y_string = " ".join(labels)
+        line = f'{verb_index} {x_string} ||| {y_string}'
+
+        # collect
+        counts['num_good'] += 1
+        lines.append(line)
+
+    return lines
+
+
+def convert_file(file_path: Path,
+                 verbose: bool = False,
+                 data: Optional[bytes] = None,  # content of file, if it was read already
+                 ) -> Tuple[List[str], Counter]:
+    """
+    return lines made from all utterances in a TalkBank XML file, and counts of skipped propositions.
+
+    each direct child of the root (an utterance, or other element, e.g. participants) is converted as soon as
+     it is parsed completely, and then removed from the tree.
+    """
+    lines = []
+    counts = Counter({name: 0 for name in COUNT_NAMES})
+    depth = 0
+    root = None
+    source = str(file_path) if data is None else io.BytesIO(data)
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth != 1:
+            continue
+
+        if not has_props(element):
+            counts['num_no_props'] += 1
+        else:
+            # note: child utterances are counted, but not excluded, as in all previously generated data
+            if is_child(element):
+                counts['num_child'] += 1
+            lines += convert_utterance(element, counts, verbose)
+
+        element.clear()
+        root.remove(element)
+
+    return lines, counts
+
+
+def convert_file_cached(file_path: Path,
+                        cache_dir: Optional[Path],
+                        verbose: bool = False,
+                        ) -> Tuple[List[str], Counter, bool]:
+    """
+    same as convert_file(), but re-use the conversion of a file with the same content, made by the same converter.
+    also return whether the cached conversion was used.
+    """
+    if cache_dir is None or verbose:
+        return (*convert_file(file_path, verbose), False)
+
+    data = file_path.read_bytes()
+    key = hashlib.sha1(data + f' {CONVERTER_VERSION}'.encode()).hexdigest()[:16]
+    cache_path = cache_dir / f'{file_path.stem}_{key}.json'
+    if cache_path.exists():
+        d = json.loads(cache_path.read_text())
+        return d['lines'], Counter(d['counts']), True
+
+    lines, counts = convert_file(file_path, verbose, data)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps({'lines': lines, 'counts': counts}))
+    tmp_path.replace(cache_path)
+    return lines, counts, False
+
+
+def convert_files(xml_path: Path,
+                  num_workers: int = 1,
+                  verbose: bool = False,
+                  cache_dir: Optional[Path] = None,
+                  ) -> Tuple[List[str], Counter]:
+    """
+    return lines made from all XML files in xml_path (in sorted order), and counts aggregated over files.
+    if cache_dir is given, only files which changed since the last call are converted.
+    """
+    file_paths = sorted(xml_path.rglob('*.xml'))
+
+    lines = []
+    counts = Counter({name: 0 for name in COUNT_NAMES})
+    num_cached = 0
+
+    def collect(file_path, file_lines, file_counts, is_cached):
+        print('Collected {} good propositions in {}{}'.format(
+            file_counts['num_good'], file_path.name, ' (cached)' if is_cached else ''))
+        lines.extend(file_lines)
+        counts.update(file_counts)
+        return is_cached
+
+    if num_workers == 1:
+        for file_path in file_paths:
+            num_cached += collect(file_path, *convert_file_cached(file_path, cache_dir, verbose))
+    else:
+        with ProcessPoolExecutor(num_workers) as executor:
+            results = executor.map(convert_file_cached,
+                                   file_paths,
+                                   [cache_dir] * len(file_paths),
+                                   [verbose] * len(file_paths))
+            for file_path, res in zip(file_paths, results):
+                num_cached += collect(file_path, *res)
+
+    if cache_dir is not None:
+        print(f'Converted {len(file_paths) - num_cached} files. Re-used conversion of {num_cached} unchanged files')
+
+    return lines, counts
+
+
+def print_counts(counts: Counter) -> None:
+    for name in COUNT_NAMES:
+        print(f'{name:<22}={counts[name]:,}')
@@ -1,17 +1,21 @@
 import numpy as np
-from typing import List, Set, Tuple, Optional
+from typing import Generator, Iterable, List, Set, Tuple, Optional
 from pathlib import Path
 
 from childes_srl import configs
+from childes_srl.compression import gen_lines, open_text, make_tmp_path, replace
 
 
 def load_mlm_data(file_path: Path,
                   verbose: bool = False,
                   uncased: bool = False,
                   special_tokens: Optional[Set[str]] = None,
-                  allow_discard: bool = False) -> List[List[str]]:
+                  allow_discard: bool = False,
+                  num_workers: int = 1,
+                  ) -> List[List[str]]:
     """
-    load CHILDES utterances for adding SR-labels
+    load CHILDES utterances for adding SR-labels.
+    the file may be compressed (.gz, .xz or .bz2). num_workers processes decompress blocks of the file in parallel.
     """
 
     if special_tokens is None:
@@ -24,41 +28,38 @@ def load_mlm_data(file_path: Path,
     punctuation = {'.', '?', '!'}
     num_too_small = 0
     num_too_large = 0
-    with file_path.open('r') as f:
-
-        for line in f.readlines():
-
-            # tokenize transcript
-            transcript = line.strip().split()  # a transcript containing multiple utterances
-            transcript = [w for w in transcript]
-
-            # split transcript into utterances
-            utterances = [[]]
-            for w in transcript:
-                utterances[-1].append(w)
-                if w in punctuation:
-                    utterances.append([])
-
-            # collect utterances
-            for utterance in utterances:
-
-                if not utterance:  # during probing, parsing logic above may produce empty utterances
-                    continue
+    for line in gen_lines(file_path, num_workers):
+        # tokenize transcript
+        transcript = line.strip().split()  # a transcript containing multiple utterances
+        transcript = [w for w in transcript]
+
+        # split transcript into utterances
+        utterances = [[]]
+        for w in transcript:
+            utterances[-1].append(w)
+            if w in punctuation:
+                utterances.append([])
+
+        # collect utterances
+        for utterance in utterances:
+
+            if not utterance:  # during probing, parsing logic above may produce empty utterances
+                continue
 
-                # check  length
-                if len(utterance) < configs.Data.min_seq_length and allow_discard:
-                    num_too_small += 1
-                    continue
-                if len(utterance) > configs.Data.max_seq_length and allow_discard:
-                    num_too_large += 1
-                    continue
+            # check  length
+            if len(utterance) < configs.Data.min_seq_length and allow_discard:
+                num_too_small += 1
+                continue
+            if len(utterance) > configs.Data.max_seq_length and allow_discard:
+                num_too_large += 1
+                continue
 
-                # lower-case
-                if uncased:
-                    utterance = [w if w in special_tokens else w.lower()
-                                 for w in utterance]
+            # lower-case
+            if uncased:
+                utterance = [w if w in special_tokens else w.lower()
+                             for w in utterance]
 
-                res.append(utterance)
+            res.append(utterance)
 
     if num_too_small or num_too_large:
         print(f'WARNING: Skipped {num_too_small} utterances which are shorter than {configs.Data.min_seq_length}.')
@@ -75,14 +76,37 @@ def load_mlm_data(file_path: Path,
     return res
 
 
+def parse_srl_line(line: str,
+                   ) -> Tuple[List[str], int, List[str]]:
+    """
+    parse a line with format: {predicate_id} [word0, word1 ...] ||| [label0, label1 ...]
+    """
+    inputs = line.strip().split('|||')
+    left_input = inputs[0].strip().split()
+    right_input = inputs[1].strip().split()
+
+    # predicate
+    predicate_index = int(left_input[0])
+
+    # words + labels
+    words = left_input[1:]
+    labels = right_input
+
+    return words, predicate_index, labels
+
+
 def load_srl_data(file_path: Path,
                   verbose: bool = False,
                   uncased: bool = False,
                   special_tokens: Optional[Set[str]] = None,
+                  strict: bool = False,
+                  num_workers: int = 1,
                   ) -> List[Tuple]:
     """
     Read tokenized propositions from file.
     File format: {predicate_id} [word0, word1 ...] ||| [label0, label1 ...]
+    If strict, raise ValueError if any line is malformed, or its labels are not well-formed.
+    The file may be compressed (.gz, .xz or .bz2). num_workers processes decompress blocks of the file in parallel.
     Return:
         A list with elements of structure [[words], predicate position, [labels]]
     """
@@ -93,38 +117,32 @@ def load_srl_data(file_path: Path,
     assert file_path.exists()
     print(f'Loading {file_path}')
 
+    if strict:
+        from childes_srl.validation import validate_file  # imports this module
+        report = validate_file(file_path, num_workers=num_workers)
+        if not report.is_valid:
+            raise ValueError(f'{file_path}: {report.summarize()}')
+
     num_too_small = 0
     num_too_large = 0
     res = []
-    with file_path.open('r') as f:
-
-        for line in f.readlines():
-
-            inputs = line.strip().split('|||')
-            left_input = inputs[0].strip().split()
-            right_input = inputs[1].strip().split()
+    for line in gen_lines(file_path, num_workers):
+        words, predicate_index, labels = parse_srl_line(line)
 
-            # predicate
-            predicate_index = int(left_input[0])
-
-            # words + labels
-            words = left_input[1:]
-            labels = right_input
-
-            # check  length
-            if len(words) <= configs.Data.min_seq_length:
-                num_too_small += 1
-                continue
-            if len(words) > configs.Data.max_seq_length:
-                num_too_large += 1
-                continue
+        # check  length
+        if len(words) <= configs.Data.min_seq_length:
+            num_too_small += 1
+            continue
+        if len(words) > configs.Data.max_seq_length:
+            num_too_large += 1
+            continue
 
-            # lower-case
-            if uncased:
-                words = [w if w in special_tokens else w.lower()
-                         for w in words]
+        # lower-case
+        if uncased:
+            words = [w if w in special_tokens else w.lower()
+                     for w in words]
 
-            res.append((words, predicate_index, labels))
+        res.append((words, predicate_index, labels))
 
     print(f'WARNING: Skipped {num_too_small} propositions which are shorter than {configs.Data.min_seq_length}.')
     print(f'WARNING: Skipped {num_too_large} propositions which are larger than {configs.Data.max_seq_length}.')
@@ -137,3 +155,148 @@ def load_srl_data(file_path: Path,
         print(f'Median proposition length: {np.median(lengths):.2f}')
 
     return res
+
+
+# ############################################################## grouped format
+
+def parse_grouped_srl_line(line: str,
+                           ) -> Tuple[List[str], List[Tuple[int, List[str]]]]:
+    """
+    parse a line with format: [word0, word1 ...] ||| {predicate_id} [label0, label1 ...] ||| {predicate_id} ...
+    """
+    inputs = line.strip().split('|||')
+    words = inputs[0].split()
+    rows = []
+    for row in inputs[1:]:
+        row = row.split()
+        rows.append((int(row[0]), row[1:]))
+    return words, rows
+
+
+def make_grouped_srl_line(words: List[str],
+                          rows: List[Tuple[int, List[str]]],
+                          ) -> str:
+    return ' ||| '.join([' '.join(words)] + [f'{predicate_index} {" ".join(labels)}'
+                                             for predicate_index, labels in rows])
+
+
+def group_propositions(propositions: Iterable[Tuple[List[str], int, List[str]]],
+                       ) -> List[Tuple[List[str], List[Tuple[int, List[str]]]]]:
+    """
+    group propositions with the same words, in order of first occurrence of the words.
+    within a group, propositions keep their order, including duplicates.
+    """
+    words2rows = {}
+    for words, predicate_index, labels in propositions:
+        words2rows.setdefault(tuple(words), []).append((predicate_index, labels))
+    return [(list(words), rows) for words, rows in words2rows.items()]
+
+
+def ungroup_propositions(sentences: Iterable[Tuple[List[str], List[Tuple[int, List[str]]]]],
+                         ) -> Generator[Tuple[List[str], int, List[str]], None, None]:
+    """yield one proposition per row. propositions of the same sentence share the list of words"""
+    for words, rows in sentences:
+        for predicate_index, labels in rows:
+            yield words, predicate_index, labels
+
+
+def load_grouped_srl_data(file_path: Path,
+                          uncased: bool = False,
+                          special_tokens: Optional[Set[str]] = None,
+                          num_workers: int = 1,
+                          ) -> List[Tuple[List[str], List[Tuple[int, List[str]]]]]:
+    """
+    Read sentences, each with one or more propositions, from file in the grouped format.
+    Sentences are skipped if they are too short or too long, as in load_srl_data().
+    Return:
+        A list with elements of structure [[words], [(predicate position, [labels]), ...]]
+    """
+
+    if special_tokens is None:
+        special_tokens = configs.Data.childes_symbols
+
+    assert file_path.exists()
+    print(f'Loading {file_path}')
+
+    num_too_small = 0
+    num_too_large = 0
+    res = []
+    for line in gen_lines(file_path, num_workers):
+        if not line.strip():
+            continue
+        words, rows = parse_grouped_srl_line(line)
+
+        # check  length
+        if len(words) <= configs.Data.min_seq_length:
+            num_too_small += len(rows)
+            continue
+        if len(words) > configs.Data.max_seq_length:
+            num_too_large += len(rows)
+            continue
+
+        # lower-case
+        if uncased:
+            words = [w if w in special_tokens else w.lower()
+                     for w in words]
+
+        res.append((words, rows))
+
+    print(f'WARNING: Skipped {num_too_small} propositions which are shorter than {configs.Data.min_seq_length}.')
+    print(f'WARNING: Skipped {num_too_large} propositions which are larger than {configs.Data.max_seq_length}.')
+
+    return res
+
+
+def convert_srl_to_grouped(in_path: Path,
+                           out_path: Path,
+                           ) -> Tuple[int, int]:
+    """
+    write all propositions in in_path (pre-processed SRL format) to out_path in the grouped format,
+     and return the number of propositions and sentences.
+    all propositions are held in memory, because propositions of the same sentence need not be adjacent.
+    """
+    propositions = [parse_srl_line(line) for line in gen_lines(in_path) if line.strip()]
+    sentences = group_propositions(propositions)
+    tmp_path = make_tmp_path(out_path)
+    with open_text(tmp_path, 'w') as f:
+        f.write('\n'.join([make_grouped_srl_line(words, rows) for words, rows in sentences]))
+    replace(tmp_path, out_path)
+    return len(propositions), len(sentences)
+
+
+def convert_grouped_to_srl(in_path: Path,
+                           out_path: Path,
+                           ) -> int:
+    """
+    write all propositions in in_path (grouped format) to out_path in the pre-processed SRL format,
+     one line per proposition, and return the number of propositions.
+    as in all pre-processed data, there is no '\\n' at the end of the output file.
+    """
+    num_lines = 0
+    tmp_path = make_tmp_path(out_path)
+    with open_text(tmp_path, 'w') as f:
+        for line in gen_lines(in_path):
+            if not line.strip():
+                continue
+            words, rows = parse_grouped_srl_line(line)
+            for predicate_index, labels in rows:
+                if num_lines > 0:  # do not write '\n' at end of file
+                    f.write('\n')
+                f.write(f'{predicate_index} {" ".join(words)} ||| {" ".join(labels)}')
+                num_lines += 1
+    replace(tmp_path, out_path)
+    return num_lines
+
+
+def load_vocab(file_path: Path,
+               ) -> List[str]:
+    """
+    load words from a vocabulary file, with one word per line, optionally preceded by its frequency
+    """
+    res = []
+    with file_path.open('r') as f:
+        for line in f:
+            parts = line.split()
+            if parts:
+                res.append(parts[-1])
+    return res
@@ -0,0 +1,117 @@
+"""
+Store human judgments of lines in the pre-processed SRL format (e.g. whether the annotation is acceptable).
+
+Judgments are appended to a sqlite database, keyed by a hash of the line,
+ so that checking whether a line was judged before, and saving a judgment, do not depend on the number of judgments.
+The order in which lines are presented is shuffled once, and saved, so that the next unjudged line can be
+ found without reading all lines.
+"""
+import csv
+import hashlib
+import random
+import sqlite3
+from pathlib import Path
+from typing import Generator, List, Optional
+
+
+def make_key(line: str) -> str:
+    return hashlib.sha1(line.encode()).hexdigest()
+
+
+class JudgmentStore:
+
+    def __init__(self,
+                 path: Path,
+                 ):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path))
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS judgments (key TEXT PRIMARY KEY, line TEXT, is_bad INTEGER);
+            CREATE TABLE IF NOT EXISTS sample_order (position INTEGER PRIMARY KEY, key TEXT, line TEXT);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+        """)
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM judgments').fetchone()[0]
+
+    def __contains__(self, line: str) -> bool:
+        query = 'SELECT 1 FROM judgments WHERE key = ?'
+        return self.connection.execute(query, (make_key(line),)).fetchone() is not None
+
+    @property
+    def num_bad(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM judgments WHERE is_bad').fetchone()[0]
+
+    def add(self,
+            line: str,
+            is_bad: bool,
+            ) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO judgments VALUES (?, ?, ?)',
+                                (make_key(line), line, int(is_bad)))
+        self.connection.commit()
+
+    # ############################################################## sample order
+
+    def set_sample_order(self,
+                         lines: List[str],
+                         source_key: str,  # identifies the lines, e.g. hash of file they were loaded from
+                         seed: Optional[int] = None,
+                         ) -> None:
+        """shuffle lines and save their order, unless the same lines were shuffled before"""
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'source_key'").fetchone()
+        if row is not None and row[0] == source_key:
+            return
+
+        lines = list(lines)
+        random.Random(seed).shuffle(lines)
+        self.connection.execute('DELETE FROM sample_order')
+        self.connection.executemany('INSERT INTO sample_order VALUES (?, ?, ?)',
+                                    [(n, make_key(line), line) for n, line in enumerate(lines)])
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('source_key', ?)", (source_key,))
+        self.connection.commit()
+
+    def gen_unjudged(self,
+                     batch_size: int = 100,
+                     ) -> Generator[str, None, None]:
+        """yield lines without judgment, in the saved sample order"""
+        query = """
+            SELECT s.position, s.line FROM sample_order s LEFT JOIN judgments j ON s.key = j.key
+            WHERE j.key IS NULL AND s.position > ? ORDER BY s.position LIMIT ?
+        """
+        position = -1
+        while True:
+            rows = self.connection.execute(query, (position, batch_size)).fetchall()
+            if not rows:
+                return
+            for position, line in rows:
+                if line not in self:  # may have been judged since the batch was fetched
+                    yield line
+
+    # ############################################################## csv
+
+    def import_csv(self,
+                   path: Path,
+                   ) -> int:
+        """add judgments from a csv file with columns is_bad, line. return number of imported judgments"""
+        with path.open('r', newline='') as f:
+            rows = [(make_key(row['line']), row['line'], int(row['is_bad'] == 'True')) for row in csv.DictReader(f)]
+        self.connection.executemany('INSERT OR IGNORE INTO judgments VALUES (?, ?, ?)', rows)
+        self.connection.commit()
+        return len(rows)
+
+    def export_csv(self,
+                   path: Path,
+                   ) -> None:
+        """write judgments, in the order in which they were made, to a csv file with columns is_bad, line"""
+        tmp_path = path.with_suffix('.tmp')
+        with tmp_path.open('w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['is_bad', 'line'])
+            for line, is_bad in self.connection.execute('SELECT line, is_bad FROM judgments ORDER BY rowid'):
+                writer.writerow([str(bool(is_bad)), line])
+        tmp_path.replace(path)
+
+    def close(self) -> None:
+        self.connection.close()
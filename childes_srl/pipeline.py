@@ -0,0 +1,163 @@
+"""
+A multi-stage pipeline, in which each stage runs in its own pool of worker threads.
+
+Stages are connected by bounded queues, so that a fast stage cannot run arbitrarily far ahead of a slow one.
+Threads (rather than processes) are used because the models used in each stage (TensorFlow, spaCy, torch)
+ do most of their work outside of the GIL, and because models on GPU cannot be shared across processes.
+"""
+import queue
+import threading
+from typing import Any, Callable, Generator, Iterable, List
+
+_DONE = object()  # signals to a worker that no more items will arrive
+
+
+class Stage:
+
+    def __init__(self,
+                 name: str,
+                 function: Callable[[Any], Any],
+                 num_workers: int = 1,
+                 ):
+        self.name = name
+        self.function = function
+        self.num_workers = num_workers
+
+
+def run_pipeline(items: Iterable[Any],
+                 stages: List[Stage],
+                 queue_size: int = 4,
+                 max_in_flight: int = 16,
+                 poll_interval: float = 0.1,  # seconds between checks whether the pipeline was stopped
+                 ) -> Generator[Any, None, None]:
+    """
+    pass each item through each stage, and yield results in the same order as the items.
+
+    at most max_in_flight items are processed (or waiting to be yielded) at any time,
+     which bounds memory even if an item is slow and later items must wait for it to preserve order.
+    an exception raised in any stage is re-raised here.
+
+    all threads are stopped and joined before the generator finishes, also if a stage fails,
+     or if the consumer stops early (e.g. by closing the generator). items being processed are finished first.
+    """
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    in_flight = threading.Semaphore(max_in_flight)
+    stop = threading.Event()
+    errors = []
+
+    def put(q: queue.Queue,
+            item: Any,
+            ) -> None:
+        """put item in q, unless the pipeline is stopped while q is full"""
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=poll_interval)
+                return
+            except queue.Full:
+                pass
+
+    def get(q: queue.Queue,
+            ) -> Any:
+        """get item from q, or _DONE if the pipeline is stopped while q is empty"""
+        while not stop.is_set():
+            try:
+                return q.get(timeout=poll_interval)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def feed():
+        try:
+            for n, item in enumerate(items):
+                while not in_flight.acquire(timeout=poll_interval) and not stop.is_set():
+                    pass
+                if stop.is_set():
+                    break
+                put(queues[0], (n, item))
+        except Exception as e:
+            errors.append(e)
+        for _ in range(stages[0].num_workers):
+            put(queues[0], _DONE)
+
+    def work(stage_id: int,
+             num_finished: List[int],
+             lock: threading.Lock,
+             ):
+        stage = stages[stage_id]
+        q_in = queues[stage_id]
+        q_out = queues[stage_id + 1]
+        while True:
+            item = get(q_in)
+            if item is _DONE:
+                break
+            n, data = item
+            if data is _DONE:  # an earlier stage failed
+                put(q_out, item)
+                continue
+            try:
+                put(q_out, (n, stage.function(data)))
+            except Exception as e:
+                errors.append(e)
+                put(q_out, (n, _DONE))  # makes the consumer stop
+
+        # the last worker of a stage to finish tells the next stage that no more items will arrive
+        with lock:
+            num_finished[0] += 1
+            is_last = num_finished[0] == stage.num_workers
+        if is_last:
+            num_next = stages[stage_id + 1].num_workers if stage_id + 1 < len(stages) else 1
+            for _ in range(num_next):
+                put(q_out, _DONE)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for stage_id, stage in enumerate(stages):
+        num_finished = [0]
+        lock = threading.Lock()
+        for _ in range(stage.num_workers):
+            threads.append(threading.Thread(target=work, args=(stage_id, num_finished, lock), daemon=True))
+    for thread in threads:
+        thread.start()
+
+    # re-order results
+    n_next = 0
+    n2result = {}
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            n, result = item
+            if result is _DONE:
+                break
+            n2result[n] = result
+            while n_next in n2result:
+                yield n2result.pop(n_next)
+                in_flight.release()
+                n_next += 1
+
+        if errors:
+            raise RuntimeError('Pipeline failed') from errors[0]
+        assert not n2result
+
+    finally:
+        # otherwise, threads would wait forever for a free slot or queue, holding on to their items (and models)
+        stop.set()
+        in_flight.release()  # wakes up the feeder without waiting for poll_interval
+        for thread in threads:
+            thread.join()
+        for q in queues:  # items which were not consumed
+            while not q.empty():
+                q.get_nowait()
+        n2result.clear()
+
+
+def run_sequentially(items: Iterable[Any],
+                     stages: List[Stage],
+                     ) -> Generator[Any, None, None]:
+    """same results as run_pipeline(), in a single thread. useful for debugging and benchmarking"""
+    for item in items:
+        for stage in stages:
+            item = stage.function(item)
+        yield item
+
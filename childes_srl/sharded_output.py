@@ -0,0 +1,168 @@
+"""
+Crash-safe output for long-running annotation jobs.
+
+Lines are appended to shard files as soon as a chunk of input is processed, and a manifest records
+which ranges of the input are complete, and how many bytes of each shard are valid.
+A restarted job skips completed input ranges, and ignores anything written after the last manifest update.
+At the end, shards are merged into a single file, and duplicate lines are removed out of core.
+"""
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from childes_srl.compression import open_text, make_tmp_path, replace
+
+
+class ShardedLineWriter:
+
+    manifest_name = 'manifest.json'
+
+    def __init__(self,
+                 output_dir: Path,
+                 input_name: str,  # identifies the input, so that a different input is not resumed by mistake
+                 num_inputs: int,
+                 lines_per_shard: int = 100_000,
+                 ):
+        self.output_dir = output_dir
+        self.lines_per_shard = lines_per_shard
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.output_dir / self.manifest_name
+        if self.manifest_path.exists():
+            self.manifest = json.loads(self.manifest_path.read_text())
+            if self.manifest['input_name'] != input_name or self.manifest['num_inputs'] != num_inputs:
+                raise ValueError(f'{self.output_dir} contains output for a different input: '
+                                 f'{self.manifest["input_name"]} with {self.manifest["num_inputs"]} items')
+            print(f'Resuming. {self.num_completed:,}/{num_inputs:,} inputs are complete')
+        else:
+            self.manifest = {'input_name': input_name,
+                             'num_inputs': num_inputs,
+                             'completed': [],  # list of [start, end) input ranges
+                             'shard2size': {},  # number of valid bytes in each shard
+                             'counts': {},
+                             }
+
+        self._file = None
+        self._shard_name = None
+        self._num_lines_in_shard = 0
+
+    @property
+    def num_completed(self) -> int:
+        return sum([end - start for start, end in self.manifest['completed']])
+
+    def is_completed(self,
+                     start: int,
+                     end: int,
+                     ) -> bool:
+        """True if input range [start, end) is contained in a completed range"""
+        for completed_start, completed_end in self.manifest['completed']:
+            if completed_start <= start and end <= completed_end:
+                return True
+        return False
+
+    def write(self,
+              start: int,
+              end: int,
+              lines: Iterable[str],
+              counts: Optional[Dict[str, int]] = None,
+              ) -> None:
+        """write lines made from input range [start, end), and record the range as complete"""
+
+        if self._file is None or self._num_lines_in_shard >= self.lines_per_shard:
+            self._open_new_shard()
+
+        for line in lines:
+            self._file.write((line + '\n').encode())
+            self._num_lines_in_shard += 1
+
+        # lines must be on disk before the manifest says they are
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self.manifest['shard2size'][self._shard_name] = self._file.tell()
+        self.manifest['completed'] = self._add_range(self.manifest['completed'], start, end)
+        for k, v in (counts or {}).items():
+            self.manifest['counts'][k] = self.manifest['counts'].get(k, 0) + v
+        self._save_manifest()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def merge(self,
+              out_path: Path,
+              num_partitions: int = 64,
+              ) -> int:
+        """
+        write unique lines of all shards to out_path, and return the number of unique lines.
+
+        lines are first distributed over partition files by hash, so that identical lines end up in the same
+         partition, and each partition is de-duplicated in memory.
+        as in the original output, lines are separated by '\\n' and there is no '\\n' at the end of the file.
+        out_path is compressed if its extension is .gz, .xz or .bz2.
+        """
+        self.close()
+
+        # hash-partition
+        partition_dir = self.output_dir / 'partitions'
+        partition_dir.mkdir(exist_ok=True)
+        partition_paths = [partition_dir / f'{n:0>4}.txt' for n in range(num_partitions)]
+        partition_files = [p.open('w') for p in partition_paths]
+        for line in self.gen_lines():
+            partition_files[zlib.crc32(line.encode()) % num_partitions].write(line + '\n')
+        for f in partition_files:
+            f.close()
+
+        # de-duplicate each partition
+        num_lines = 0
+        tmp_path = make_tmp_path(out_path)
+        with open_text(tmp_path, 'w') as f:
+            for partition_path in partition_paths:
+                lines = sorted(set(partition_path.read_text().split('\n')[:-1]))
+                for line in lines:
+                    if num_lines > 0:  # do not write '\n' at end of file
+                        f.write('\n')
+                    f.write(line)
+                    num_lines += 1
+                partition_path.unlink()
+        replace(tmp_path, out_path)
+        partition_dir.rmdir()
+
+        return num_lines
+
+    def gen_lines(self):
+        """yield all valid lines in all shards, ignoring anything written after the last manifest update"""
+        for shard_name, size in sorted(self.manifest['shard2size'].items()):
+            with (self.output_dir / shard_name).open('rb') as f:
+                data = f.read(size).decode()
+            yield from data.split('\n')[:-1]
+
+    def _open_new_shard(self) -> None:
+        self.close()
+        # a new shard is started for each run, so that a shard never contains a partially written line followed by
+        # new lines
+        self._shard_name = f'shard_{len(self.manifest["shard2size"]):0>6}.txt'
+        self._file = (self.output_dir / self._shard_name).open('wb')
+        self._num_lines_in_shard = 0
+
+    def _save_manifest(self) -> None:
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(self.manifest))
+        tmp_path.replace(self.manifest_path)
+
+    @staticmethod
+    def _add_range(ranges: List[List[int]],
+                   start: int,
+                   end: int,
+                   ) -> List[List[int]]:
+        """add [start, end) to sorted ranges, merging adjacent and overlapping ranges"""
+        res = []
+        for s, e in sorted(ranges + [[start, end]]):
+            if res and s <= res[-1][1]:
+                res[-1][1] = max(res[-1][1], e)
+            else:
+                res.append([s, e])
+        return res
@@ -0,0 +1,220 @@
+"""
+An inverted index over a file of propositions in the pre-processed SRL format, saved to disk.
+
+The index maps
+ each word to the propositions which contain it,
+ each predicate word to the propositions in which it is the predicate,
+ each role to its argument spans (proposition, start, end).
+Each mapping is stored in compressed sparse row format: the entries for key k are values[indptr[k]: indptr[k + 1]].
+"""
+import hashlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from childes_srl.compression import open_text
+from childes_srl.encoding import EncodedCorpus
+from childes_srl.io import parse_srl_line
+from childes_srl.utils import make_srl_string
+
+Span = Tuple[int, int, int]  # proposition id, start, end (exclusive)
+
+
+def make_csr(keys: np.ndarray,
+             num_keys: int,
+             ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    return indptr and order, such that order[indptr[k]: indptr[k + 1]] are the positions in keys which equal k
+    """
+    order = np.argsort(keys, kind='stable')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=num_keys))]).astype(np.int64)
+    return indptr, order
+
+
+class SrlIndex:
+
+    version = 2
+
+    def __init__(self,
+                 corpus: EncodedCorpus,
+                 ):
+        self.corpus = corpus
+
+        # proposition id of each token
+        lengths = np.diff(corpus.offsets)
+        token2prop = np.repeat(np.arange(corpus.num_sentences, dtype=np.int64), lengths)
+
+        # word -> propositions (each proposition once per word)
+        num_words = len(corpus.vocab)
+        pairs = np.unique(corpus.word_ids.astype(np.int64) * corpus.num_sentences + token2prop)
+        self.word_indptr, order = make_csr(pairs // corpus.num_sentences, num_words)
+        self.word_props = (pairs % corpus.num_sentences)[order]
+
+        # predicate word -> propositions
+        predicate_word_ids = corpus.word_ids[corpus.offsets[:-1] + corpus.predicate_indices]
+        self.predicate_indptr, self.predicate_props = make_csr(predicate_word_ids, num_words)
+
+        # role -> spans
+        self.roles, span_roles, span_starts, span_ends = self._find_spans(token2prop)
+        self.span_props = token2prop[span_starts]
+        self.span_starts = span_starts - corpus.offsets[self.span_props]
+        self.span_ends = span_ends - corpus.offsets[self.span_props]
+        self.role_indptr, self.role_spans = make_csr(span_roles, len(self.roles))
+
+    def _find_spans(self,
+                    token2prop: np.ndarray,
+                    ) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """
+        return roles, and role, start and end (as positions in corpus) of each argument span.
+        a span starts at a B- tag, or an I- tag which does not continue a span of the same role.
+        """
+        tag_vocab = self.corpus.tag_vocab
+        roles = sorted({tag[2:] for tag in tag_vocab if tag[:2] in {'B-', 'I-'}})
+        role2id = {role: i for i, role in enumerate(roles)}
+        tag2role = np.array([role2id.get(tag[2:], -1) if tag[:2] in {'B-', 'I-'} else -1 for tag in tag_vocab],
+                            dtype=np.int64)
+        tag2is_inside = np.array([tag.startswith('I-') for tag in tag_vocab], dtype=bool)
+
+        token_roles = tag2role[self.corpus.tag_ids]
+        is_inside = tag2is_inside[self.corpus.tag_ids]
+        is_continuation = np.zeros(len(token_roles), dtype=bool)
+        is_continuation[1:] = (is_inside[1:]
+                               & (token_roles[1:] == token_roles[:-1])
+                               & (token2prop[1:] == token2prop[:-1]))
+
+        starts = np.flatnonzero((token_roles >= 0) & ~is_continuation)
+        # a span ends at the first position after its start which does not continue it
+        boundaries = np.append(np.flatnonzero(~is_continuation), len(token_roles))
+        ends = boundaries[np.searchsorted(boundaries, starts, side='right')]
+        return roles, token_roles[starts], starts, ends
+
+    @classmethod
+    def from_file(cls,
+                  srl_path: Path,
+                  ) -> 'SrlIndex':
+        """index all propositions in file, in file order (proposition id = line number, ignoring empty lines)"""
+        propositions = []
+        with open_text(srl_path) as f:
+            for line in f:
+                if line.strip():
+                    propositions.append(parse_srl_line(line))
+        return cls(EncodedCorpus.from_srl_propositions(propositions))
+
+    @classmethod
+    def from_file_cached(cls,
+                         srl_path: Path,
+                         cache_dir: Path,
+                         ) -> 'SrlIndex':
+        """load index of srl_path from cache_dir, if the file did not change since the index was built"""
+        h = hashlib.sha1()
+        with srl_path.open('rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        h.update(f'{cls.version} {EncodedCorpus.version}'.encode())
+        cache_path = cache_dir / f'{srl_path.stem}_index_{h.hexdigest()[:16]}.npz'
+        if cache_path.exists():
+            print(f'Loading index from {cache_path}')
+            return cls.load(cache_path)
+
+        res = cls.from_file(srl_path)
+        res.save(cache_path)
+        return res
+
+    def save(self,
+             path: Path,
+             ) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp.npz')
+        index_arrays = {name: getattr(self, name) for name in self._array_names}
+        np.savez(str(tmp_path),
+                 index_version=np.array(self.version),
+                 roles=np.array(self.roles, dtype=np.str_),
+                 **self.corpus.to_arrays(),
+                 **index_arrays)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls,
+             path: Path,
+             ) -> 'SrlIndex':
+        d = np.load(str(path))
+        if int(d['index_version']) != cls.version:
+            raise ValueError(f'Index at {path} has version {int(d["index_version"])} but expected {cls.version}')
+        res = cls.__new__(cls)
+        res.corpus = EncodedCorpus.from_arrays(d)
+        res.roles = d['roles'].tolist()
+        for name in cls._array_names:
+            setattr(res, name, d[name])
+        return res
+
+    _array_names = ['word_indptr', 'word_props',
+                    'predicate_indptr', 'predicate_props',
+                    'span_props', 'span_starts', 'span_ends', 'role_indptr', 'role_spans']
+
+    # ############################################################## queries
+
+    def find_propositions(self,
+                          word: Optional[str] = None,  # propositions containing word
+                          predicate: Optional[str] = None,  # propositions in which predicate is word
+                          ) -> np.ndarray:
+        """return ids of propositions which satisfy all given conditions"""
+        res = None
+        for key, indptr, values in [(word, self.word_indptr, self.word_props),
+                                    (predicate, self.predicate_indptr, self.predicate_props)]:
+            if key is None:
+                continue
+            key_id = self.corpus.word2id.get(key)
+            props = values[indptr[key_id]: indptr[key_id + 1]] if key_id is not None else np.array([], dtype=np.int64)
+            res = props if res is None else np.intersect1d(res, props)
+        if res is None:
+            return np.arange(self.corpus.num_sentences)
+        return np.sort(res)
+
+    def find_spans(self,
+                   role: str,
+                   predicate: Optional[str] = None,  # only spans in propositions in which predicate is word
+                   containing: Optional[str] = None,  # only spans which contain word
+                   ) -> List[Span]:
+        """return (proposition id, start, end) of argument spans with role, which satisfy all given conditions"""
+        if role not in self.roles:
+            return []
+        role_id = self.roles.index(role)
+        span_ids = self.role_spans[self.role_indptr[role_id]: self.role_indptr[role_id + 1]]
+
+        if predicate is not None:
+            span_ids = span_ids[np.isin(self.span_props[span_ids], self.find_propositions(predicate=predicate))]
+
+        if containing is not None:
+            if containing not in self.corpus.word2id:
+                return []
+            span_ids = span_ids[np.isin(self.span_props[span_ids], self.find_propositions(word=containing))]
+            # look up the words of the remaining spans only, and count matches per span
+            starts = self.corpus.offsets[self.span_props[span_ids]] + self.span_starts[span_ids]
+            lengths = self.span_ends[span_ids] - self.span_starts[span_ids]
+            positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            is_match = self.corpus.word_ids[positions] == self.corpus.word2id[containing]
+            num_matches = np.bincount(np.repeat(np.arange(len(span_ids)), lengths), weights=is_match,
+                                      minlength=len(span_ids))
+            span_ids = span_ids[num_matches > 0]
+
+        return list(zip(self.span_props[span_ids].tolist(),
+                        self.span_starts[span_ids].tolist(),
+                        self.span_ends[span_ids].tolist()))
+
+    # ############################################################## rendering
+
+    def get_words(self, prop_id: int) -> List[str]:
+        start, end = self.corpus.offsets[prop_id], self.corpus.offsets[prop_id + 1]
+        return [self.corpus.vocab[i] for i in self.corpus.word_ids[start: end]]
+
+    def get_tags(self, prop_id: int) -> List[str]:
+        start, end = self.corpus.offsets[prop_id], self.corpus.offsets[prop_id + 1]
+        return [self.corpus.tag_vocab[i] for i in self.corpus.tag_ids[start: end]]
+
+    def render_proposition(self, prop_id: int) -> str:
+        return make_srl_string(self.get_words(prop_id), self.get_tags(prop_id))
+
+    def render_span(self, span: Span) -> str:
+        prop_id, start, end = span
+        return ' '.join(self.get_words(prop_id)[start: end])
@@ -0,0 +1,258 @@
+"""
+Local stand-ins for the models used to annotate CHILDES with semantic role labels.
+
+They have the same interface as the parts of the AllenNLP predictor (and the DeepSegment segmenter)
+used by the annotation and evaluation scripts, so that those scripts can be run and benchmarked
+without downloading any model. Predictions are made with simple rules, and are not meant to be accurate.
+The time a real model needs for a batch is emulated by sleeping in proportion to the padded batch size.
+
+Stand-ins for the AllenNLP classes which training instances are made of hold the same data,
+ so that instances can be made (e.g. by bert_recipes.pre_processing) without AllenNLP installed.
+"""
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import spacy
+
+STUB_VERBS = {'want', 'see', 'go', 'do', 'look', 'put', 'have', 'get', 'like', 'play', 'eat', 'say',
+              'make', 'come', 'think', 'know', 'give', 'read', 'sit', 'take', 'let', 'find', 'need',
+              'is', 'are', "'s", "'re", 'was', 'did', 'does', 'going', 'doing', 'got'}
+PUNCTUATION = {'.', '?', '!'}
+
+
+def tag_stub_verbs(doc):
+    """marks every word in STUB_VERBS as a verb"""
+    for token in doc:
+        if token.text.lower() in STUB_VERBS:
+            token.pos_ = 'VERB'
+    return doc
+
+
+class StubTagger:
+    """
+    spaCy pipeline component with the same interface as spaCy's tagger.
+    emulates the fixed cost of each call to the model, which is paid once per doc by __call__(),
+     but only once per batch by pipe().
+    """
+
+    def __init__(self,
+                 seconds_per_call: float = 0.0,
+                 ):
+        self.seconds_per_call = seconds_per_call
+
+    def __call__(self, doc):
+        time.sleep(self.seconds_per_call)
+        return tag_stub_verbs(doc)
+
+    def pipe(self, docs, batch_size=128, **kwargs):
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) == batch_size:
+                yield from self._tag_batch(batch)
+                batch = []
+        yield from self._tag_batch(batch)
+
+    def _tag_batch(self, batch):
+        if batch:
+            time.sleep(self.seconds_per_call)
+        return [tag_stub_verbs(doc) for doc in batch]
+
+
+def make_stub_spacy(seconds_per_call: float = 0.0,
+                    ):
+    nlp = spacy.blank('en')
+    nlp.add_pipe(StubTagger(seconds_per_call), name='stub_tagger')
+    return nlp
+
+
+class StubDatasetReader:
+
+    @staticmethod
+    def text_to_instance(tokens: List[Any],
+                         verb_label: List[int],
+                         ) -> Dict[str, Any]:
+        return {'words': [t.text for t in tokens],
+                'verb_label': verb_label}
+
+
+class StubSrlModel:
+
+    def __init__(self,
+                 seconds_per_token: float = 0.0,
+                 ):
+        self.seconds_per_token = seconds_per_token
+
+    def forward_on_instances(self,
+                             instances: List[Dict[str, Any]],
+                             ) -> List[Dict[str, Any]]:
+
+        if not instances:
+            return []
+
+        # emulate computation on a padded batch
+        max_length = max([len(instance['words']) for instance in instances])
+        time.sleep(self.seconds_per_token * len(instances) * max_length)
+
+        return [self.forward_on_instance(instance) for instance in instances]
+
+    @staticmethod
+    def forward_on_instance(instance: Dict[str, Any],
+                            ) -> Dict[str, Any]:
+        """
+        predicate is B-V, the word before it is B-ARG0, and words after it (until punctuation) are ARG1
+        """
+        words = instance['words']
+        verb_index = instance['verb_label'].index(1)
+
+        tags = ['O' for _ in words]
+        tags[verb_index] = 'B-V'
+        if verb_index > 0 and words[verb_index - 1] not in PUNCTUATION:
+            tags[verb_index - 1] = 'B-ARG0'
+        prefix = 'B-'
+        for i in range(verb_index + 1, len(words)):
+            if words[i] in PUNCTUATION:
+                break
+            tags[i] = prefix + 'ARG1'
+            prefix = 'I-'
+
+        return {'words': words,
+                'verb': words[verb_index],
+                'tags': tags}
+
+
+class StubPredictor:
+    """
+    exposes the same private attributes of allennlp.predictors.SemanticRoleLabelerPredictor used in this repository
+    """
+
+    def __init__(self,
+                 seconds_per_token: float = 0.0,
+                 seconds_per_tagger_call: float = 0.0,
+                 ):
+        self._tokenizer = SimpleNamespace(spacy=make_stub_spacy(seconds_per_tagger_call))
+        self._dataset_reader = StubDatasetReader()
+        self._model = StubSrlModel(seconds_per_token)
+
+
+class StubSegmenter:
+    """
+    same interface as deepsegment.DeepSegment.
+    splits after every punctuation mark, and emulates the time needed by the model for each batch.
+    """
+
+    def __init__(self,
+                 seconds_per_token: float = 0.0,
+                 ):
+        self.seconds_per_token = seconds_per_token
+
+    def segment(self, sents, batch_size=32):
+
+        if isinstance(sents, str):
+            return self.segment([sents])[0]
+
+        max_length = max([len(s.split()) for s in sents]) if sents else 0
+        time.sleep(self.seconds_per_token * len(sents) * max_length)
+
+        res = []
+        for sent in sents:
+            segments = [[]]
+            for w in sent.split():
+                segments[-1].append(w)
+                if w in PUNCTUATION:
+                    segments.append([])
+            res.append([' '.join(s) for s in segments if s])
+        return res
+
+
+class StubWordpieceTokenizer:
+    """
+    same interface as the word-piece tokenizer of BERT (vocab, and tokenize() of a single word).
+    words are lower-cased, and split greedily into the longest pieces in the vocabulary.
+    """
+
+    def __init__(self,
+                 vocab_path: Path,
+                 max_chars_per_word: int = 100,
+                 ):
+        self.vocab = {wp: i for i, wp in enumerate(vocab_path.read_text().split('\n')) if wp}
+        self.max_chars_per_word = max_chars_per_word
+
+    def tokenize(self, word: str) -> List[str]:
+        word = word.lower()
+        if len(word) > self.max_chars_per_word:
+            return ['[UNK]']
+        res = []
+        start = 0
+        while start < len(word):
+            for end in range(len(word), start, -1):
+                piece = word[start: end] if start == 0 else '##' + word[start: end]
+                if piece in self.vocab:
+                    res.append(piece)
+                    start = end
+                    break
+            else:
+                return ['[UNK]']
+        return res
+
+
+# ############################################################## AllenNLP data classes
+
+class StubToken:
+    __slots__ = ['text', 'text_id']
+
+    def __init__(self,
+                 text: str,
+                 text_id: Optional[int] = None,
+                 ):
+        self.text = text
+        self.text_id = text_id
+
+
+class StubTextField:
+
+    def __init__(self,
+                 tokens: List[StubToken],
+                 token_indexers: Dict[str, Any],
+                 ):
+        self.tokens = tokens
+        self._token_indexers = token_indexers
+
+
+class StubSequenceLabelField:
+
+    def __init__(self,
+                 labels: List[Any],
+                 sequence_field: StubTextField,
+                 ):
+        self.labels = labels
+        self.sequence_field = sequence_field
+
+
+class StubMetadataField:
+
+    def __init__(self,
+                 metadata: Any,
+                 ):
+        self.metadata = metadata
+
+
+class StubInstance:
+
+    def __init__(self,
+                 fields: Dict[str, Any],
+                 ):
+        self.fields = fields
+
+    def __getitem__(self, key: str) -> Any:
+        return self.fields[key]
+
+
+# same attributes as bert_recipes.pre_processing.load_allennlp_data_classes()
+STUB_ALLENNLP_DATA_CLASSES = SimpleNamespace(Instance=StubInstance,
+                                             TextField=StubTextField,
+                                             SequenceLabelField=StubSequenceLabelField,
+                                             MetadataField=StubMetadataField,
+                                             Token=StubToken)
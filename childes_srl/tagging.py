@@ -0,0 +1,67 @@
+"""
+POS-tagging of pre-tokenized sentences with spaCy, in batches.
+
+spaCy's Language.pipe() only accepts raw text, which would be re-tokenized.
+Instead, a Doc is made from the given words, and docs are streamed through each pipeline component,
+ using the component's own pipe() method where it has one (e.g. the tagger), so that docs are processed in batches.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Generator, Iterable, Iterator, List
+
+from spacy.tokens import Doc
+
+
+def _tag_batch(nlp,
+               batch: List[List[str]],
+               batch_size: int,
+               ) -> List[Doc]:
+    docs = (Doc(nlp.vocab, words=words) for words in batch)
+    for name, proc in nlp.pipeline:
+        if hasattr(proc, 'pipe'):
+            docs = proc.pipe(docs, batch_size=batch_size)
+        else:
+            docs = (proc(doc) for doc in docs)
+    return list(docs)
+
+
+def _gen_batches(sentences: Iterable[List[str]],
+                 batch_size: int,
+                 ) -> Generator[List[List[str]], None, None]:
+    it = iter(sentences)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def tag_pretokenized(nlp,
+                     sentences: Iterable[List[str]],
+                     batch_size: int = 1000,
+                     num_workers: int = 1,
+                     ) -> Iterator[Doc]:
+    """
+    yield one tagged Doc per sentence, in the same order as the sentences.
+
+    with num_workers > 1, batches are tagged in a pool of threads which share the same model.
+    """
+    batches = _gen_batches(sentences, batch_size)
+    if num_workers == 1:
+        for batch in batches:
+            yield from _tag_batch(nlp, batch, batch_size)
+    else:
+        # at most 2 batches per worker are submitted ahead, so that a long stream of sentences is not read at once
+        with ThreadPoolExecutor(num_workers) as executor:
+            futures = deque()
+            for batch in batches:
+                futures.append(executor.submit(_tag_batch, nlp, batch, batch_size))
+                if len(futures) == 2 * num_workers:
+                    yield from futures.popleft().result()
+            while futures:
+                yield from futures.popleft().result()
+
+
+def get_verb_indices(doc: Doc) -> List[int]:
+    return [i for i, token in enumerate(doc) if token.pos_ == 'VERB']
@@ -1,5 +1,6 @@
-from typing import List
+from typing import List, Union
 
+import numpy
 import torch
 
 
@@ -0,0 +1,67 @@
+"""
+A persistent cache of annotations of unique utterances.
+
+CHILDES contains many repeated utterances (e.g. "what's that ?"), and their annotation does not depend on context.
+Annotations are stored in a sqlite database, keyed by a hash of the utterance and of a namespace
+ (which should identify the models that made the annotation, so that a different model does not read stale results).
+Re-runs, and runs on an updated corpus, only need to annotate utterances that have not been seen before.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable
+
+
+class UtteranceCache:
+
+    def __init__(self,
+                 path: Path,
+                 namespace: str,  # e.g. names of segmentation and SRL model
+                 ):
+        self.path = path
+        self.namespace = namespace
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # the connection is shared by the pipeline's worker threads, and access is serialized with a lock
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS annotations (key TEXT PRIMARY KEY, value TEXT)')
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def make_key(self,
+                 utterance: str,
+                 ) -> str:
+        return hashlib.sha1(f'{self.namespace}\t{utterance}'.encode()).hexdigest()
+
+    def get_many(self,
+                 utterances: Iterable[str],
+                 ) -> Dict[str, Any]:
+        """return annotations of those utterances that are in the cache"""
+        key2utterance = {self.make_key(u): u for u in utterances}
+        keys = list(key2utterance)
+        res = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):  # sqlite limits the number of parameters in a query
+                batch = keys[start: start + 500]
+                query = f'SELECT key, value FROM annotations WHERE key IN ({",".join("?" * len(batch))})'
+                for key, value in self._connection.execute(query, batch):
+                    res[key2utterance[key]] = json.loads(value)
+        return res
+
+    def put_many(self,
+                 utterance2annotation: Dict[str, Any],
+                 ) -> None:
+        rows = [(self.make_key(u), json.dumps(a)) for u, a in utterance2annotation.items()]
+        with self._lock:
+            self._connection.executemany('INSERT OR REPLACE INTO annotations VALUES (?, ?)', rows)
+            self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM annotations').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,194 @@
+"""
+Validate files in the pre-processed SRL format: {predicate_index} [word0, word1 ...] ||| [label0, label1 ...]
+
+Lines are parsed once, and encoded into flat arrays (one entry per line, or per tag),
+ so that all checks are vectorized over a shard of the file.
+Shards are validated in parallel, in a pool of processes, and errors are reported by type, with line numbers.
+"""
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from childes_srl.compression import read_text_range
+from childes_srl.corpus_stats import get_shard_ranges
+
+# roles predicted by the AllenNLP SRL tagger (PropBank, as annotated in OntoNotes)
+SRL_ROLES = {'V', 'ARG0', 'ARG1', 'ARG2', 'ARG3', 'ARG4', 'ARG5', 'ARGA'} | {
+    f'ARGM-{m}' for m in ['ADJ', 'ADV', 'CAU', 'COM', 'DIR', 'DIS', 'DSP', 'EXT', 'GOL', 'LOC', 'LVB', 'MNR',
+                          'MOD', 'NEG', 'PNC', 'PRD', 'PRP', 'PRR', 'PRX', 'REC', 'TMP']}
+
+ERROR_TYPES = [
+    'malformed',  # no "|||", or predicate index is not an integer
+    'length_mismatch',  # number of labels is not number of words
+    'predicate_out_of_bounds',  # predicate index is not the index of a word
+    'num_predicates',  # not exactly one B-V label
+    'predicate_not_B-V',  # the label of the predicate is not B-V (checked only if no error above)
+    'illegal_transition',  # I- label which does not continue a B- or I- label with the same role
+    'unknown_tag',  # label is not O, or B- or I- followed by a known role
+]
+
+
+def make_known_tags(roles: Set[str] = SRL_ROLES,
+                    ) -> Set[str]:
+    """all labels, including reference (R-) and continuation (C-) arguments"""
+    roles = roles | {f'{prefix}-{role}' for role in roles if role != 'V' for prefix in ['R', 'C']}
+    return {'O'} | {f'{bio}-{role}' for role in roles for bio in ['B', 'I']}
+
+
+class ValidationReport:
+
+    def __init__(self):
+        self.num_lines = 0
+        self.error2line_numbers: Dict[str, List[int]] = defaultdict(list)  # 1-based line numbers
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.error2line_numbers
+
+    @property
+    def num_invalid_lines(self) -> int:
+        return len({n for line_numbers in self.error2line_numbers.values() for n in line_numbers})
+
+    def merge(self,
+              other: 'ValidationReport',
+              ) -> None:
+        """add report of the lines following the lines in this report"""
+        for error_type, line_numbers in other.error2line_numbers.items():
+            self.error2line_numbers[error_type] += [n + self.num_lines for n in line_numbers]
+        self.num_lines += other.num_lines
+
+    def summarize(self) -> str:
+        counts = ', '.join([f'{error_type}={len(self.error2line_numbers[error_type]):,}'
+                            for error_type in ERROR_TYPES if error_type in self.error2line_numbers])
+        return f'{self.num_invalid_lines:,} of {self.num_lines:,} lines are invalid ({counts})'
+
+    def print_report(self,
+                     max_line_numbers: int = 10,  # per error type
+                     ) -> None:
+        print(self.summarize())
+        for error_type in ERROR_TYPES:
+            line_numbers = self.error2line_numbers.get(error_type, [])
+            if not line_numbers:
+                continue
+            ellipsis = ' ...' if len(line_numbers) > max_line_numbers else ''
+            print(f'{error_type:<24} {len(line_numbers):>9,} lines: '
+                  f'{" ".join(map(str, line_numbers[:max_line_numbers]))}{ellipsis}')
+
+
+def find_errors(num_words: np.ndarray,  # per line
+                predicate_indices: np.ndarray,  # per line
+                tag_ids: np.ndarray,  # labels of all lines, concatenated
+                num_tags: np.ndarray,  # per line
+                tag_vocab: List[str],
+                known_tags: Set[str],
+                ) -> Dict[str, np.ndarray]:
+    """return, for each type of error, the indices of the lines with the error"""
+    num_lines = len(num_words)
+    token2line = np.repeat(np.arange(num_lines), num_tags)
+    tag_offsets = np.concatenate([[0], np.cumsum(num_tags)]).astype(np.int64)
+    res = {}
+
+    res['length_mismatch'] = num_words != num_tags
+    res['predicate_out_of_bounds'] = (predicate_indices < 0) | (predicate_indices >= num_words)
+
+    # B-V
+    is_bv = np.array([tag == 'B-V' for tag in tag_vocab], dtype=bool)[tag_ids]
+    num_bv = np.bincount(token2line[is_bv], minlength=num_lines)
+    res['num_predicates'] = num_bv != 1
+    is_checkable = ~(res['length_mismatch'] | res['predicate_out_of_bounds'] | res['num_predicates'])
+    predicate_positions = tag_offsets[:-1][is_checkable] + predicate_indices[is_checkable]
+    res['predicate_not_B-V'] = np.zeros(num_lines, dtype=bool)
+    res['predicate_not_B-V'][is_checkable] = ~is_bv[predicate_positions]
+
+    # transitions: I-X must follow B-X or I-X in the same line
+    roles = sorted({tag[2:] for tag in tag_vocab if tag[:2] in {'B-', 'I-'}})
+    role2id = {role: i for i, role in enumerate(roles)}
+    tag2role = np.array([role2id[tag[2:]] if tag[:2] in {'B-', 'I-'} else -1 for tag in tag_vocab], dtype=np.int64)
+    tag2is_inside = np.array([tag.startswith('I-') for tag in tag_vocab], dtype=bool)
+    token_roles = tag2role[tag_ids]
+    is_continuation = np.zeros(len(tag_ids), dtype=bool)
+    is_continuation[1:] = (token_roles[1:] == token_roles[:-1]) & (token2line[1:] == token2line[:-1])
+    is_illegal = tag2is_inside[tag_ids] & ~is_continuation
+    res['illegal_transition'] = np.bincount(token2line[is_illegal], minlength=num_lines) > 0
+
+    # tag set
+    is_unknown = np.array([tag not in known_tags for tag in tag_vocab], dtype=bool)[tag_ids]
+    res['unknown_tag'] = np.bincount(token2line[is_unknown], minlength=num_lines) > 0
+
+    return {error_type: np.flatnonzero(is_error) for error_type, is_error in res.items()}
+
+
+def validate_shard(file_path: Path,
+                   start: int,
+                   end: int,
+                   known_tags: Set[str],
+                   ) -> ValidationReport:
+    lines = read_text_range(file_path, start, end).split('\n')
+    if lines and lines[-1] == '':  # the shard ends with a newline
+        lines.pop()
+
+    # parse and encode
+    line_numbers = []  # of lines which are not malformed, 0-based
+    malformed_line_numbers = []
+    num_words = []
+    predicate_indices = []
+    tag2id = {}
+    tag_ids = []
+    num_tags = []
+    for n, line in enumerate(lines):
+        if not line.strip():
+            continue
+        parts = line.split('|||')
+        left = parts[0].split()
+        if len(parts) != 2 or not left or not left[0].lstrip('-').isdigit():
+            malformed_line_numbers.append(n)
+            continue
+        tags = parts[1].split()
+        line_numbers.append(n)
+        num_words.append(len(left) - 1)
+        predicate_indices.append(int(left[0]))
+        tag_ids += [tag2id.setdefault(t, len(tag2id)) for t in tags]
+        num_tags.append(len(tags))
+
+    line_numbers = np.array(line_numbers, dtype=np.int64)
+    error2lines = find_errors(np.array(num_words, dtype=np.int64),
+                              np.array(predicate_indices, dtype=np.int64),
+                              np.array(tag_ids, dtype=np.int64),
+                              np.array(num_tags, dtype=np.int64),
+                              list(tag2id),
+                              known_tags)
+
+    res = ValidationReport()
+    res.num_lines = len(lines)
+    if malformed_line_numbers:
+        res.error2line_numbers['malformed'] = [n + 1 for n in malformed_line_numbers]
+    for error_type, lines_with_error in error2lines.items():
+        if len(lines_with_error):
+            res.error2line_numbers[error_type] = (line_numbers[lines_with_error] + 1).tolist()
+    return res
+
+
+def validate_file(file_path: Path,
+                  num_workers: int = 1,
+                  shard_size: int = 1 << 26,  # bytes
+                  known_tags: Optional[Set[str]] = None,
+                  ) -> ValidationReport:
+    """check every line of a file in the pre-processed SRL format"""
+    if known_tags is None:
+        known_tags = make_known_tags()
+
+    ranges = get_shard_ranges(file_path, shard_size)
+    res = ValidationReport()
+    if num_workers == 1:
+        for start, end in ranges:
+            res.merge(validate_shard(file_path, start, end, known_tags))
+    else:
+        with ProcessPoolExecutor(num_workers) as executor:
+            futures = [executor.submit(validate_shard, file_path, start, end, known_tags) for start, end in ranges]
+            for future in futures:
+                res.merge(future.result())
+    return res
+
@@ -0,0 +1,24 @@
+"""
+Convert pre-processed SRL data (one line per proposition) to the grouped format (one line per sentence),
+ or back. In the grouped format, each sentence is stored once, followed by the predicate index and labels of
+ each of its propositions: [word0, word1 ...] ||| {predicate_id} [label0, label1 ...] ||| {predicate_id} ...
+"""
+from childes_srl import configs
+from childes_srl.io import convert_srl_to_grouped, convert_grouped_to_srl
+
+NAMES = ['human-based-2008', 'human-based-2018']
+TO_GROUPED = True  # False: convert grouped files back to one line per proposition, in {name}_srl_ungrouped.txt
+COMPRESSION = ''  # e.g. '.gz'
+
+
+for name in NAMES:
+    srl_path = configs.Dirs.data / 'pre_processed' / f'{name}_srl.txt{COMPRESSION}'
+    grouped_path = configs.Dirs.data / 'pre_processed' / f'{name}_srl_grouped.txt{COMPRESSION}'
+    if TO_GROUPED:
+        num_propositions, num_sentences = convert_srl_to_grouped(srl_path, grouped_path)
+        print(f'Wrote {num_propositions:,} propositions of {num_sentences:,} sentences to {grouped_path}')
+    else:
+        # not written to srl_path, which is the source of the grouped file
+        ungrouped_path = configs.Dirs.data / 'pre_processed' / f'{name}_srl_ungrouped.txt{COMPRESSION}'
+        num_propositions = convert_grouped_to_srl(grouped_path, ungrouped_path)
+        print(f'Wrote {num_propositions:,} propositions to {ungrouped_path}')
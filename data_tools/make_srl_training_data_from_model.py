@@ -1,135 +1,117 @@
-from spacy.tokens import Doc
 import pyprind
 from deepsegment import DeepSegment
-from typing import Generator
 import logging
-import tensorflow as tf
 
 from allennlp.predictors.predictor import Predictor
-from allennlp.data.instance import Instance
-from allennlp.common.util import sanitize
 
 from childes_srl.io import load_mlm_data
 from childes_srl import configs
 from childes_srl.utils import make_srl_string
+from childes_srl.annotation import SrlAnnotator
+from childes_srl.sharded_output import ShardedLineWriter
+from childes_srl.utterance_cache import UtteranceCache
+from childes_srl.devices import configure_torch, configure_tensorflow
 
 CORPUS_NAME = 'childes-20191206'
 INTERACTIVE = False
 BATCH_SIZE = 128
-
-
-def gen_instances_from_segment(seg: str,
-                               ) -> Generator[Instance, None, None]:
-    # POS-tagging
-    words = seg.split()
-    spacy_doc = Doc(predictor._tokenizer.spacy.vocab, words=words)
-    for pipe in filter(None, predictor._tokenizer.spacy.pipeline):
-        pipe[1](spacy_doc)  # this does POS tagging
-
-    # to instances - one for each verb in utterance
-    tokens = [token for token in spacy_doc]
-    for i, word in enumerate(tokens):
-        if word.pos_ == "VERB":
-            verb_labels = [0 for _ in words]
-            verb_labels[i] = 1
-            instance = predictor._dataset_reader.text_to_instance(tokens, verb_labels)
-
-            yield instance
-
-
-def gen_instances() -> Generator[Instance, None, None]:
-    for u in utterances:
-        # possibly segment utterance into multiple well-formed sentences
-        words_string = ' '.join(u)
-        segments = segmentation.segment(words_string)
-        for segment in segments:
-            instances = gen_instances_from_segment(segment)
-            # in case no verbs are found
-            if not instances:
-                continue
-            else:
-                yield from instances
-
+LOOK_AHEAD = 8  # number of batches whose instances are sorted by length, to reduce padding
+SEGMENTATION_BATCH_SIZE = 256
+MAX_TRIVIAL_LENGTH = 4  # short utterances with only sentence-final punctuation are not segmented. 0: segment all
+CHUNK_SIZE = 1024  # number of utterances passed through the pipeline together
+NUM_SEGMENTATION_WORKERS = 1
+NUM_TAGGING_WORKERS = 1
+NUM_SRL_WORKERS = 1
+QUEUE_SIZE = 4  # max number of chunks waiting between two stages
+LINES_PER_SHARD = 100_000
+USE_CACHE = True  # re-use annotations of utterances annotated in previous runs
+SRL_MODEL_URL = "https://s3-us-west-2.amazonaws.com/allennlp/models/bert-base-srl-2019.06.17.tar.gz"
+USE_GPU = None  # None: use GPU if available. set to False to run on CPU
+NUM_INTRA_OP_THREADS = 0  # per framework. 0: framework default (all cores). limit when running several processes
+NUM_INTER_OP_THREADS = 0
+COMPRESSION = ''  # '.gz', '.xz' or '.bz2' to compress the output in blocks, which can be decompressed in parallel
+
+# devices and thread pools - before any model is loaded
+configure_tensorflow(USE_GPU, NUM_INTRA_OP_THREADS, NUM_INTER_OP_THREADS)
+cuda_device = configure_torch(USE_GPU, NUM_INTRA_OP_THREADS, NUM_INTER_OP_THREADS)
 
 # srl tagger
-predictor = Predictor.from_path("https://s3-us-west-2.amazonaws.com/allennlp/models/bert-base-srl-2019.06.17.tar.gz",
-                                cuda_device=0)
+predictor = Predictor.from_path(SRL_MODEL_URL, cuda_device=cuda_device)
 
 # segmentation model for splitting ill-formed utterances into well-formed sentences
 logging.disable(logging.WARNING)
-gpu_devices = tf.config.experimental.list_physical_devices('GPU')
-tf.config.experimental.set_memory_growth(gpu_devices[0], True)  # do not take all GPU memory - tagger needs some too
 segmentation = DeepSegment('en')
 
 # utterances
 path_to_mlm_data = configs.Dirs.data / 'raw' / 'childes' / f'{CORPUS_NAME}_mlm.txt'
 utterances = load_mlm_data(path_to_mlm_data)
 
-it = gen_instances()
-
-progress_bar = pyprind.ProgBar(len(utterances) // BATCH_SIZE, stream=1)
-num_no_verb = 0
-num_only_verb = 0
-lines = set()
-outer_loop = True
-while outer_loop:
-
-    # fill batch with instances
-    batch = []
-    while len(batch) < BATCH_SIZE:
-        try:
-            instance = next(it)
-        except StopIteration:
-            outer_loop = False
-            break
-        batch.append(instance)
-
-    # get SRL predictions for batch of instances
-    res = predictor._model.forward_on_instances(batch)
-
-    # make a line for each instance
-    for d in sanitize(res):
-        tags = d['tags']
-        words = d['words']
-
-        # sometimes there is no B-V
-        if 'B-V' not in tags:
-            num_no_verb += 1
-            continue
-
-        # sometimes there is only a verb but no arguments (e.g. auxiliary word) - skip
-        if not [tag for tag in tags if 'ARG' in tag]:
-            num_only_verb += 1
-            continue
-
-        # make line
-        verb_index = tags.index('B-V')
-        x_string = " ".join(words)
-        y_string = " ".join(tags)
-        line = f'{verb_index} {x_string} ||| {y_string}'
-
-        if INTERACTIVE:
-            print('=====================================')
-            print(make_srl_string(words, tags))
-            print(line)
-            key = input('\n[q] to quit. Any key to continue.\n')
-            if key != 'q':
-                pass
-            else:
-                raise SystemExit('Quit')
-
-        lines.add(line)
-
-    progress_bar.update()
-
-print(f'Collected {len(lines)} lines')
-print(f'Skipped {num_no_verb} utterances due to absence of B-V tag')
-print(f'Skipped {num_only_verb} utterances due to presence of only B-V tag')
-
-print(f'Writing {len(lines)} lines to file...')
-srl_path = configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl.txt'
-with srl_path.open('w') as f:
-    for n, line in enumerate(lines):
-        f.write(line)
-        if n + 1 != len(lines):  # do not write '\n' at end of file
-            f.write('\n')
+# annotations of unique utterances - the namespace must change when a different model is used
+if USE_CACHE:
+    cache = UtteranceCache(configs.Dirs.cache / 'srl_annotations.sqlite', namespace=f'deepsegment-en {SRL_MODEL_URL}')
+    print(f'Loaded cache with annotations of {len(cache):,} unique utterances')
+else:
+    cache = None
+
+# segmentation, POS-tagging, and SRL tagging run concurrently, each in its own worker pool
+annotator = SrlAnnotator(predictor,
+                         segmentation,
+                         batch_size=BATCH_SIZE,
+                         look_ahead=LOOK_AHEAD,
+                         segmentation_batch_size=SEGMENTATION_BATCH_SIZE,
+                         max_trivial_length=MAX_TRIVIAL_LENGTH,
+                         chunk_size=CHUNK_SIZE,
+                         num_segmentation_workers=NUM_SEGMENTATION_WORKERS,
+                         num_tagging_workers=NUM_TAGGING_WORKERS,
+                         num_srl_workers=NUM_SRL_WORKERS,
+                         queue_size=QUEUE_SIZE,
+                         cache=cache)
+
+# lines are written to shards after each chunk, so that a restarted job can skip chunks that are complete
+shards_path = configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl_shards'
+writer = ShardedLineWriter(shards_path,
+                           input_name=path_to_mlm_data.name,
+                           num_inputs=len(utterances),
+                           lines_per_shard=LINES_PER_SHARD)
+
+progress_bar = pyprind.ProgBar(len(utterances) - writer.num_completed, stream=1)  # counts utterances
+for chunk in annotator.annotate(utterances, is_completed=writer.is_completed):  # in the order of the utterances
+    chunk_lines = []
+    for utterance_lines in chunk['lines']:
+        for line in utterance_lines:
+
+            if INTERACTIVE:
+                words, tags = [s.split() for s in line.split(' ||| ')]
+                print('=====================================')
+                print(make_srl_string(words[1:], tags))
+                print(line)
+                key = input('\n[q] to quit. Any key to continue.\n')
+                if key != 'q':
+                    pass
+                else:
+                    raise SystemExit('Quit')
+
+            chunk_lines.append(line)
+
+    writer.write(chunk['start'], chunk['end'], chunk_lines,
+                 counts={'num_no_verb': chunk['num_no_verb'],
+                         'num_only_verb': chunk['num_only_verb']})
+    progress_bar.update(iterations=chunk['end'] - chunk['start'])
+
+print(f'Annotated {annotator.num_annotated:,} of {annotator.num_utterances:,} utterances '
+      f'({annotator.num_cache_hits:,} found in cache, {annotator.num_duplicates:,} duplicates). '
+      f'Hit rate={annotator.hit_rate:.3f}')
+print(f'Segmented {annotator.num_segmented:,} utterances with the model, '
+      f'skipped {annotator.num_segmentation_bypassed:,} trivial and '
+      f'{annotator.num_segmentation_memo_hits:,} previously segmented utterances. '
+      f'Bypass rate={annotator.segmentation_bypass_rate:.3f}')
+
+counts = writer.manifest['counts']
+print(f'Skipped {counts.get("num_no_verb", 0)} utterances due to absence of B-V tag')
+print(f'Skipped {counts.get("num_only_verb", 0)} utterances due to presence of only B-V tag')
+
+# merge shards, removing duplicate lines
+print(f'Writing lines to file...')
+srl_path = configs.Dirs.data / 'pre_processed' / f'{CORPUS_NAME}_srl.txt{COMPRESSION}'
+num_lines = writer.merge(srl_path)
+print(f'Collected {num_lines} lines')
@@ -1,52 +1,24 @@
-
 from childes_srl import configs
+from childes_srl.decontamination import DecontaminationIndex, decontaminate, print_overlap_stats
 
-HUMAN_NAME_1 = 'human-based-2008'
-HUMAN_NAME_2 = 'human-based-2008'
+HUMAN_NAMES = ['human-based-2008', 'human-based-2018']
 MODEL_NAME = 'childes-20191206'
-
-
-# load human-based annotations
-srl_path1 = configs.Dirs.data / 'pre_processed' / f'{HUMAN_NAME_1}_srl.txt'
-text1 = srl_path1.read_text()
-propositions_h1 = [line.split('|||')[0] for line in text1.split('\n')]
-
-# load human-based annotations
-srl_path2 = configs.Dirs.data / 'pre_processed' / f'{HUMAN_NAME_2}_srl.txt'
-text2 = srl_path2.read_text()
-propositions_h2 = [line.split('|||')[0] for line in text2.split('\n')]
-
-# load model-based annotations
-srl_path3 = configs.Dirs.data / 'pre_processed' / f'{MODEL_NAME}_srl.txt'
-text3 = srl_path3.read_text()
-lines_m = text3.split('\n')[:-1]
-propositions_m = [line.split('|||')[0] for line in lines_m]
-
-
-# make sets
-propositions_h = propositions_h1 + propositions_h2
-set_propositions_h = set(propositions_h)
-set_propositions_m = set(propositions_m)
-print(f'num human unique propositions: {len(set_propositions_h):>9,}/{len(propositions_h):>9,}')
-print(f'num model unique propositions: {len(set_propositions_m):>9,}/{len(propositions_m):>9,}')
-
-# exclude shared
-lines = []
-num_excluded = 0
-for line_m in set(lines_m):
-    prop_m = line_m.split('|||')[0]
-    if prop_m not in set_propositions_h:
-        lines.append(line_m)
-    else:
-        num_excluded += 1
-
-print(f'Excluded {num_excluded:>9,}/{len(lines_m):>9,}')
-
-# write non-shared to file
-print(f'Writing {len(lines)} lines to file...')
-srl_path = configs.Dirs.data / 'pre_processed' / f'{MODEL_NAME}_no-dev_srl.txt'
-with srl_path.open('w') as f:
-    for n, line in enumerate(lines):
-        f.write(line)
-        if n + 1 != len(lines):  # do not write '\n' at end of file
-            f.write('\n')
\ No newline at end of file
+NEAR_DUPLICATES = False  # also remove sentences which are similar to held-out sentences (e.g. one word changed)
+JACCARD_THRESHOLD = 0.5  # min estimated Jaccard similarity of word bi-grams (one word changed in 8 gives 0.56)
+COMPRESSION = ''  # extension of the model-based annotations, e.g. '.gz'. the output is compressed the same way
+
+
+# index of held-out propositions - re-built only if human-based annotations change
+source2path = {name: configs.Dirs.data / 'pre_processed' / f'{name}_srl.txt' for name in HUMAN_NAMES}
+index = DecontaminationIndex.from_files_cached(source2path,
+                                               configs.Dirs.cache / 'decontamination_index.npz',
+                                               near_duplicates=NEAR_DUPLICATES)
+
+# exclude shared - model-based annotations are streamed, and written to file as they are read
+srl_path_in = configs.Dirs.data / 'pre_processed' / f'{MODEL_NAME}_srl.txt{COMPRESSION}'
+srl_path_out = configs.Dirs.data / 'pre_processed' / f'{MODEL_NAME}_no-dev_srl.txt{COMPRESSION}'
+source2stats = decontaminate(index,
+                             srl_path_in,
+                             srl_path_out,
+                             threshold=JACCARD_THRESHOLD if NEAR_DUPLICATES else None)
+print_overlap_stats(source2stats)
@@ -0,0 +1,21 @@
+"""
+Check every line of the pre-processed SRL files, and report errors by type, with line numbers.
+"""
+from childes_srl import configs
+from childes_srl.validation import validate_file, make_known_tags, SRL_ROLES
+
+FILE_NAMES = ['human-based-2008_srl.txt', 'human-based-2018_srl.txt']
+NUM_WORKERS = 4
+EXTRA_ROLES = set()  # roles which are not predicted by the AllenNLP SRL tagger, but should not be reported
+MAX_LINE_NUMBERS = 20  # number of line numbers to print per type of error
+
+
+if __name__ == '__main__':  # worker processes import this module
+
+    known_tags = make_known_tags(SRL_ROLES | EXTRA_ROLES)
+    for file_name in FILE_NAMES:
+        srl_path = configs.Dirs.data / 'pre_processed' / file_name
+        print(f'Validating {srl_path}')
+        report = validate_file(srl_path, num_workers=NUM_WORKERS, known_tags=known_tags)
+        report.print_report(MAX_LINE_NUMBERS)
+        print()
@@ -0,0 +1,48 @@
+"""
+Conversion of SRL propositions to word-piece tensors (bert_recipes.eval_set), when words are split into word-pieces.
+"""
+import pytest
+
+from childes_srl.stubs import StubWordpieceTokenizer
+from bert_recipes.eval_set import SrlEvalSet
+
+VOCAB = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', 'the', 'dog', 'anno', '##tates', 'it', '.']
+
+# the predicate "annotates" is split into two word-pieces
+PROPOSITIONS = [
+    (['the', 'dog', 'annotates', 'it', '.'], 2, ['B-ARG0', 'I-ARG0', 'B-V', 'B-ARG1', 'O']),
+]
+
+
+@pytest.fixture
+def tokenizer(tmp_path):
+    vocab_path = tmp_path / 'vocab.txt'
+    vocab_path.write_text('\n'.join(VOCAB))
+    return StubWordpieceTokenizer(vocab_path)
+
+
+def make_srl_tag2id(roles):
+    """tags of word-pieces, as in bert_recipes/joint_training_example_script.py"""
+    return {tag: n for n, tag in enumerate(['O'] + [f'{bio}-{role}' for role in sorted(roles) for bio in 'BI'])}
+
+
+def test_predicate_split_into_wordpieces(tokenizer):
+    srl_tag2id = make_srl_tag2id({'ARG0', 'ARG1', 'V'})
+    id2srl_tag = {i: tag for tag, i in srl_tag2id.items()}
+    eval_set = SrlEvalSet.from_propositions(PROPOSITIONS, tokenizer, srl_tag2id, batch_size=8)
+
+    (batch, meta_data), = list(eval_set)
+    assert batch['input_ids'][0].tolist() == [tokenizer.vocab[wp] for wp in
+                                              ['[CLS]', 'the', 'dog', 'anno', '##tates', 'it', '.', '[SEP]']]
+    assert batch['token_type_ids'][0].tolist() == [0, 0, 0, 1, 1, 0, 0, 0]
+    assert [id2srl_tag[i] for i in batch['tags'][0].tolist()] == \
+           ['O', 'B-ARG0', 'I-ARG0', 'B-V', 'I-V', 'B-ARG1', 'O', 'O']
+    assert meta_data['start_offsets'] == [[1, 2, 3, 5, 6]]
+    assert meta_data['gold_tags'] == [PROPOSITIONS[0][2]]
+
+
+def test_unknown_tag(tokenizer):
+    # made from whole-word tags only, there is no I-V
+    srl_tag2id = {tag: n for n, tag in enumerate(sorted({tag for _, _, tags in PROPOSITIONS for tag in tags}))}
+    with pytest.raises(ValueError, match='I-V'):
+        SrlEvalSet.from_propositions(PROPOSITIONS, tokenizer, srl_tag2id, batch_size=8)
@@ -0,0 +1,109 @@
+"""
+Conversion of human-annotated TalkBank XML (childes_srl.human_annotation) on a small hand-checked file,
+ and, if the XML corpora are available, on the corpora of which the pre-processed data in the repository was made.
+
+Argument spans are looked up in the parse tree: the span of an argument with head at leaf h and num_up levels up
+ is ancestors[min(num_up, len(ancestors) - 1)] of h, which must be the subtree at leaf_treeposition(h)[:-num_up - 1]
+ of the nltk tree, as in the original conversion (the root, if num_up exceeds the depth of h).
+"""
+import xml.etree.ElementTree as ET
+from collections import Counter
+from pathlib import Path
+
+import pytest
+from nltk import Tree
+
+from childes_srl import configs
+from childes_srl.human_annotation import TALKBANK_NAMESPACE, convert_file, convert_files, read_parse_string
+
+XML_PATH = Path(__file__).parent / 'data' / 'human_annotation.xml'
+
+EXPECTED_LINES = [
+    # the second "the dog" is the argument, although the same words occur earlier in the sentence
+    '2 the dog sees the dog . ||| B-ARG0 I-ARG0 B-V B-ARG1 I-ARG1 O',
+    '1 you go . ||| B-ARG0 B-V O',
+    '0 put it in the box ||| B-V B-ARG1 B-ARG2 I-ARG2 I-ARG2',
+]
+
+EXPECTED_COUNTS = {
+    'num_good': 3,
+    'num_no_arguments': 1,  # "look !" has no argument
+    'num_no_predicate': 0,
+    'num_bad_head_loc': 0,
+    'num_bad_arg_loc': 1,  # "you go ." with num_up beyond the root: the argument span would include the verb
+    'num_prepositions': 1,
+    'num_no_props': 2,  # participants, and "hi ."
+    'num_child': 1,
+}
+
+
+def get_parse_strings():
+    root = ET.parse(str(XML_PATH)).getroot()
+    return [e.text for e in root.iter(f'{TALKBANK_NAMESPACE}parse')]
+
+
+def get_nltk_span(tree: Tree,
+                  head_loc: int,
+                  num_up: int,
+                  ):
+    """(start, end) of leaves of the subtree num_up levels above the parent of leaf head_loc"""
+    position = tree.leaf_treeposition(head_loc)[: -num_up - 1]
+    covered = [i for i in range(len(tree.leaves())) if tree.leaf_treeposition(i)[:len(position)] == position]
+    return covered[0], covered[-1] + 1
+
+
+def has_repeated_word(line: str) -> bool:
+    words = line.split(' ||| ')[0].split()[1:]
+    return len(set(words)) < len(words)
+
+
+def test_argument_spans_match_nltk():
+    for parse_string in get_parse_strings():
+        tree = Tree.fromstring(parse_string)
+        words, leaf_ancestors = read_parse_string(parse_string)
+        assert words == tree.leaves()
+        for head_loc, ancestors in enumerate(leaf_ancestors):
+            assert ancestors[-1] == (0, len(words))  # root
+            for num_up in range(len(ancestors) + 2):  # including levels beyond the root
+                span = ancestors[min(num_up, len(ancestors) - 1)]
+                assert span == get_nltk_span(tree, head_loc, num_up), (parse_string, head_loc, num_up)
+
+
+def test_convert_file():
+    lines, counts = convert_file(XML_PATH)
+    assert lines == EXPECTED_LINES
+    assert dict(counts) == EXPECTED_COUNTS
+
+
+def test_convert_files_cached(tmp_path):
+    xml_path = tmp_path / 'xml'
+    xml_path.mkdir()
+    (xml_path / XML_PATH.name).write_bytes(XML_PATH.read_bytes())
+    cache_dir = tmp_path / 'cache'
+    for _ in range(2):  # the second conversion uses the cache
+        lines, counts = convert_files(xml_path, cache_dir=cache_dir)
+        assert lines == EXPECTED_LINES
+        assert dict(counts) == EXPECTED_COUNTS
+    assert len(list(cache_dir.iterdir())) == 1
+
+
+@pytest.mark.parametrize('name', ['human-based-2008', 'human-based-2018'])
+def test_convert_files_reproduces_pre_processed_data(name):
+    """
+    lines may only differ for sentences which contain a repeated word:
+     argument spans used to be located by searching the sentence for the first occurrence of the argument's words,
+     which finds the wrong occurrence when a phrase repeats, whereas spans are now read directly from the parse tree.
+    """
+    xml_path = configs.Dirs.data / f'srl_{name}' / 'xml'
+    if not xml_path.exists():
+        pytest.skip(f'Did not find {xml_path}')
+
+    lines, _ = convert_files(xml_path, num_workers=4)
+    srl_path = configs.Dirs.data / 'pre_processed' / f'{name}_srl.txt'
+    expected_lines = [line for line in srl_path.read_text().split('\n') if line]
+
+    # compare as multi-sets, because order does not matter for training
+    missing = Counter(expected_lines) - Counter(lines)
+    extra = Counter(lines) - Counter(expected_lines)
+    unexplained = [line for line in list(missing) + list(extra) if not has_repeated_word(line)]
+    assert not unexplained, f'{len(unexplained):,} lines differ and do not contain a repeated word'
@@ -0,0 +1,65 @@
+"""
+Ordering, error handling, and shutdown of the multi-stage pipeline (childes_srl.pipeline).
+"""
+import threading
+import time
+
+import pytest
+
+from childes_srl.pipeline import Stage, run_pipeline, run_sequentially
+
+NUM_ITEMS = 200
+
+
+def add_one(x: int) -> int:
+    time.sleep(0.001 * (x % 3))  # items finish out of order
+    return x + 1
+
+
+def double(x: int) -> int:
+    return 2 * x
+
+
+def fail_at_10(x: int) -> int:
+    if x == 10:
+        raise ValueError(x)
+    return x
+
+
+def make_stages(*functions):
+    return [Stage(function.__name__, function, num_workers=3) for function in functions]
+
+
+@pytest.fixture
+def no_leftover_threads():
+    """fails a test which leaves threads started by the pipeline running"""
+    threads_before = set(threading.enumerate())
+    yield
+    leftover = [thread for thread in threading.enumerate() if thread not in threads_before]
+    assert not leftover
+
+
+def test_order(no_leftover_threads):
+    stages = make_stages(add_one, double)
+    results = list(run_pipeline(range(NUM_ITEMS), stages, queue_size=2, max_in_flight=8))
+    assert results == list(run_sequentially(range(NUM_ITEMS), stages))
+
+
+def test_stage_fails(no_leftover_threads):
+    results = []
+    with pytest.raises(RuntimeError) as exc_info:
+        for result in run_pipeline(range(NUM_ITEMS), make_stages(add_one, fail_at_10, double),
+                                   queue_size=2, max_in_flight=8):
+            results.append(result)
+    assert isinstance(exc_info.value.__cause__, ValueError)
+    # results before the failing item are yielded in order, if they arrive before the failure
+    assert len(results) <= 9
+    assert results == [2 * (x + 1) for x in range(len(results))]
+
+
+def test_consumer_stops_early(no_leftover_threads):
+    # the consumer stops while the feeder waits for a free slot, and workers wait for a free queue
+    results = run_pipeline(range(NUM_ITEMS), make_stages(add_one, double), queue_size=1, max_in_flight=4)
+    assert [next(results) for _ in range(3)] == [2, 4, 6]
+    time.sleep(0.1)  # until all threads are blocked
+    results.close()